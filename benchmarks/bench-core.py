@@ -0,0 +1,448 @@
+"""
+ImgLib core function benchmarks
+- Time the core image functions against synthetic images of several sizes and color modes, reporting the throughput
+(megapixels/s) and the peak memory of every case
+- Every case runs in a fresh worker process so the peak memory of one case does not leak into the next
+- Results can be written as JSON, and 2 result files compared to flag the regressions between them
+
+:: Usage
+- Run : python bench-core.py run [--sizes small,medium] [--modes RGB,RGBA,L,P] [--functions img_grayscale,...] [--repeat 5] [--output results.json]
+- Compare : python bench-core.py compare baseline.json results.json [--threshold 0.10] [--memory-threshold 0.20]
+"""
+import os
+import sys
+import gc
+import json
+import time
+import platform
+import argparse
+import tempfile
+import tracemalloc
+import multiprocessing
+from datetime import datetime
+import numpy as np
+import PIL
+from PIL import Image
+from imglib.core.images.io import open as import_file, load_image, save as output_file
+from imglib.core.images.pixels import get_image_pixels, get_black_pixels, get_colored_pixels, get_image_statistics
+from imglib.core.images.translation import img_grayscale, extract_populated_areas, convert_black_cells_to_transparent, color_transform, color_transform_batch, color_transform_image, crop_to_content
+from imglib.core.images.pipeline import Pipeline
+from imglib.core.images.keying import key_color
+
+# Synthetic image sizes (width, height)
+SIZES = {
+    "small" : (640, 480),
+    "medium" : (1920, 1080),
+    # A 4K video frame
+    "uhd" : (3840, 2160),
+    "large" : (6000, 4000),
+}
+
+# Synthetic image color modes
+MODES = ["RGB", "RGBA", "L", "P"]
+
+# Number of pixels transformed by the scalar color_transform() case
+SCALAR_PIXELS = 65536
+
+def make_image(width, height, mode="RGB", seed=0):
+    """
+    Make a reproducible synthetic image: color gradients with noise, a black border and black blocks
+
+    - The black areas give the black/colored pixel queries, the extraction and the transparency something to find
+    """
+    # Initialize Variables
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width]
+
+    # Color gradients with noise
+    pixel_array = np.empty((height, width, 3), dtype=np.uint8)
+    pixel_array[..., 0] = x * 255 // max(1, width - 1)
+    pixel_array[..., 1] = y * 255 // max(1, height - 1)
+    pixel_array[..., 2] = (x + y) % 256
+    pixel_array ^= rng.integers(0, 16, size=pixel_array.shape, dtype=np.uint8)
+
+    # Black border and black blocks
+    border_x, border_y = width // 16, height // 16
+    pixel_array[:border_y] = 0
+    pixel_array[height - border_y:] = 0
+    pixel_array[:, :border_x] = 0
+    pixel_array[:, width - border_x:] = 0
+    pixel_array[((y // 32) % 4 == 0) & ((x // 32) % 4 == 0)] = 0
+
+    # Convert to the color mode
+    input_image = Image.fromarray(pixel_array, "RGB")
+    match mode:
+        case "RGB":
+            pass
+        case "RGBA":
+            input_image.putalpha(Image.fromarray(((x + y) * 255 // max(1, width + height - 2)).astype(np.uint8), "L"))
+        case "L" | "P":
+            input_image = input_image.convert(mode)
+        case _:
+            raise ValueError("Invalid mode: {}".format(mode))
+
+    # Output/Return
+    return input_image
+
+"""
+Benchmark cases
+- Every case takes the synthetic image and a temporary directory, and returns [prepare, run, megapixels]
+- prepare() builds the arguments of a single run (untimed, i.e. a fresh copy for in-place functions); run(*args) is timed
+- megapixels is the number of megapixels processed by a single run
+"""
+def bench_open(input_image, tmp_dir):
+    img_fname = os.path.join(tmp_dir, "bench.png")
+    input_image.save(img_fname)
+    return [lambda: [img_fname], import_file, input_image.width * input_image.height / 1e6]
+
+def bench_load_image(input_image, tmp_dir):
+    img_fname = os.path.join(tmp_dir, "bench.png")
+    input_image.save(img_fname)
+    return [lambda: [import_file(img_fname)[0]], load_image, input_image.width * input_image.height / 1e6]
+
+def bench_save(input_image, tmp_dir):
+    out_fname = os.path.join(tmp_dir, "output")
+    return [lambda: [input_image, out_fname, "png"], output_file, input_image.width * input_image.height / 1e6]
+
+def bench_get_image_pixels(input_image, tmp_dir):
+    return [lambda: [input_image, input_image.load(), input_image.width, input_image.height], get_image_pixels, input_image.width * input_image.height / 1e6]
+
+def bench_get_black_pixels(input_image, tmp_dir):
+    pixel_array = get_image_pixels(input_image, input_image.load(), input_image.width, input_image.height)
+    return [lambda: [pixel_array], get_black_pixels, input_image.width * input_image.height / 1e6]
+
+def bench_get_colored_pixels(input_image, tmp_dir):
+    pixel_array = get_image_pixels(input_image, input_image.load(), input_image.width, input_image.height)
+    return [lambda: [pixel_array], get_colored_pixels, input_image.width * input_image.height / 1e6]
+
+def bench_get_colored_selection(input_image, tmp_dir):
+    pixel_array = get_image_pixels(input_image, input_image.load(), input_image.width, input_image.height)
+    return [lambda: [pixel_array], lambda pixel_array: get_colored_pixels(pixel_array, as_selection=True), input_image.width * input_image.height / 1e6]
+
+def bench_get_image_statistics(input_image, tmp_dir):
+    return [lambda: [input_image], get_image_statistics, input_image.width * input_image.height / 1e6]
+
+def bench_img_grayscale(input_image, tmp_dir):
+    def prepare():
+        image_copy = input_image.copy()
+        return [image_copy, image_copy.load(), image_copy.width, image_copy.height]
+    return [prepare, img_grayscale, input_image.width * input_image.height / 1e6]
+
+def bench_extract_populated_areas(input_image, tmp_dir):
+    pixel_array = get_image_pixels(input_image, input_image.load(), input_image.width, input_image.height)
+    def prepare():
+        image_copy = input_image.copy()
+        return [image_copy, image_copy.load(), pixel_array]
+    return [prepare, extract_populated_areas, input_image.width * input_image.height / 1e6]
+
+def bench_convert_black_cells_to_transparent(input_image, tmp_dir):
+    return [lambda: [input_image], convert_black_cells_to_transparent, input_image.width * input_image.height / 1e6]
+
+def bench_key_color(metric):
+    # A soft green screen key, with the lookup tables of the key built before the timed runs
+    def bench(input_image, tmp_dir):
+        run = lambda input_image: key_color(input_image, "lime", metric, 60, 20)
+        run(input_image.resize((1, 1)))
+        return [lambda: [input_image], run, input_image.width * input_image.height / 1e6]
+    return bench
+
+def bench_color_transform(input_image, tmp_dir):
+    # The scalar API is called once per pixel, so only a sample of the pixels is transformed
+    pixels = np.asarray(input_image.convert("RGB")).reshape(-1, 3)[:SCALAR_PIXELS].tolist()
+    def run(pixels):
+        for r, g, b in pixels:
+            color_transform(r, g, b, preset="sepia")
+    return [lambda: [pixels], run, len(pixels) / 1e6]
+
+def bench_color_transform_batch(input_image, tmp_dir):
+    pixel_array = np.asarray(input_image.convert("RGB"))
+    return [lambda: [pixel_array], lambda pixel_array: color_transform_batch(pixel_array, preset="sepia"), input_image.width * input_image.height / 1e6]
+
+def bench_color_transform_image(input_image, tmp_dir):
+    # Color matrices apply to RGB(A) images only
+    if input_image.mode not in ("RGB", "RGBA"):
+        input_image = input_image.convert("RGB")
+    return [lambda: [input_image], lambda input_image: color_transform_image(input_image, preset="sepia"), input_image.width * input_image.height / 1e6]
+
+def bench_pipeline_steps(input_image, tmp_dir):
+    # The multi-step job of the pipeline case, run one step (one full image copy) at a time
+    def run(input_image):
+        output_image = color_transform_image(input_image.convert("RGB"), preset="grayscale")
+        output_image = color_transform_image(output_image, preset="sepia", inplace=True)
+        return crop_to_content(convert_black_cells_to_transparent(output_image))
+    return [lambda: [input_image], run, input_image.width * input_image.height / 1e6]
+
+def bench_pipeline(input_image, tmp_dir):
+    pipeline = Pipeline(input_image).grayscale().color_transform(preset="sepia").threshold_to_transparent().crop_to_content()
+    return [lambda: [pipeline], lambda pipeline: pipeline.run(), input_image.width * input_image.height / 1e6]
+
+# Benchmark cases, by function name
+CASES = {
+    "io.open" : bench_open,
+    "io.load_image" : bench_load_image,
+    "io.save" : bench_save,
+    "pixels.get_image_pixels" : bench_get_image_pixels,
+    "pixels.get_black_pixels" : bench_get_black_pixels,
+    "pixels.get_colored_pixels" : bench_get_colored_pixels,
+    "pixels.get_colored_selection" : bench_get_colored_selection,
+    "pixels.get_image_statistics" : bench_get_image_statistics,
+    "translation.img_grayscale" : bench_img_grayscale,
+    "translation.extract_populated_areas" : bench_extract_populated_areas,
+    "translation.convert_black_cells_to_transparent" : bench_convert_black_cells_to_transparent,
+    "keying.key_color" : bench_key_color("channel"),
+    "keying.key_color_euclidean" : bench_key_color("euclidean"),
+    "keying.key_color_perceptual" : bench_key_color("perceptual"),
+    "translation.color_transform" : bench_color_transform,
+    "translation.color_transform_batch" : bench_color_transform_batch,
+    "translation.color_transform_image" : bench_color_transform_image,
+    "pipeline.steps" : bench_pipeline_steps,
+    "pipeline.Pipeline" : bench_pipeline,
+}
+
+def get_memory_status():
+    """
+    Get the [current, peak] resident memory of this process in bytes from /proc (Linux), or None if unavailable
+    """
+    try:
+        with open("/proc/self/status") as status_file:
+            status = dict(line.split(":", 1) for line in status_file if ":" in line)
+        return [int(status["VmRSS"].split()[0]) * 1024, int(status["VmHWM"].split()[0]) * 1024]
+    except (OSError, KeyError, ValueError):
+        return None
+
+def reset_peak_memory():
+    """
+    Reset the peak resident memory of this process (Linux >= 4.0), returning True if it was reset
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as clear_refs:
+            clear_refs.write("5")
+        return True
+    except OSError:
+        return False
+
+def measure_peak_memory(prepare, run):
+    """
+    Run the case once and get [peak_bytes, method]: the growth of the resident memory over the run, or the peak of the
+    Python/NumPy allocations traced by tracemalloc if the resident memory peak cannot be reset (it misses Pillow's buffers)
+    """
+    args = prepare()
+    gc.collect()
+
+    # Resident memory peak
+    if reset_peak_memory():
+        rss_before = get_memory_status()[0]
+        run(*args)
+        peak_bytes = get_memory_status()[1] - rss_before
+        return [max(0, peak_bytes), "rss"]
+
+    # Traced allocations peak
+    tracemalloc.start()
+    run(*args)
+    peak_bytes = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return [peak_bytes, "tracemalloc"]
+
+def run_case(function_name, size_name, mode, repeat=5):
+    """
+    Benchmark a single function against a single synthetic image (runs in a fresh worker process)
+    """
+    # Initialize Variables
+    width, height = SIZES[size_name]
+    result = {"function" : function_name, "size" : size_name, "mode" : mode, "width" : width, "height" : height}
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Prepare the case
+            input_image = make_image(width, height, mode)
+            prepare, run, megapixels = CASES[function_name](input_image, tmp_dir)
+
+            # Measure the peak memory (also warms up caches and lazy imports for the timed runs)
+            peak_bytes, memory_method = measure_peak_memory(prepare, run)
+
+            # Time the runs
+            times = []
+            for i in range(repeat):
+                args = prepare()
+                start = time.perf_counter()
+                run(*args)
+                times.append(time.perf_counter() - start)
+                del args
+
+        # Summarize
+        times.sort()
+        median_s = times[len(times) // 2]
+        result.update({
+            "megapixels" : megapixels,
+            "repeat" : repeat,
+            "times" : times,
+            "min_s" : times[0],
+            "median_s" : median_s,
+            "mpps" : megapixels / median_s if median_s > 0 else float("inf"),
+            "peak_bytes" : peak_bytes,
+            "memory_method" : memory_method,
+        })
+    except Exception as ex:
+        result["error"] = "{}: {}".format(type(ex).__name__, ex)
+
+    # Output/Return
+    return result
+
+def get_environment():
+    """
+    Get the environment the benchmarks ran in
+    """
+    return {
+        "timestamp" : datetime.now().isoformat(timespec="seconds"),
+        "python" : platform.python_version(),
+        "pillow" : PIL.__version__,
+        "numpy" : np.__version__,
+        "platform" : platform.platform(),
+        "machine" : platform.machine(),
+        "cpu_count" : os.cpu_count(),
+    }
+
+def format_result(result):
+    """
+    Format a benchmark result as a report line
+    """
+    case = "{:<48} {:<7} {:<5}".format(result["function"], result["size"], result["mode"])
+    if "error" in result:
+        return "[X] {} {}".format(case, result["error"])
+    return "[+] {} {:>10.2f} MP/s {:>10.3f} ms {:>9.1f} MB".format(case, result["mpps"], result["median_s"] * 1000, result["peak_bytes"] / 2**20)
+
+def run_benchmarks(functions, sizes, modes, repeat=5):
+    """
+    Run every case (function x size x mode), each in a fresh worker process, yielding the results as they complete
+    """
+    # Fork where available so the workers start without re-importing the libraries
+    start_method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+    context = multiprocessing.get_context(start_method)
+
+    with context.Pool(1, maxtasksperchild=1) as pool:
+        for function_name in functions:
+            for size_name in sizes:
+                for mode in modes:
+                    yield pool.apply(run_case, (function_name, size_name, mode, repeat))
+
+def compare_results(baseline, results, threshold=0.10, memory_threshold=0.20, memory_floor=4 * 2**20):
+    """
+    Compare 2 benchmark runs, returning [report_lines, regressions]
+
+    :: Params
+    - threshold : Relative drop of the throughput flagged as a regression (0.10 = 10% slower)
+    - memory_threshold : Relative growth of the peak memory flagged as a regression
+    - memory_floor : Peak memory growth (in bytes) below which a growth is never flagged (measurement noise)
+    """
+    # Initialize Variables
+    lines = []
+    regressions = 0
+    baseline_cases = {(result["function"], result["size"], result["mode"]) : result for result in baseline["results"]}
+
+    for result in results["results"]:
+        key = (result["function"], result["size"], result["mode"])
+        case = "{:<48} {:<7} {:<5}".format(*key)
+        base = baseline_cases.get(key)
+
+        # Check if the case can be compared
+        if base == None or "error" in base or "error" in result:
+            lines.append("[-] {} {}".format(case, "not in baseline" if base == None else base.get("error", result.get("error"))))
+            continue
+
+        # Compare the throughput and peak memory
+        speedup = result["mpps"] / base["mpps"]
+        memory_delta = result["peak_bytes"] - base["peak_bytes"]
+        flags = []
+        if speedup < 1 - threshold:
+            flags.append("slower")
+        if memory_delta > memory_floor and memory_delta > base["peak_bytes"] * memory_threshold:
+            flags.append("more memory")
+
+        if len(flags) > 0:
+            regressions += 1
+        lines.append("{} {} {:>6.2f}x {:>+9.1f} MB {}".format("[X]" if len(flags) > 0 else "[+]", case, speedup, memory_delta / 2**20, ", ".join(flags)).rstrip())
+
+    # Output/Return
+    return [lines, regressions]
+
+def get_parser():
+    """
+    Build the benchmark argument parser
+    """
+    parser = argparse.ArgumentParser(prog="bench-core", description="Benchmark the ImgLib core functions")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = subparsers.add_parser("run", help="Run the benchmarks")
+    run_parser.add_argument("--functions", default=",".join(CASES), help="Comma-separated functions (Default: all); the module prefix may be omitted")
+    run_parser.add_argument("--sizes", default="small,medium", help="Comma-separated sizes: {} (Default: small,medium)".format(", ".join("{}={}x{}".format(name, *size) for name, size in SIZES.items())))
+    run_parser.add_argument("--modes", default=",".join(MODES), help="Comma-separated color modes (Default: {})".format(",".join(MODES)))
+    run_parser.add_argument("--repeat", type=int, default=5, help="Number of timed runs per case; the median is reported (Default: 5)")
+    run_parser.add_argument("-o", "--output", default=None, help="Write the results to this JSON file")
+
+    compare_parser = subparsers.add_parser("compare", help="Compare 2 benchmark result files and flag the regressions")
+    compare_parser.add_argument("baseline", help="Baseline results JSON file")
+    compare_parser.add_argument("results", help="New results JSON file")
+    compare_parser.add_argument("--threshold", type=float, default=0.10, help="Throughput drop flagged as a regression (Default: 0.10)")
+    compare_parser.add_argument("--memory-threshold", type=float, default=0.20, help="Peak memory growth flagged as a regression (Default: 0.20)")
+    return parser
+
+def get_functions(names):
+    """
+    Get the benchmark case names from the comma-separated function names (with or without the module prefix)
+    """
+    functions = []
+    for name in names.split(","):
+        matches = [case for case in CASES if case == name or case.split(".", 1)[1] == name]
+        if len(matches) == 0:
+            raise ValueError("Invalid function: {}".format(name))
+        functions += matches
+    return functions
+
+def main():
+    # Get CLI arguments
+    args = get_parser().parse_args(sys.argv[1:])
+
+    match args.command:
+        case "run":
+            # Check the cases
+            try:
+                functions = get_functions(args.functions)
+                sizes = args.sizes.split(",")
+                modes = args.modes.split(",")
+                for size_name in sizes:
+                    if size_name not in SIZES:
+                        raise ValueError("Invalid size: {}".format(size_name))
+                for mode in modes:
+                    if mode not in MODES:
+                        raise ValueError("Invalid mode: {}".format(mode))
+            except ValueError as ex:
+                print(ex)
+                return 1
+
+            # Run the benchmarks
+            results = []
+            for result in run_benchmarks(functions, sizes, modes, args.repeat):
+                print(format_result(result), flush=True)
+                results.append(result)
+
+            # Write the results
+            if args.output != None:
+                with open(args.output, "w") as output:
+                    json.dump({"environment" : get_environment(), "results" : results}, output, indent=4)
+                print("Results written to '{}'".format(args.output))
+            return 0
+        case "compare":
+            # Read the results
+            with open(args.baseline) as baseline_file, open(args.results) as results_file:
+                baseline = json.load(baseline_file)
+                results = json.load(results_file)
+
+            # Compare the results
+            lines, regressions = compare_results(baseline, results, args.threshold, args.memory_threshold)
+            for line in lines:
+                print(line)
+            print("{} regression(s) found".format(regressions))
+            return 0 if regressions == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,246 @@
+"""
+CLI actions
+- Run a single CLI action against a single image file
+- The image modules (and Pillow/NumPy) are imported by the actions needing them, so loading this module (i.e. for
+'pyimglib-cli --help') and the header-only 'metadata' action stay fast
+"""
+import os
+import sys
+
+# Action names, in the order of their action IDs
+ACTIONS = ["metadata", "image-pixels", "check-black-cells", "check-colored-cells", "grayscale", "extract-colored", "transparency", "count-cells", "crop-content", "pipeline", "statistics"]
+
+# Steps of the 'pipeline' action (besides the color presets, see 'translation.COLOR_PRESETS')
+PIPELINE_STEPS = ["grayscale", "transparency", "crop-content"]
+
+# Actions whose results can be stored in a result cache (analysis actions that write no output files)
+CACHED_ACTIONS = ["metadata", "check-black-cells", "check-colored-cells", "count-cells", "statistics"]
+
+# Result caches opened by this process, by database file
+RESULT_CACHES = {}
+
+# Names of the save profiles and color presets for the CLI options, without importing 'io' and 'translation' (kept in step
+# with 'io.SAVE_PROFILES' and 'translation.COLOR_PRESETS', see 'tests/test-startup.py')
+SAVE_PROFILE_NAMES = ["fast", "balanced", "smallest"]
+COLOR_PRESET_NAMES = ["grayscale", "sepia", "invert", "swap-rb", "swap-rg", "swap-gb"]
+
+def get_action_name(action):
+    """
+    Get the action name from an action name or action ID (i.e. '4' or 4 => 'grayscale')
+    """
+    # Check if an action ID is provided
+    if str(action).isdigit():
+        action_id = int(action)
+        if action_id >= len(ACTIONS):
+            raise ValueError("Invalid action ID: {}".format(action))
+        return ACTIONS[action_id]
+
+    # Check if the action name is valid
+    if action not in ACTIONS:
+        raise ValueError("Invalid action: {}".format(action))
+
+    return action
+
+def get_output_fname(img_fname, out_name, output_dir=None):
+    """
+    Get the output file name (without extension) of an action
+
+    - Without an output directory, the legacy output name is used (i.e. 'grayscale') in the working directory
+    - With an output directory, the output is named after the input file (i.e. '<output_dir>/<name>-grayscale')
+    """
+    if output_dir is None:
+        return out_name
+
+    # Name the output after the input file
+    stem = os.path.splitext(os.path.basename(img_fname))[0]
+    return os.path.join(output_dir, "{}-{}".format(stem, out_name))
+
+def get_pipeline(img_fname, steps):
+    """
+    Build the pipeline running the comma-separated steps (i.e. 'grayscale,transparency,crop-content') on the image file
+
+    - Steps are 'PIPELINE_STEPS' and the color presets (i.e. 'sepia', 'invert')
+    """
+    from imglib.core.images.pipeline import Pipeline
+    from imglib.core.images.translation import COLOR_PRESETS
+
+    # Initialize Variables
+    pipeline = Pipeline.open(img_fname)
+
+    for step in steps.split(","):
+        match step.strip():
+            case "grayscale":
+                pipeline = pipeline.grayscale()
+            case "transparency":
+                pipeline = pipeline.threshold_to_transparent()
+            case "crop-content":
+                pipeline = pipeline.crop_to_content()
+            case preset:
+                if preset not in COLOR_PRESETS:
+                    raise ValueError("Invalid pipeline step: {}".format(preset))
+                pipeline = pipeline.color_transform(preset=preset)
+
+    # Output/Return
+    return pipeline
+
+def format_statistics(statistics):
+    """
+    Format the image statistics (see 'pixels.get_image_statistics') as a single printable line
+    """
+    # Initialize Variables
+    channels = ", ".join("{}: {}-{} (Mean: {:.2f}, Std: {:.2f})".format(band, channel["min"], channel["max"], channel["mean"], channel["stddev"]) for band, channel in statistics["channels"].items())
+    dominant_colors = ", ".join("{} {:.1%}".format(tuple(color), ratio) for color, ratio in statistics["dominant_colors"])
+
+    # Output/Return
+    return "Mode: {}, Width: {}, Height: {}, Black Ratio: {:.4f}, Alpha Coverage: {:.4f}, Channels: [{}], Dominant Colors: [{}]".format(statistics["mode"], statistics["width"], statistics["height"], statistics["black_ratio"], statistics["alpha_coverage"], channels, dominant_colors)
+
+def get_result_cache(cache_fname, cache_key="stat"):
+    """
+    Get the result cache stored in the database file, opening it once per process
+    """
+    from imglib.core.images.cache import ResultCache
+
+    if (cache_fname, cache_key) not in RESULT_CACHES:
+        RESULT_CACHES[(cache_fname, cache_key)] = ResultCache(cache_fname, key=cache_key)
+    return RESULT_CACHES[(cache_fname, cache_key)]
+
+def run_action(img_fname, action, output_dir=None, cache_fname=None, cache_key="stat", save_profile=None, steps=None):
+    """
+    Run the specified action against the specified image file
+
+    - Returns [result, token, err_msg] where result is the action's printable output (or the output file written)
+    - With a cache database file, the results of the analysis actions are looked up and stored in the result cache, and the
+    image is not opened at all on a hit ('cache_key' is how files are identified, see 'cache.ResultCache')
+    - 'save_profile' is the save profile of the output images (see 'io.SAVE_PROFILES'; Pillow's defaults if not provided)
+    - 'steps' are the comma-separated steps of the 'pipeline' action (see 'get_pipeline')
+    """
+    # Initialize Variables
+    result = None
+    token = False
+    err_msg = ""
+
+    try:
+        # Obtain the action name
+        action_name = get_action_name(action)
+
+        # Look up the result in the result cache
+        if cache_fname != None and action_name in CACHED_ACTIONS:
+            cache = get_result_cache(cache_fname, cache_key)
+            found, result = cache.get(img_fname, action_name)
+            if found:
+                return [result, True, err_msg]
+
+            # Run the action and store its result
+            result, token, err_msg = run_action(img_fname, action_name, output_dir)
+            if token:
+                cache.put(img_fname, action_name, result)
+            return [result, token, err_msg]
+
+        # Read the metadata from the file headers only, without decoding the image
+        if action_name == "metadata":
+            from imglib.core.images.information import get_image_metadata
+            metadata = get_image_metadata(img_fname)
+            result = "Width: {width}, Height: {height}, Format: {format}, Mode: {mode}, Bit Depth: {bit_depth}, Frames: {n_frames}, Orientation: {orientation}, ICC Profile: {icc_profile}".format(**metadata)
+            return [result, True, err_msg]
+
+        # Run the steps as a single pipeline (fused into as few passes over the image as possible)
+        if action_name == "pipeline":
+            if not steps:
+                return [result, False, "No pipeline steps provided"]
+            out_fname = get_output_fname(img_fname, "pipeline", output_dir)
+            token, err_msg = get_pipeline(img_fname, steps).save(out_fname, format="png", profile=save_profile)
+            result = "{}.png".format(out_fname)
+            return [result, token, err_msg]
+
+        # Import the modules of the image actions
+        import numpy as np
+        from imglib.core.images.io import open as import_file, load_image, save as output_file
+        from imglib.core.images.pixels import get_image_pixels, get_black_pixels, get_colored_pixels, get_mask_bbox, query_pixels, get_image_statistics
+        from imglib.core.images.translation import img_grayscale, extract_populated_areas, convert_black_cells_to_transparent, crop_to_content
+        from imglib.core.images.information import get_image_size
+
+        # Import an image from directory:
+        input_image, token, err_msg = import_file(img_fname)
+        if not token:
+            return [result, token, err_msg]
+
+        # Extracting pixel map:
+        pixel_map, token, err_msg = load_image(input_image)
+        if not token:
+            return [result, token, err_msg]
+
+        # Extracting the width and height
+        # of the image:
+        width, height = get_image_size(input_image)
+
+        match action_name:
+            case "image-pixels":
+                # Output the legacy mapping, printed in full (pixel arrays print summarized)
+                result = get_image_pixels(input_image, pixel_map, width, height, as_dict=True)
+            case "check-black-cells":
+                # Check for black pixels in the entire image
+                ## Get all pixel coordinates and their RGB values
+                img_map = get_image_pixels(input_image, pixel_map, width, height)
+                ## Get all coordinates with black (0,0,0) pixels, as the legacy mapping
+                result = get_black_pixels(img_map, as_dict=True)
+            case "check-colored-cells":
+                # Check for non-black pixels in the entire image
+                ## Get all pixel coordinates and their RGB values
+                img_map = get_image_pixels(input_image, pixel_map, width, height)
+                ## Get all coordinates with colors (R,G,B) pixels, as the legacy mapping
+                result = get_colored_pixels(img_map, as_dict=True)
+            case "grayscale":
+                # Grayscale the image
+                img_grayscale(input_image, pixel_map, width, height)
+
+                # Saving the final output as "grayscale.png"
+                out_fname = get_output_fname(img_fname, "grayscale", output_dir)
+                token, err_msg = output_file(input_image, out_fname, format="png", profile=save_profile)
+                result = "{}.png".format(out_fname)
+            case "extract-colored":
+                # Extract only the colored/populated areas
+                ## Get all pixel coordinates and their RGB values
+                img_map = get_image_pixels(input_image, pixel_map, width, height)
+                ## Extract colored/populated areas
+                extract_populated_areas(input_image, pixel_map, img_map)
+                ## Saving the image as color extracted
+                out_fname = get_output_fname(img_fname, "color-extracted", output_dir)
+                token, err_msg = output_file(input_image, out_fname, format="png", profile=save_profile)
+                result = "{}.png".format(out_fname)
+            case "transparency":
+                # Add a transparency mask layer to the black areas of the image
+                rgba = convert_black_cells_to_transparent(input_image)
+
+                # Saving the final output as the output file 'transparency.png'
+                out_fname = get_output_fname(img_fname, "transparency", output_dir)
+                token, err_msg = output_file(rgba, out_fname, format="png", profile=save_profile)
+                result = "{}.png".format(out_fname)
+            case "count-cells":
+                # Count the black and non-black pixels from a single black mask of the image
+                ## Get the mask of all black (0,0,0) pixels
+                img_array = get_image_pixels(input_image, pixel_map, width, height)
+                black_mask = query_pixels(img_array, "black", output="mask")
+                ## Count the black pixels, every other pixel is colored
+                black_count = int(np.count_nonzero(black_mask))
+                colored_count = black_mask.size - black_count
+                result = "Black Cells: {}, Colored Cells: {}, Colored Bounding Box: {}".format(black_count, colored_count, get_mask_bbox(~black_mask))
+            case "statistics":
+                # Summarize the colors of the image from its channel histograms
+                result = format_statistics(get_image_statistics(input_image))
+            case "crop-content":
+                # Crop the black borders off the image
+                cropped = crop_to_content(input_image)
+                if cropped == None:
+                    return [result, False, "Image '{}' has no populated areas".format(img_fname)]
+
+                # Saving the cropped image as 'cropped.png'
+                out_fname = get_output_fname(img_fname, "cropped", output_dir)
+                token, err_msg = output_file(cropped, out_fname, format="png", profile=save_profile)
+                result = "{}.png".format(out_fname)
+    except Exception as ex:
+        # Set error message
+        token = False
+        err_msg = ex
+
+    # Output/Return
+    return [result, token, err_msg]
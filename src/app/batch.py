@@ -0,0 +1,151 @@
+"""
+Batch processing
+- Run a CLI action across many image files (directories, globs and manifest files) with a process pool
+"""
+import os
+import sys
+import glob
+from functools import partial
+from multiprocessing import Pool
+from PIL import Image
+from app.actions import run_action
+from imglib.core.images import profiling
+
+def is_image_file(fname):
+    """
+    Check if the file name has the extension of an image format known to Pillow
+    """
+    return os.path.splitext(fname)[1].lower() in Image.registered_extensions()
+
+def collect_files(targets, recursive=False):
+    """
+    Collect the image files named by the targets, in order and without duplicates
+
+    :: Params
+    - targets : List of file names, directories, glob patterns (i.e. 'scans/*.png') and manifest files (prefixed with '@',
+    listing 1 target per line; blank lines and lines starting with '#' are ignored)
+    - recursive : Also collect the image files in the subdirectories of directories
+    """
+    # Initialize Variables
+    files = []
+    seen = set()
+
+    for target in targets:
+        # Expand the target into file names
+        if target.startswith("@"):
+            # Manifest file
+            with open(target[1:]) as manifest:
+                lines = [line.strip() for line in manifest]
+            target_files = collect_files([line for line in lines if line != "" and not line.startswith("#")], recursive)
+        elif os.path.isdir(target):
+            # Directory
+            if recursive:
+                target_files = [os.path.join(root, fname) for root, dirs, fnames in os.walk(target) for fname in sorted(fnames)]
+            else:
+                target_files = [os.path.join(target, fname) for fname in sorted(os.listdir(target))]
+            target_files = [fname for fname in target_files if os.path.isfile(fname) and is_image_file(fname)]
+        elif glob.has_magic(target):
+            # Glob pattern
+            target_files = sorted(glob.glob(target, recursive=recursive))
+        else:
+            # File name
+            target_files = [target]
+
+        # Add the files not collected yet
+        for fname in target_files:
+            if fname not in seen:
+                seen.add(fname)
+                files.append(fname)
+
+    # Output/Return
+    return files
+
+def read_progress(progress_fname):
+    """
+    Read the set of files already processed successfully from the progress file (if it exists)
+    """
+    if progress_fname is None or not os.path.isfile(progress_fname):
+        return set()
+
+    with open(progress_fname) as progress_file:
+        return set(line.rstrip("\n") for line in progress_file if line.strip() != "")
+
+def run_batch_file(img_fname, action, output_dir=None, cache_fname=None, cache_key="stat", save_profile=None, steps=None):
+    """
+    Run the action against a single file of the batch, returning [img_fname, result, token, err_msg]
+    """
+    return [img_fname] + run_action(img_fname, action, output_dir, cache_fname, cache_key, save_profile, steps)
+
+def run_profiled_batch_file(img_fname, action, profile_memory=False, **options):
+    """
+    Run the action against a single file of the batch in a worker process with profiling enabled, returning
+    [img_fname, result, token, err_msg, summary] where summary holds the profiling statistics of the file
+    """
+    profiling.reset()
+    profiling.enable(profile_memory)
+    try:
+        return run_batch_file(img_fname, action, **options) + [profiling.get_summary()]
+    finally:
+        profiling.disable()
+
+def run_batch(files, action, workers=1, ordered=True, output_dir=None, progress_fname=None, chunksize=0, cache_fname=None, cache_key="stat", save_profile=None, steps=None, profile=False, profile_memory=False):
+    """
+    Run the action across the files, yielding [img_fname, result, token, err_msg] for every file as it completes
+
+    :: Params
+    - workers : The number of worker processes (1 = run in this process)
+    - ordered : Yield the results in the order of the files; set to False to yield them as soon as they complete
+    - output_dir : The directory to write the output images into (named '<name>-<action>.png')
+    - progress_fname : Progress file recording the files processed successfully; files it lists are skipped, so an
+    interrupted batch resumes where it stopped when run again with the same progress file
+    - chunksize : The number of files handed to a worker at once (chosen from the number of files and workers if 0)
+    - cache_fname : Result cache database file shared by the workers (see 'actions.run_action')
+    - cache_key : How the result cache identifies files (stat/hash)
+    - save_profile : The save profile of the output images (see 'io.SAVE_PROFILES')
+    - steps : The comma-separated steps of the 'pipeline' action (see 'actions.get_pipeline')
+    - profile : Profile the worker processes too, merging their statistics into the profiling statistics of this process
+    (see 'profiling'; enable profiling in this process to profile batches run in this process)
+    - profile_memory : Also record the peak allocations in the worker processes
+    """
+    # Skip the files already processed
+    done = read_progress(progress_fname)
+    files = [fname for fname in files if fname not in done]
+
+    # Create the output directory
+    if output_dir is not None:
+        os.makedirs(output_dir, exist_ok=True)
+
+    # Initialize Variables
+    run_file = partial(run_batch_file, action=action, output_dir=output_dir, cache_fname=cache_fname, cache_key=cache_key, save_profile=save_profile, steps=steps)
+    if profile and workers > 1:
+        run_file = partial(run_profiled_batch_file, profile_memory=profile_memory, **run_file.keywords)
+    progress_file = open(progress_fname, "a") if progress_fname is not None else None
+    pool = None
+
+    try:
+        # Obtain the results iterator
+        if workers > 1:
+            # Hand the files out in chunks to keep the per-file overhead low
+            if chunksize <= 0:
+                chunksize = max(1, min(64, len(files) // (workers * 8)))
+            pool = Pool(workers)
+            results = pool.imap(run_file, files, chunksize) if ordered else pool.imap_unordered(run_file, files, chunksize)
+        else:
+            results = map(run_file, files)
+
+        for img_fname, result, token, err_msg, *summary in results:
+            # Merge the profiling statistics of the worker processes
+            if len(summary) > 0:
+                profiling.merge_summary(summary[0])
+
+            # Record the files processed successfully
+            if token and progress_file is not None:
+                progress_file.write("{}\n".format(img_fname))
+                progress_file.flush()
+
+            yield [img_fname, result, token, err_msg]
+    finally:
+        if pool is not None:
+            pool.terminate()
+        if progress_file is not None:
+            progress_file.close()
@@ -0,0 +1,184 @@
+"""
+Daemon client
+- Submit actions to a running 'pyimglib-cli --serve' daemon over its Unix socket (see 'daemon.py')
+- Imports the standard library only (no Pillow/NumPy), so a job costs the interpreter startup and a socket round trip
+"""
+import os
+import sys
+import json
+import socket
+from collections import deque
+
+# Number of requests sent ahead of their responses; bounded so neither side blocks writing into a full socket buffer
+# while the other is blocked writing too
+PIPELINE_WINDOW = 64
+
+# Socket the daemon listens on when none is specified
+DEFAULT_SOCKET = os.environ.get("PYIMGLIB_SOCKET", os.path.join(os.environ.get("TMPDIR", "/tmp"), "pyimglib-{}.sock".format(os.getuid() if hasattr(os, "getuid") else "user")))
+
+class DaemonClient:
+    """
+    A connection to a running daemon, submitting requests one JSON line at a time
+
+    :: Params
+    - socket_path : The Unix socket the daemon listens on
+
+    :: Notes
+    - Keep the client open to submit many requests over the same connection; requests are answered in order
+    - Usable as a context manager, closing the connection on exit
+    """
+    def __init__(self, socket_path=DEFAULT_SOCKET):
+        # Initialize Variables
+        self.socket_path = socket_path
+        self.connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.connection.connect(socket_path)
+        self.reader = self.connection.makefile("rb")
+        self.request_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Close the connection to the daemon
+        """
+        self.reader.close()
+        self.connection.close()
+
+    def send(self, request):
+        """
+        Send a request (dictionary) to the daemon without waiting for its response, returning the request ID
+        """
+        self.request_id += 1
+        request = dict(request, id=self.request_id)
+        self.connection.sendall(json.dumps(request).encode() + b"\n")
+        return self.request_id
+
+    def receive(self):
+        """
+        Receive the next response (dictionary) of the daemon
+
+        - Raises ConnectionError if the daemon closed the connection
+        """
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionError("Daemon closed the connection")
+        return json.loads(line)
+
+    def submit(self, target, action, **options):
+        """
+        Run the action against the image file on the daemon, returning [result, token, err_msg] like 'actions.run_action'
+
+        - options : The options of 'actions.run_action' (output_dir, cache_fname, cache_key, save_profile, steps)
+        - Relative paths are relative to the working directory of the daemon
+        """
+        self.send(dict(options, target=target, action=action))
+        response = self.receive()
+        return [response["result"], response["token"], response["err_msg"]]
+
+    def command(self, command):
+        """
+        Send a daemon command ('ping', 'stats' or 'shutdown'), returning its result
+        """
+        self.send({"command" : command})
+        return self.receive()["result"]
+
+def get_request_options(argv):
+    """
+    Split the client arguments into [positional arguments, request options, client options]
+    """
+    # Initialize Variables
+    positional = []
+    options = {}
+    client_options = {"socket" : DEFAULT_SOCKET, "command" : None}
+    option_names = {"-o" : "output_dir", "--output-dir" : "output_dir", "--cache" : "cache_fname", "--cache-key" : "cache_key", "--save-profile" : "save_profile", "--steps" : "steps"}
+
+    # Parse the arguments by hand (argparse costs more to import than the whole request)
+    arguments = iter(argv)
+    for argument in arguments:
+        name, separator, value = argument.partition("=")
+        if name in option_names or name == "--socket":
+            value = value if separator else next(arguments, None)
+            if value == None:
+                raise ValueError("Missing value of option: {}".format(name))
+            if name == "--socket":
+                client_options["socket"] = value
+            else:
+                options[option_names[name]] = value
+        elif argument in ("--ping", "--stats", "--shutdown"):
+            client_options["command"] = argument[2:]
+        elif argument.startswith("-") and argument != "-":
+            raise ValueError("Invalid option: {}".format(argument))
+        else:
+            positional.append(argument)
+
+    # Output/Return
+    return [positional, options, client_options]
+
+def main():
+    """
+    Submit 'pyimglib-client [options] <file> <action> [files...]' to the daemon, printing the results like 'pyimglib-cli'
+
+    - Options : '--socket', '-o/--output-dir', '--cache', '--cache-key', '--save-profile', '--steps', and the daemon
+    commands '--ping', '--stats' and '--shutdown'
+    - Up to 'PIPELINE_WINDOW' requests are sent ahead of their responses, so they are pipelined over 1 connection
+    - File names and the output directory are sent as absolute paths, since the daemon runs in its own working directory
+    """
+    # Get CLI arguments
+    try:
+        positional, options, client_options = get_request_options(sys.argv[1:])
+        if client_options["command"] == None and len(positional) < 2:
+            raise ValueError("Usage: pyimglib-client [options] <file> <action> [files...]")
+    except ValueError as ex:
+        print(ex)
+        return 2
+
+    try:
+        with DaemonClient(client_options["socket"]) as client:
+            # Run a daemon command
+            if client_options["command"] != None:
+                print(json.dumps(client.command(client_options["command"])))
+                return 0
+
+            # Initialize Variables
+            files = [positional[0]] + positional[2:]
+            action = positional[1]
+            if "output_dir" in options:
+                options["output_dir"] = os.path.abspath(options["output_dir"])
+            pending = deque()
+            failures = 0
+
+            def print_response():
+                # Print the response of the oldest pending request
+                img_fname = pending.popleft()
+                response = client.receive()
+                if not response["token"]:
+                    print("[X] Error encountered while processing image '{}' : {}".format(img_fname, response["err_msg"]))
+                    return 1
+                if len(files) == 1:
+                    print(response["result"])
+                else:
+                    print("[+] {} : {}".format(img_fname, response["result"]))
+                return 0
+
+            # Send the requests of every file, reading a response for every request sent once the window is full
+            for img_fname in files:
+                client.send(dict(options, target=os.path.abspath(img_fname), action=action))
+                pending.append(img_fname)
+                if len(pending) >= PIPELINE_WINDOW:
+                    failures += print_response()
+
+            # Print the responses left, in order
+            while len(pending) > 0:
+                failures += print_response()
+    except OSError as ex:
+        print("[X] Error encountered while connecting to the daemon at '{}' : {}".format(client_options["socket"], ex))
+        return 1
+
+    return 0 if failures == 0 else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
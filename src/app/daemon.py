@@ -0,0 +1,218 @@
+"""
+Worker daemon
+- Serve CLI actions to many requests from a single long-lived process, over stdin/stdout or a Unix socket, so the
+interpreter startup, the Pillow/NumPy imports and the caches are paid for once instead of once per image
+- Requests and responses are JSON lines (see 'handle_request'); 'client.py' is the matching thin client
+"""
+import os
+import sys
+import json
+import time
+import socket
+import threading
+import socketserver
+from contextlib import redirect_stdout
+import numpy as np
+from PIL import Image
+from app.actions import run_action
+from imglib.core.images import io
+
+# Options of 'actions.run_action' a request can set
+REQUEST_OPTIONS = ("output_dir", "cache_fname", "cache_key", "save_profile", "steps")
+
+# Requests served by this process, and its start time
+served = {"requests" : 0, "errors" : 0, "started" : time.time()}
+
+# Lock guarding the served request counters
+served_lock = threading.Lock()
+
+def get_json_value(value):
+    """
+    Convert an action result into a JSON value (pixel arrays become nested lists, and the legacy pixel mappings objects
+    keyed by '(x, y)')
+    """
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, (list, tuple)):
+        return [get_json_value(item) for item in value]
+    if isinstance(value, dict):
+        return {str(key) : get_json_value(item) for key, item in value.items()}
+    if isinstance(value, np.generic):
+        return value.item()
+    return value
+
+def get_daemon_stats():
+    """
+    Get the requests served, the uptime and the decoded image cache statistics of this process
+    """
+    with served_lock:
+        stats = dict(served)
+    stats["uptime_s"] = time.time() - stats.pop("started")
+    stats["image_cache"] = io.image_cache.get_stats() if io.image_cache != None else None
+    return stats
+
+def handle_request(request, defaults=None):
+    """
+    Run a request, returning its response
+
+    :: Params
+    - request : Dictionary holding either
+        - target, action : The image file and the action (name or ID) to run against it, and optionally the options of
+        'actions.run_action' (output_dir, cache_fname, cache_key, save_profile, steps)
+        - command : A daemon command, 'ping', 'stats' (see 'get_daemon_stats') or 'shutdown'
+    - defaults : The options used when the request does not set them (i.e. the daemon's '--cache')
+
+    :: Notes
+    - Responses are dictionaries of {id, result, token, err_msg}, 'id' being the request's (if any)
+    - Relative paths are relative to the working directory of the daemon
+    """
+    # Initialize Variables
+    defaults = defaults or {}
+    response = {"id" : request.get("id"), "result" : None, "token" : False, "err_msg" : ""}
+
+    try:
+        # Run a daemon command
+        command = request.get("command")
+        if command != None:
+            match command:
+                case "ping":
+                    response["result"] = "pong"
+                case "stats":
+                    response["result"] = get_daemon_stats()
+                case "shutdown":
+                    response["result"] = "shutting down"
+                case _:
+                    raise ValueError("Invalid command: {}".format(command))
+            response["token"] = True
+            return response
+
+        # Run the action against the image file
+        options = {name : request.get(name, defaults.get(name)) for name in REQUEST_OPTIONS}
+        if options["cache_key"] == None:
+            options["cache_key"] = "stat"
+        if options["output_dir"] != None:
+            os.makedirs(options["output_dir"], exist_ok=True)
+        result, token, err_msg = run_action(request["target"], request["action"], **options)
+        response.update(result=get_json_value(result), token=token, err_msg=str(err_msg))
+    except Exception as ex:
+        # Set error message ('target'/'action' missing or invalid command)
+        response["err_msg"] = str(ex) if not isinstance(ex, KeyError) else "Missing request field: {}".format(ex)
+
+    # Count the request
+    with served_lock:
+        served["requests"] += 1
+        served["errors"] += not response["token"]
+
+    # Output/Return
+    return response
+
+def serve_stream(input_stream, output_stream, defaults=None):
+    """
+    Answer the JSON-line requests read from the binary input stream with JSON-line responses written to the binary
+    output stream, until the input ends or a 'shutdown' command is received
+
+    - Returns True if the daemon was asked to shut down
+    - Malformed lines are answered with an error response instead of stopping the daemon
+    """
+    for line in input_stream:
+        # Skip blank lines
+        if line.strip() == b"":
+            continue
+
+        # Parse and run the request
+        try:
+            request = json.loads(line)
+            if not isinstance(request, dict):
+                raise ValueError("Request is not a JSON object")
+        except ValueError as ex:
+            request = {}
+            response = {"id" : None, "result" : None, "token" : False, "err_msg" : "Invalid request: {}".format(ex)}
+        else:
+            response = handle_request(request, defaults)
+
+        # Write the response
+        output_stream.write(json.dumps(response).encode() + b"\n")
+        output_stream.flush()
+
+        # Check if the daemon is to shut down
+        if request.get("command") == "shutdown":
+            return True
+
+    return False
+
+class RequestHandler(socketserver.StreamRequestHandler):
+    """
+    Serve the requests of a single socket connection (each connection is served by its own thread)
+    """
+    def handle(self):
+        if serve_stream(self.rfile, self.wfile, self.server.defaults):
+            threading.Thread(target=self.server.shutdown, daemon=True).start()
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Unix socket server of the daemon
+    """
+    daemon_threads = True
+
+    def __init__(self, socket_path, defaults=None):
+        # Initialize Variables
+        self.defaults = defaults or {}
+        super().__init__(socket_path, RequestHandler)
+
+def remove_stale_socket(socket_path):
+    """
+    Remove the socket file left behind by a daemon that is no longer running
+
+    - Raises OSError if a daemon is still listening on the socket
+    """
+    if not os.path.exists(socket_path):
+        return
+
+    # Check if a daemon still listens on the socket
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(socket_path)
+    except OSError:
+        os.unlink(socket_path)
+        return
+    finally:
+        probe.close()
+
+    raise OSError("A daemon is already listening on '{}'".format(socket_path))
+
+def serve(socket_path=None, defaults=None, image_cache_bytes=256 * 2**20):
+    """
+    Run the daemon until it is shut down, returning the exit status
+
+    :: Params
+    - socket_path : The Unix socket to listen on; stdin/stdout are served instead if None or '-'
+    - defaults : The options of 'actions.run_action' used when a request does not set them
+    - image_cache_bytes : The budget of the decoded image cache (see 'io.set_image_cache'; 0 disables it)
+
+    :: Notes
+    - Pillow's format plugins are loaded up front, and decoded images and result caches stay warm between requests
+    - Serving stdin/stdout, anything printed by the actions goes to stderr so it cannot corrupt the responses
+    """
+    # Warm up the process
+    Image.init()
+    io.set_image_cache(image_cache_bytes)
+
+    # Serve stdin/stdout
+    if socket_path == None or socket_path == "-":
+        output_stream = sys.stdout.buffer
+        with redirect_stdout(sys.stderr):
+            serve_stream(sys.stdin.buffer, output_stream, defaults)
+        return 0
+
+    # Serve the Unix socket
+    remove_stale_socket(socket_path)
+    with DaemonServer(socket_path, defaults) as server:
+        print("[+] Serving on '{}'".format(socket_path), file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.unlink(socket_path)
+
+    return 0
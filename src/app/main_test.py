@@ -4,85 +4,89 @@ Image Specification Identifier
 """
 import os
 import sys
-from imglib.core.images.io import open as import_file, load_image, save as output_file
-from imglib.core.images.pixels import get_image_pixels, get_black_pixels, get_colored_pixels
-from imglib.core.images.translation import img_grayscale, extract_populated_areas, convert_black_cells_to_transparent
-from imglib.core.images.information import get_image_size
+import argparse
+from app.actions import ACTIONS, CACHED_ACTIONS, PIPELINE_STEPS, SAVE_PROFILE_NAMES, COLOR_PRESET_NAMES, get_action_name, run_action
+from app.client import DEFAULT_SOCKET
 
-def main():
-    # Initialize Variables
-    action = ["metadata", "image-pixels", "check-black-cells", "check-colored-cells", "grayscale", "extract-colored", "transparency"]
-    img_fname = "src.jpg"
-    action_id = 3
+def get_parser():
+    """
+    Build the CLI argument parser
+    """
+    parser = argparse.ArgumentParser(prog="pyimglib-cli", description="Run an image action against image files, directories, glob patterns or manifest files ('@manifest.txt')")
+    parser.add_argument("target", nargs="?", default="src.jpg", help="Image file, directory, glob pattern or '@' manifest file (Default: src.jpg)")
+    parser.add_argument("action", nargs="?", default="3", help="Action name or ID: {} (Default: 3)".format(", ".join("{}={}".format(action_id, action) for action_id, action in enumerate(ACTIONS))))
+    parser.add_argument("targets", nargs="*", help="Additional image files, directories, glob patterns or '@' manifest files")
+    parser.add_argument("-j", "--workers", type=int, default=1, help="Number of worker processes for batches (Default: 1)")
+    parser.add_argument("-u", "--unordered", action="store_true", help="Report results as they complete instead of in input order")
+    parser.add_argument("-o", "--output-dir", default=None, help="Directory to write output images into, named after the input files")
+    parser.add_argument("-r", "--recursive", action="store_true", help="Collect image files in subdirectories too")
+    parser.add_argument("--resume", metavar="PROGRESS_FILE", default=None, help="Record processed files in the progress file and skip the files it already lists")
+    parser.add_argument("--cache", metavar="CACHE_FILE", default=None, help="Store the results of the analysis actions ({}) in a SQLite result cache, skipping unchanged files on reruns".format(", ".join(CACHED_ACTIONS)))
+    parser.add_argument("--cache-key", choices=["stat", "hash"], default="stat", help="Identify cached files by path, size and modification time (stat), or by a hash of their contents (hash) (Default: stat)")
+    parser.add_argument("--save-profile", choices=SAVE_PROFILE_NAMES, default=None, help="Encoder profile of the output images, trading encode time for file size (Default: Pillow's defaults)")
+    parser.add_argument("--steps", default=None, help="Comma-separated steps of the 'pipeline' action, run fused in as few passes as possible: {} (i.e. grayscale,transparency,crop-content)".format(", ".join(PIPELINE_STEPS + COLOR_PRESET_NAMES)))
+    parser.add_argument("--profile", action="store_true", help="Report the time, CPU time, pixels and bytes processed by the image functions (per function) on stderr")
+    parser.add_argument("--profile-memory", action="store_true", help="With --profile, also report the peak Python/NumPy allocation of the image functions (slower)")
+    parser.add_argument("--serve", nargs="?", const=DEFAULT_SOCKET, metavar="SOCKET", default=None, help="Run as a daemon answering JSON-line action requests on the Unix socket ('-' for stdin/stdout) (Default: {}, see 'pyimglib-client')".format(DEFAULT_SOCKET))
+    parser.add_argument("--image-cache", type=int, metavar="MB", default=256, help="With --serve, the size of the decoded image cache kept warm between requests (Default: 256, 0 disables it)")
+    return parser
 
-    # Get CLI arguments
-    exec = sys.argv[0]
-    argv = sys.argv[1:]
-    argc = len(argv)
+def run_targets(args, action):
+    """
+    Run the action against the target files of the CLI arguments, returning the exit status
+    """
+    # Check if a single file is to be processed
+    targets = [args.target] + args.targets
+    if len(targets) == 1 and os.path.isfile(args.target) and args.resume is None:
+        if args.output_dir is not None:
+            os.makedirs(args.output_dir, exist_ok=True)
+        result, token, err_msg = run_action(args.target, action, args.output_dir, args.cache, args.cache_key, args.save_profile, args.steps)
+        if token:
+            print(result)
+        else:
+            print("[X] Error encountered while processing image '{}' : {}".format(args.target, err_msg))
+        return 0 if token else 1
+
+    # Run the action across the batch of files
+    from app.batch import collect_files, run_batch
+    files = collect_files(targets, args.recursive)
+    failures = 0
+    for img_fname, result, token, err_msg in run_batch(files, action, args.workers, not args.unordered, args.output_dir, args.resume, cache_fname=args.cache, cache_key=args.cache_key, save_profile=args.save_profile, steps=args.steps, profile=args.profile, profile_memory=args.profile_memory):
+        if token:
+            print("[+] {} : {}".format(img_fname, result))
+        else:
+            failures += 1
+            print("[X] {} : {}".format(img_fname, err_msg))
 
-    # Get file information
-    if argc >= 1:
-        img_fname = argv[0]
+    return 0 if failures == 0 else 1
+
+def main():
+    # Get CLI arguments
+    args = get_parser().parse_args(sys.argv[1:])
 
-    # Get target action ID
-    if argc >= 2:
-        action_id = int(argv[1])
+    # Run as a daemon, the CLI options being the defaults of the requests
+    if args.serve != None:
+        from app.daemon import serve
+        defaults = {"output_dir" : args.output_dir, "cache_fname" : args.cache, "cache_key" : args.cache_key, "save_profile" : args.save_profile, "steps" : args.steps}
+        return serve(args.serve, defaults, args.image_cache * 2**20)
 
-    # Import an image from directory: 
-    input_image, token, err_msg = import_file(img_fname)
-  
-    # Extracting pixel map: 
-    pixel_map, token, err_msg = load_image(input_image)
-  
-    # Extracting the width and height
-    # of the image: 
-    width, height = get_image_size(input_image)
+    # Check the action
+    try:
+        action = get_action_name(args.action)
+    except ValueError as ex:
+        print(ex)
+        return 1
 
-    match action[action_id]:
-        case "metadata":
-            print("Width: {}, Height: {}, Pixel Map: {}".format(width, height, pixel_map))
-        case "image-pixels":
-            print(get_image_pixels(input_image, pixel_map, width, height))
-        case "check-black-cells":
-            # Check for black pixels in the entire image
-            ## Get all pixel coordinates and their RGB values
-            img_map = get_image_pixels(input_image, pixel_map, width, height)
-            ## Get all coordinates with black (0,0,0) pixels
-            black_pixel_cells = get_black_pixels(img_map)
-            print(black_pixel_cells)
-        case "check-colored-cells":
-            # Check for non-black pixels in the entire image
-            ## Get all pixel coordinates and their RGB values
-            img_map = get_image_pixels(input_image, pixel_map, width, height)
-            ## Get all coordinates with colors (R,G,B) pixels
-            colored_pixel_cells = get_colored_pixels(img_map)
-            print(colored_pixel_cells)
-        case "grayscale":
-            # Grayscale half of the image  
-            img_grayscale(input_image, pixel_map, width, height)
-  
-            # Saving the final output as "grayscale.png"
-            output_file(input_image, "grayscale", format="png")
-  
-            # use input_image.show() to see the image on the 
-            # output screen.
-        case "extract-colored":
-            # Extract only the colored/populated areas
-            ## Get all pixel coordinates and their RGB values
-            img_map = get_image_pixels(input_image, pixel_map, width, height)
-            ## Extract colored/populated areas
-            extract_populated_areas(input_image, pixel_map, img_map)
-            ## Saving the image as color extracted
-            output_file(input_image, "color-extracted", format="png")
-        case "transparency":
-            # Add a transparency mask layer to the black areas of the image
-            rgba = convert_black_cells_to_transparent(input_image)
+    # Run the action, profiling the image functions if requested
+    if args.profile:
+        from imglib.core.images import profiling
+        profiling.enable(args.profile_memory)
+    status = run_targets(args, action)
+    if args.profile:
+        profiling.disable()
+        print(profiling.format_summary(), file=sys.stderr)
 
-            # Saving the final output as the output file 'transparency.png'
-            output_file(rgba, "transparency", format="png")
-        case _:
-            # Default Value
-            print("Invalid action: {}".format(action))
+    return status
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,204 @@
+"""
+Asyncio Image I/O functions
+- Async counterparts of the 'io' functions for asyncio applications: disk reads, decoding and encoding run in a bounded
+thread pool instead of blocking the event loop
+- The functions keep the '[image, token, err_msg]'/'[token, err_msg]' return convention of 'io'
+"""
+import os
+import sys
+import asyncio
+import weakref
+from functools import partial
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from imglib.core.images import io
+
+# Thread pool running the blocking I/O, decoding and encoding (created on first use, see 'set_executor')
+executor = None
+
+# Maximum number of concurrent saves per event loop (see 'set_save_limit')
+save_limit = 4
+
+# Save semaphores, by event loop
+save_semaphores = weakref.WeakKeyDictionary()
+
+def set_executor(workers=0):
+    """
+    Replace the thread pool running the blocking I/O with one of 'workers' threads (0 = 1 per CPU core), returning it
+
+    - The previous pool finishes its pending jobs in the background
+    """
+    global executor
+    previous = executor
+    executor = ThreadPoolExecutor(workers or os.cpu_count() or 1, thread_name_prefix="imglib-aio")
+    if previous != None:
+        previous.shutdown(wait=False)
+    return executor
+
+def get_executor():
+    """
+    Get the thread pool running the blocking I/O, creating it on first use
+    """
+    return executor or set_executor()
+
+def set_save_limit(limit=4):
+    """
+    Set the maximum number of saves running concurrently per event loop; further saves wait for a slot (backpressure)
+
+    - Applies to the event loops that have not saved yet
+    """
+    global save_limit
+    save_limit = max(1, limit)
+    save_semaphores.clear()
+
+def get_save_semaphore():
+    """
+    Get the semaphore bounding the concurrent saves of the running event loop
+    """
+    loop = asyncio.get_running_loop()
+    if loop not in save_semaphores:
+        save_semaphores[loop] = asyncio.Semaphore(save_limit)
+    return save_semaphores[loop]
+
+async def run_blocking(function, *args):
+    """
+    Run a blocking function in the I/O thread pool without blocking the event loop
+    """
+    return await asyncio.get_running_loop().run_in_executor(get_executor(), function, *args)
+
+def open_and_load(img_fname, cache=None, mmap=False):
+    """
+    Open and decode an image (run in the I/O thread pool), returning [image, token, err_msg]
+    """
+    input_image, token, err_msg = io.open(img_fname, cache, mmap)
+    if token:
+        # Decode the pixels here rather than on the event loop (cached/mapped images are kept read-only)
+        pixel_map, token, err_msg = io.load_image(input_image, writable=False)
+    return [input_image if token else None, token, err_msg]
+
+async def open(img_fname="src.png", cache=None, mmap=False):
+    """
+    Import and decode an image from the specified source file name without blocking the event loop (see 'io.open')
+
+    - Returns [image, token, err_msg]; the image is fully decoded
+    """
+    return await run_blocking(open_and_load, img_fname, cache, mmap)
+
+async def read_stream(stream, max_bytes=0, chunk_size=2**20):
+    """
+    Read all the bytes of an async byte stream
+
+    :: Params
+    - stream : An object with an async 'read(n)' (i.e. asyncio.StreamReader) or an async iterable of bytes chunks
+    - max_bytes : Raise ValueError if the stream is larger than this (0 = no limit)
+    """
+    # Initialize Variables
+    buffer = bytearray()
+
+    # Read the stream chunk by chunk
+    if hasattr(stream, "read"):
+        while True:
+            chunk = await stream.read(chunk_size)
+            if not chunk:
+                break
+            buffer += chunk
+            if max_bytes > 0 and len(buffer) > max_bytes:
+                raise ValueError("Stream is larger than {} bytes".format(max_bytes))
+    else:
+        async for chunk in stream:
+            buffer += chunk
+            if max_bytes > 0 and len(buffer) > max_bytes:
+                raise ValueError("Stream is larger than {} bytes".format(max_bytes))
+
+    # Output/Return
+    return bytes(buffer)
+
+def decode_bytes(data):
+    """
+    Decode an image from its encoded bytes (run in the I/O thread pool)
+    """
+    input_image = Image.open(BytesIO(data))
+    input_image.load()
+    return input_image
+
+async def open_stream(stream, max_bytes=0):
+    """
+    Import and decode an image from an async byte stream (i.e. an asyncio.StreamReader or an async iterable of bytes chunks)
+
+    - The stream is read on the event loop and decoded in the I/O thread pool
+    - 'max_bytes' rejects streams larger than this (0 = no limit)
+    - Returns [image, token, err_msg]
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+    im = None
+
+    try:
+        # Read the stream, then decode the image off the event loop
+        data = await read_stream(stream, max_bytes)
+        im = await run_blocking(decode_bytes, data)
+
+        # Set success token
+        token = True
+    except Exception as ex:
+        # Set error message
+        err_msg = ex
+
+    # Return/Output
+    return [im, token, err_msg]
+
+async def save(input_image, out_fname="output", format="PNG", profile=None, **options):
+    """
+    Save the image into the specified output file as the specified image format without blocking the event loop (see 'io.save'
+    for the save profile and encoder options)
+
+    - At most 'save_limit' saves run at once per event loop; further saves wait for a slot, bounding the memory and threads
+    held by pending encodes
+    - Returns [token, err_msg]
+    """
+    async with get_save_semaphore():
+        return await run_blocking(partial(io.save, input_image, out_fname, format, profile, **options))
+
+def encode_bytes(input_image, format="PNG", profile=None, **options):
+    """
+    Encode an image into bytes (run in the I/O thread pool)
+    """
+    buffer = BytesIO()
+    input_image.save(buffer, io.get_format_name(format), **io.get_save_options(format, profile, **options))
+    return buffer.getvalue()
+
+async def save_stream(input_image, stream, format="PNG", profile=None, **options):
+    """
+    Encode the image in the specified image format and write it to an async byte stream (i.e. an asyncio.StreamWriter)
+
+    - The image is encoded in the I/O thread pool; the stream is drained after writing when it supports it, so slow
+    readers hold back the writer
+    - Saves are bounded like 'save', and take the same save profile and encoder options
+    - Returns [token, err_msg]
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    try:
+        async with get_save_semaphore():
+            # Encode the image off the event loop
+            data = await run_blocking(partial(encode_bytes, input_image, format, profile, **options))
+
+            # Write the bytes to the stream
+            written = stream.write(data)
+            if asyncio.iscoroutine(written):
+                await written
+            if hasattr(stream, "drain"):
+                await stream.drain()
+
+        # Set success token
+        token = True
+    except Exception as ex:
+        # Set error message
+        err_msg = ex
+
+    # Return/Output
+    return [token, err_msg]
@@ -0,0 +1,345 @@
+"""
+Image and analysis result caches
+- ResultCache : Persistent on-disk cache of analysis results
+    - Results of metadata and pixel queries are stored in a SQLite database, keyed by the image file, so rerunning an analysis
+    over unchanged files skips opening and decoding them entirely
+    - Files are identified by their path, size and modification time (key="stat"), or by a hash of their contents (key="hash",
+    which also recognizes copied, moved or touched files)
+    - The database is bounded in size, evicting the least recently used results first
+- ImageCache : In-memory cache of decoded images, so images opened again and again (watermarks, masks, templates) are
+decoded once
+"""
+import os
+import sys
+import time
+import pickle
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image
+from imglib.core.images.information import get_image_metadata
+
+class ResultCache:
+    """
+    A size-bounded, least recently used cache of analysis results in a SQLite database
+
+    :: Params
+    - db_fname : The SQLite database file (created if it does not exist)
+    - max_bytes : The total size of the stored results to keep, evicting the least recently used results beyond it
+    - key : How image files are identified
+        + stat : The absolute path, size and modification time (no file reads)
+        + hash : A BLAKE2b hash of the file contents (the hash of a path is itself cached until its size or modification time changes)
+
+    :: Notes
+    - Results are stored with pickle; only open cache databases you trust
+    - A cache may be shared by the threads of a process, and by several processes through the same database file
+    - 'hits' and 'misses' count the lookups of this cache object
+    """
+    def __init__(self, db_fname="imglib-cache.sqlite", max_bytes=256 * 2**20, key="stat"):
+        # Check the key
+        if key not in ("stat", "hash"):
+            raise ValueError("Invalid key: {}".format(key))
+
+        # Initialize Variables
+        self.db_fname = db_fname
+        self.max_bytes = max_bytes
+        self.key = key
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+        # Open the database
+        self.connection = sqlite3.connect(db_fname, timeout=30, check_same_thread=False)
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS results (file_key TEXT, name TEXT, path TEXT, value BLOB, size INTEGER, accessed REAL, PRIMARY KEY (file_key, name))")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)")
+            self.connection.execute("CREATE INDEX IF NOT EXISTS results_path ON results (path)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS hashes (path TEXT PRIMARY KEY, size INTEGER, mtime_ns INTEGER, digest TEXT)")
+
+            # Keep the result count and total bytes up to date with triggers, so they are read without scanning the results
+            self.connection.execute("CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), count INTEGER, bytes INTEGER)")
+            self.connection.execute("INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), COALESCE(SUM(size), 0) FROM results")
+            self.connection.execute("CREATE TRIGGER IF NOT EXISTS results_insert AFTER INSERT ON results BEGIN UPDATE totals SET count = count + 1, bytes = bytes + NEW.size WHERE id = 0; END")
+            self.connection.execute("CREATE TRIGGER IF NOT EXISTS results_update AFTER UPDATE OF size ON results BEGIN UPDATE totals SET bytes = bytes - OLD.size + NEW.size WHERE id = 0; END")
+            self.connection.execute("CREATE TRIGGER IF NOT EXISTS results_delete AFTER DELETE ON results BEGIN UPDATE totals SET count = count - 1, bytes = bytes - OLD.size WHERE id = 0; END")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """
+        Close the database
+        """
+        with self.lock:
+            self.connection.close()
+
+    def get_file_key(self, img_fname):
+        """
+        Get the key identifying the current contents of the image file
+        """
+        # Initialize Variables
+        path = os.path.abspath(img_fname)
+        stat = os.stat(path)
+
+        # Identify the file by its path, size and modification time
+        if self.key == "stat":
+            return "{}:{}:{}".format(path, stat.st_size, stat.st_mtime_ns)
+
+        # Reuse the hash of the file if it is unchanged since it was hashed
+        row = self.connection.execute("SELECT digest FROM hashes WHERE path = ? AND size = ? AND mtime_ns = ?", (path, stat.st_size, stat.st_mtime_ns)).fetchone()
+        if row != None:
+            return row[0]
+
+        # Hash the file contents
+        digest = hashlib.blake2b()
+        with open(path, "rb") as img_file:
+            for chunk in iter(lambda: img_file.read(2**20), b""):
+                digest.update(chunk)
+        digest = digest.hexdigest()
+
+        with self.connection:
+            self.connection.execute("INSERT OR REPLACE INTO hashes VALUES (?, ?, ?, ?)", (path, stat.st_size, stat.st_mtime_ns, digest))
+
+        return digest
+
+    def get(self, img_fname, name):
+        """
+        Look up the result 'name' of the image file, returning [found, value]
+        """
+        with self.lock:
+            file_key = self.get_file_key(img_fname)
+            row = self.connection.execute("SELECT value FROM results WHERE file_key = ? AND name = ?", (file_key, name)).fetchone()
+
+            # Check if the result is cached
+            if row == None:
+                self.misses += 1
+                return [False, None]
+
+            # Mark the result as recently used
+            with self.connection:
+                self.connection.execute("UPDATE results SET accessed = ? WHERE file_key = ? AND name = ?", (time.time(), file_key, name))
+            self.hits += 1
+
+        # Output/Return
+        return [True, pickle.loads(row[0])]
+
+    def put(self, img_fname, name, value):
+        """
+        Store the result 'name' of the image file, evicting the least recently used results if the cache is full
+
+        - Results larger than the whole cache are not stored
+        """
+        # Initialize Variables
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        if len(data) > self.max_bytes:
+            return
+
+        with self.lock:
+            file_key = self.get_file_key(img_fname)
+            with self.connection:
+                # Upsert rather than replace, so the update trigger (not the delete trigger, which REPLACE skips) keeps the totals
+                self.connection.execute("INSERT INTO results VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (file_key, name) DO UPDATE SET path = excluded.path, value = excluded.value, size = excluded.size, accessed = excluded.accessed", (file_key, name, os.path.abspath(img_fname), data, len(data), time.time()))
+                self.evict()
+
+    def evict(self):
+        """
+        Delete the least recently used results until the cache fits in 'max_bytes'
+
+        - Only the running total is read while the cache fits; past the limit, the oldest results are read through the
+        'accessed' index until enough bytes are freed, so eviction never scans the whole table
+        """
+        # Check if the cache is over its limit
+        excess = self.connection.execute("SELECT bytes FROM totals WHERE id = 0").fetchone()[0] - self.max_bytes
+        if excess <= 0:
+            return
+
+        # Collect the least recently used results freeing the excess bytes
+        evicted = []
+        for rowid, size in self.connection.execute("SELECT rowid, size FROM results ORDER BY accessed, rowid"):
+            evicted.append((rowid,))
+            excess -= size
+            if excess <= 0:
+                break
+
+        self.connection.executemany("DELETE FROM results WHERE rowid = ?", evicted)
+
+    def get_or_compute(self, img_fname, name, function):
+        """
+        Get the result 'name' of the image file from the cache, or compute it with function() and store it on a miss
+        """
+        found, value = self.get(img_fname, name)
+        if not found:
+            value = function()
+            self.put(img_fname, name, value)
+        return value
+
+    def invalidate(self, img_fname=None):
+        """
+        Delete the cached results of the image file (stored under its current path), or of every file if not provided
+        """
+        with self.lock, self.connection:
+            if img_fname == None:
+                self.connection.execute("DELETE FROM results")
+                self.connection.execute("DELETE FROM hashes")
+            else:
+                path = os.path.abspath(img_fname)
+                self.connection.execute("DELETE FROM results WHERE path = ?", (path,))
+                self.connection.execute("DELETE FROM hashes WHERE path = ?", (path,))
+
+    def get_size(self):
+        """
+        Get the [result count, total bytes] of the cache
+        """
+        with self.lock:
+            return list(self.connection.execute("SELECT count, bytes FROM totals WHERE id = 0").fetchone())
+
+class ImageCache:
+    """
+    A thread-safe, byte-bounded, least recently used cache of decoded images
+
+    :: Params
+    - max_bytes : The total size of the decoded pixel data to keep, evicting the least recently used images beyond it
+
+    :: Notes
+    - Images are keyed by their absolute path, size and modification time, so a modified file is decoded again
+    - Every 'get' hands out a new image sharing the cached pixel data where Pillow can map it (L, P, RGBA, ... but not RGB,
+    which is copied); handed out images are read-only and copied on their first write, so callers modifying them never
+    corrupt the cached entry ('io.load_image' makes them writable before handing out their pixel map)
+    - 'hits', 'misses' and 'evictions' count the lookups and evictions since the cache was created
+    """
+    def __init__(self, max_bytes=256 * 2**20):
+        # Initialize Variables
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get_key(self, img_fname):
+        """
+        Get the key identifying the current contents of the image file
+        """
+        path = os.path.abspath(img_fname)
+        stat = os.stat(path)
+        return (path, stat.st_size, stat.st_mtime_ns)
+
+    def get(self, img_fname):
+        """
+        Get a copy-on-write handout of the decoded image, or None if it is not cached
+        """
+        # Initialize Variables
+        key = self.get_key(img_fname)
+
+        with self.lock:
+            entry = self.entries.get(key)
+
+            # Check if the image is cached
+            if entry == None:
+                self.misses += 1
+                return None
+
+            # Mark the image as recently used
+            self.entries.move_to_end(key)
+            self.hits += 1
+
+        # Hand out a read-only image over the cached pixel data
+        mode, size, data, palette, format, info = entry
+        output_image = Image.frombuffer(mode, size, data, "raw", mode, 0, 1)
+        if palette != None:
+            output_image.putpalette(palette[1], palette[0])
+        output_image.format = format
+        output_image.info = dict(info)
+
+        # Output/Return
+        return output_image
+
+    def put(self, img_fname, input_image):
+        """
+        Store the decoded pixel data of the image, evicting the least recently used images if the cache is full
+
+        - Images larger than the whole cache are not stored
+        """
+        # Initialize Variables
+        key = self.get_key(img_fname)
+        data = input_image.tobytes()
+        palette = (input_image.palette.mode, input_image.getpalette(input_image.palette.mode)) if input_image.mode in ("P", "PA") else None
+        if len(data) > self.max_bytes:
+            return
+
+        with self.lock:
+            # Replace the previous entry of the image
+            if key in self.entries:
+                self.current_bytes -= len(self.entries.pop(key)[2])
+
+            self.entries[key] = (input_image.mode, input_image.size, data, palette, input_image.format, dict(input_image.info))
+            self.current_bytes += len(data)
+
+            # Evict the least recently used images
+            while self.current_bytes > self.max_bytes:
+                self.current_bytes -= len(self.entries.popitem(last=False)[1][2])
+                self.evictions += 1
+
+    def open(self, img_fname):
+        """
+        Open the image file through the cache, decoding and storing it on a miss
+        """
+        # Check if the image is cached
+        output_image = self.get(img_fname)
+        if output_image != None:
+            return output_image
+
+        # Decode the image and store it
+        with Image.open(img_fname) as input_image:
+            input_image.load()
+            self.put(img_fname, input_image)
+            output_image = input_image.copy()
+            output_image.format = input_image.format
+
+        # Output/Return
+        return output_image
+
+    def clear(self):
+        """
+        Remove every image from the cache
+        """
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+    def get_stats(self):
+        """
+        Get the hits, misses, evictions, entries and size (bytes) of the cache
+        """
+        with self.lock:
+            return {"hits" : self.hits, "misses" : self.misses, "evictions" : self.evictions, "entries" : len(self.entries), "bytes" : self.current_bytes, "max_bytes" : self.max_bytes}
+
+def get_cached_metadata(img_fname, cache=None):
+    """
+    Get the header-only metadata of the image file (see 'information.get_image_metadata'), from the cache if provided
+    """
+    if cache == None:
+        return get_image_metadata(img_fname)
+    return cache.get_or_compute(img_fname, "metadata", lambda: get_image_metadata(img_fname))
+
+def get_cached_pixel_query(img_fname, target="black", tolerance=0, output="count", cache=None):
+    """
+    Query the black/colored pixels of the image file (see 'pixels.query_pixels'), from the cache if provided
+
+    - The image is only opened and decoded on a cache miss
+    - 'pixels' (and NumPy) is imported on the first query, so importing the caches (i.e. through 'io') stays light
+    """
+    from imglib.core.images.pixels import get_pixel_array, query_pixels
+
+    def query():
+        with Image.open(img_fname) as input_image:
+            return query_pixels(get_pixel_array(input_image), target, tolerance, output)
+
+    if cache == None:
+        return query()
+    return cache.get_or_compute(img_fname, "query:{}:{}:{}".format(target, tolerance, output), query)
@@ -0,0 +1,234 @@
+"""
+Multi-frame image streaming functions (animated GIF, APNG and WebP, multi-page TIFF)
+- FrameStream : Lazily evaluated stream of the frames of an image, decoded (and transformed) one frame at a time
+- FrameSequence : Read-only multi-frame Pillow image over a FrameStream, so the TIFF and WebP 'save_all' encoders (which
+turn 'append_images' into a list) pull the frames one at a time instead of taking a list of every decoded frame
+"""
+import os
+import sys
+from PIL import Image
+from imglib.core.images.parallel import imap_ordered
+
+# Per-frame information carried over to the transformed frames (timing and compositing of animations)
+FRAME_INFO_KEYS = ("duration", "loop", "disposal", "blend")
+
+class FrameStream:
+    """
+    A lazily evaluated stream of the frames of a multi-frame image
+
+    :: Params
+    - size : The (width, height) of the frames
+    - mode : The color mode of every frame (see 'get_frame_mode')
+    - n_frames : The number of frames
+    - frames : A function returning a new iterator over the frame images, so the stream can be iterated through again
+
+    :: Notes
+    - Iterating over the stream yields the frame images in order, decoding (and transforming) them one at a time; every
+    iteration decodes the frames again
+    - Frames carry their per-frame information (i.e. 'duration', 'disposal') in their 'info'
+    """
+    def __init__(self, size, mode, n_frames, frames):
+        self.size = size
+        self.mode = mode
+        self.n_frames = n_frames
+        self.frames = frames
+
+    def __iter__(self):
+        return iter(self.frames())
+
+    def __len__(self):
+        return self.n_frames
+
+    def map(self, operation, mode=None, size=None, workers=1):
+        """
+        Lazily apply an operation to every frame, returning the stream of transformed frames
+
+        - 'operation' takes a frame image and returns the transformed frame image
+        - 'mode' and 'size' are of the transformed frames (of this stream if not provided)
+        - 'workers' > 1 transforms the frames concurrently in a thread pool, with at most 2 frames per worker in flight
+        (0 = 1 worker per CPU core)
+        """
+        def transform(frame):
+            return keep_frame_info(frame, operation(frame))
+
+        return FrameStream(size or self.size, mode or self.mode, self.n_frames, lambda: imap_ordered(transform, self, workers))
+
+class FrameSequence(Image.Image):
+    """
+    A read-only multi-frame Pillow image over a FrameStream, seeking through the frames as the stream yields them
+
+    :: Params
+    - frame_stream : The stream of frames
+
+    :: Notes
+    - Seeking forward pulls the next frames from the stream, seeking back to the first frame is free (it is kept), and
+    seeking back to any other frame iterates through the stream again
+    - Only used to hand the frames to Pillow's encoders (see 'write_frames'); the pixels are those of the current frame
+    - Switching frames sets the Pillow image internals the format plugins set when opening a file ('im', '_mode', '_size',
+    'readonly'), as 'mode' and 'size' are read-only properties over '_mode' and '_size' since Pillow 10.1 (the minimum
+    version required in 'pyproject.toml')
+    """
+    def __init__(self, frame_stream):
+        super().__init__()
+
+        # Initialize Variables
+        self.frame_stream = frame_stream
+        self.n_frames = frame_stream.n_frames
+        self.is_animated = frame_stream.n_frames > 1
+        self.frames = iter(frame_stream)
+        self.first_frame = next(self.frames)
+        self.frame_index = 0
+        self.set_frame(self.first_frame)
+
+    def set_frame(self, frame):
+        """
+        Make the frame image the current frame
+        """
+        self.im = frame.im
+        self._mode = frame.mode
+        self._size = frame.size
+        self.palette = frame.palette
+        self.info = dict(frame.info)
+        self.readonly = 1
+
+    def seek(self, frame):
+        # Check if the frame exists
+        if frame < 0 or frame >= self.n_frames:
+            raise EOFError("No more frames")
+
+        # Check if the frame is current or the first frame
+        if frame == self.frame_index:
+            return
+        if frame == 0:
+            self.set_frame(self.first_frame)
+            self.frame_index = 0
+            self.frames = None
+            return
+
+        # Iterate through the stream again to seek back
+        if self.frames == None or frame < self.frame_index:
+            self.frames = iter(self.frame_stream)
+            next(self.frames)
+            self.frame_index = 0
+
+        # Pull the frames up to the requested frame
+        while self.frame_index < frame:
+            current_frame = next(self.frames, None)
+            if current_frame == None:
+                raise EOFError("No more frames")
+            self.frame_index += 1
+        self.set_frame(current_frame)
+
+    def tell(self):
+        return self.frame_index
+
+class FrameInfoList(list):
+    """
+    A per-frame encoder option read from the information of the frame a FrameSequence is at
+
+    - Encoders look per-frame options (i.e. the WebP 'duration') up by frame index while the sequence is at that frame, so
+    the options of the frames are read as they are pulled instead of being collected up front
+    """
+    def __init__(self, sequence, key, default=0):
+        super().__init__()
+        self.sequence = sequence
+        self.key = key
+        self.default = default
+
+    def __getitem__(self, index):
+        return self.sequence.info.get(self.key, self.default)
+
+def keep_frame_info(frame, output_frame):
+    """
+    Carry the per-frame information of the frame (see 'FRAME_INFO_KEYS') over to its transformed frame, returning the transformed frame
+    """
+    for key in FRAME_INFO_KEYS:
+        if key in frame.info and key not in output_frame.info:
+            output_frame.info[key] = frame.info[key]
+    return output_frame
+
+def get_frame_mode(input_image):
+    """
+    Get the color mode every frame of an opened image is decoded to: the mode of the image, or RGB(A) for palette images
+
+    - The frames of animated palette images after the first decode as RGB or RGBA (i.e. GIF), and the encoders take the mode
+    of the first frame for every frame, so palette frames are decoded as RGBA if the image is animated or has transparency
+    (RGB otherwise)
+    """
+    if input_image.mode not in ("P", "PA"):
+        return input_image.mode
+    if input_image.mode == "PA" or "transparency" in input_image.info or getattr(input_image, "n_frames", 1) > 1:
+        return "RGBA"
+    return "RGB"
+
+def generate_frames(img_fname, mode=None):
+    """
+    Decode the frames of an image file one at a time, yielding a copy of every frame (with its per-frame information)
+    converted to the color mode if provided
+    """
+    with Image.open(img_fname) as input_image:
+        for index in range(getattr(input_image, "n_frames", 1)):
+            input_image.seek(index)
+            if mode == None or input_image.mode == mode:
+                yield input_image.copy()
+            else:
+                yield input_image.convert(mode)
+
+def open_frames(img_fname):
+    """
+    Open an image file as a FrameStream of lazily decoded frames
+
+    - Only the file header (and the frame count) is read here, the frames are decoded as the stream is iterated through
+    - Single-frame images are streams of 1 frame
+    - Every frame is decoded to the same color mode (see 'get_frame_mode')
+    """
+    # Open the image (header only)
+    with Image.open(img_fname) as input_image:
+        size = input_image.size
+        mode = get_frame_mode(input_image)
+        n_frames = getattr(input_image, "n_frames", 1)
+
+    # Output/Return
+    return FrameStream(size, mode, n_frames, lambda: generate_frames(img_fname, mode))
+
+def write_frames(frame_stream, fp, format="GIF", **options):
+    """
+    Write a stream of frames into a binary file object as a multi-frame image of the specified format
+
+    :: Params
+    - format : The multi-frame format (i.e. 'GIF', 'PNG' (APNG), 'WEBP', 'TIFF')
+    - options : Encoder options passed to Pillow (i.e. duration, loop, quality); the frame durations are taken from the
+    frames if not provided
+
+    :: Notes
+    - TIFF pages and WebP frames are encoded as they are pulled from the stream through a FrameSequence, so only the current
+    frame is decoded at a time
+    - GIF frames are pulled one at a time from a lazy 'append_images' iterator, but Pillow keeps every palette-converted
+    frame until the file is written
+    - APNG frames are decoded into a list first, as Pillow's APNG encoder iterates through the frames twice
+    """
+    # Initialize Variables
+    format = format.upper()
+    Image.init()
+
+    # Check if the format can hold multiple frames
+    if format not in Image.SAVE_ALL:
+        raise ValueError("Invalid multi-frame format: {}".format(format))
+
+    # Hand the frames to the GIF encoder as they are pulled from the stream
+    if format == "GIF":
+        frames = iter(frame_stream)
+        next(frames).save(fp, format, save_all=True, append_images=frames, **options)
+        return
+
+    # Hand the decoded frames to the APNG encoder
+    if format == "PNG":
+        frames = list(frame_stream)
+        frames[0].save(fp, format, save_all=True, append_images=frames[1:], **options)
+        return
+
+    # Hand the frames to the encoder as a single multi-frame image, pulled from the stream as they are encoded
+    sequence = FrameSequence(frame_stream)
+    if format == "WEBP" and "duration" not in options:
+        options["duration"] = FrameInfoList(sequence, "duration")
+    sequence.save(fp, format, save_all=True, **options)
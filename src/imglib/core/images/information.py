@@ -2,7 +2,13 @@
 Functions to obtain metadata and information from images
 """
 import os
+import re
 import sys
+from PIL import Image, ImageMode
+from imglib.core.images.parallel import run_parallel
+
+# EXIF tag of the image orientation (1 = upright; 2-8 = mirrored and/or rotated)
+EXIF_ORIENTATION = 0x0112
 
 def get_image_size(input_image):
     """
@@ -25,3 +31,113 @@ def get_image_color_mode(input_image):
     image_mode = input_image.mode
     return image_mode
 
+def get_bit_depth(input_image):
+    """
+    Get the number of bits per channel of an opened image from its mode (and the PNG header's raw mode), without decoding it
+    """
+    # Obtain the bit depth of the color mode
+    if input_image.mode == "1":
+        return 1
+    bit_depth = int(ImageMode.getmode(input_image.mode).typestr[2:]) * 8
+
+    # PNG keeps the bit depth of the file in the raw mode of its tile (i.e. 'RGB;16B', 'P;4')
+    if input_image.format == "PNG" and len(input_image.tile) > 0:
+        rawmode = input_image.tile[0][3]
+        rawmode = rawmode if isinstance(rawmode, str) else rawmode[0]
+        match = re.search(r";(\d+)", rawmode)
+        if match != None and int(match.group(1)) in (1, 2, 4, 16):
+            bit_depth = int(match.group(1))
+
+    return bit_depth
+
+def get_exif_orientation(input_image):
+    """
+    Get the EXIF orientation of an opened image (1 if it has none), without decoding it
+
+    - Only the EXIF data read with the header is used; Image.getexif() would decode PNG images looking for trailing EXIF chunks
+    """
+    # EXIF block read with the header (i.e. JPEG APP1, WebP, PNG eXIf before the image data)
+    if "exif" in input_image.info:
+        exif = Image.Exif()
+        exif.load(input_image.info["exif"])
+        return exif.get(EXIF_ORIENTATION, 1)
+
+    # TIFF tags
+    if hasattr(input_image, "tag_v2"):
+        return input_image.tag_v2.get(EXIF_ORIENTATION, 1)
+
+    return 1
+
+def get_image_metadata(img_fname):
+    """
+    Read the metadata of an image file from its headers only, without decoding the pixels
+
+    :: Notes
+    - Returns a dictionary with the keys
+        - filename, format, width, height, mode
+        - bit_depth : Bits per channel
+        - n_frames : Number of frames (1 for still images)
+        - orientation : EXIF orientation (1 = upright)
+        - icc_profile : True if an ICC color profile is embedded
+    - Raises the error of Image.open() if the file cannot be identified as an image
+    """
+    with Image.open(img_fname) as input_image:
+        width, height = input_image.size
+        return {
+            "filename" : img_fname,
+            "format" : input_image.format,
+            "width" : width,
+            "height" : height,
+            "mode" : input_image.mode,
+            "bit_depth" : get_bit_depth(input_image),
+            "n_frames" : getattr(input_image, "n_frames", 1),
+            "orientation" : get_exif_orientation(input_image),
+            "icc_profile" : bool(input_image.info.get("icc_profile")),
+        }
+
+def iter_image_files(directory, recursive=False):
+    """
+    Iterate through the file names of the images in the directory (by extension, in directory order)
+    """
+    # Initialize Variables
+    extensions = Image.registered_extensions()
+
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_dir():
+                if recursive:
+                    yield from iter_image_files(entry.path, recursive)
+            elif os.path.splitext(entry.name)[1].lower() in extensions:
+                yield entry.path
+
+def scan_image_metadata(directory, recursive=False, workers=1, chunk_size=1024):
+    """
+    Read the header-only metadata of every image in the directory, yielding [img_fname, metadata, token, err_msg] per file
+
+    :: Params
+    - recursive : Also scan the subdirectories
+    - workers : The number of threads reading headers concurrently (0 = 1 per CPU core); header reads are I/O bound, so
+    more threads than cores pay off on network storage
+    - chunk_size : The number of files handed to the threads at once; results are yielded chunk by chunk, so directories
+    of any size are scanned in bounded memory
+
+    :: Notes
+    - Files that cannot be read are reported with token = False and the error instead of stopping the scan
+    """
+    def read_metadata(img_fname):
+        try:
+            return [img_fname, get_image_metadata(img_fname), True, ""]
+        except Exception as ex:
+            return [img_fname, None, False, ex]
+
+    # Initialize Variables
+    chunk = []
+
+    for img_fname in iter_image_files(directory, recursive):
+        chunk.append(img_fname)
+        if len(chunk) >= chunk_size:
+            yield from run_parallel(read_metadata, chunk, workers)
+            chunk = []
+
+    # Read the last chunk
+    yield from run_parallel(read_metadata, chunk, workers)
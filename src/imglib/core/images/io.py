@@ -3,20 +3,151 @@ Image I/O Handling and Processing functions
 """
 import os
 import sys
+import math
+import builtins
 from PIL import Image
+from imglib.core.images import tiles
+from imglib.core.images import frames
+from imglib.core.images.cache import ImageCache
+from imglib.core.images.parallel import ensure_writable
+from imglib.core.images.profiling import profiled
 
-def open(img_fname="src.png"):
+# Encoder options of the save profiles, by profile and image format
+SAVE_PROFILES = {
+    # Lowest encode time (i.e. PNG zlib level 1, WebP fastest method)
+    "fast" : {
+        "PNG" : {"compress_level" : 1},
+        "JPEG" : {"quality" : 85},
+        "WEBP" : {"quality" : 80, "method" : 0},
+    },
+    # Pillow's default effort, with optimized JPEG tables
+    "balanced" : {
+        "PNG" : {"compress_level" : 6},
+        "JPEG" : {"quality" : 90, "optimize" : True},
+        "WEBP" : {"quality" : 85, "method" : 4},
+    },
+    # Smallest files, at several times the encode time
+    "smallest" : {
+        "PNG" : {"optimize" : True},
+        "JPEG" : {"quality" : 85, "optimize" : True, "progressive" : True},
+        "WEBP" : {"quality" : 80, "method" : 6},
+        "GIF" : {"optimize" : True},
+        "TIFF" : {"compression" : "tiff_adobe_deflate"},
+    },
+}
+
+# Decoded image cache used by open() when no cache is passed (disabled if None, see 'set_image_cache')
+image_cache = None
+
+def set_image_cache(max_bytes=256 * 2**20):
+    """
+    Enable the process-wide decoded image cache used by open() with a byte budget (0 disables it), returning the cache
+    """
+    global image_cache
+    image_cache = ImageCache(max_bytes) if max_bytes > 0 else None
+    return image_cache
+
+def get_reduce_factor(size, reduce=1, max_size=None):
+    """
+    Get the integer factor to shrink an image of the given (width, height) by
+
+    :: Params
+    - reduce : Shrink the image by this factor (i.e. 2, 4, 8)
+    - max_size : Shrink the image to fit in this (width, height), or this width and height if an integer
+    """
+    # Initialize Variables
+    width, height = size
+    factor = max(1, int(reduce))
+
+    # Shrink the image further to fit in the maximum size
+    if max_size != None:
+        max_width, max_height = (max_size, max_size) if isinstance(max_size, int) else max_size
+        factor = max(factor, math.ceil(width / max(1, max_width)), math.ceil(height / max(1, max_height)))
+
+    # Output/Return
+    return factor
+
+@profiled
+def reduce_image(input_image, reduce=1, max_size=None):
+    """
+    Shrink an image by an integer factor (see 'get_reduce_factor') as cheaply as the format allows
+
+    :: Notes
+    - JPEG images not yet decoded are set to decode at 1/2, 1/4 or 1/8 scale through DCT scaling (draft mode), so the
+    full-resolution image is never decoded; the decoding stays lazy
+    - Other images (and the remaining factor after DCT scaling) are decoded and shrunk with Pillow's reduce(), averaging
+    every factor x factor box of pixels; palette and bilevel images are converted to RGB(A)/L first
+    - The shrunk image is at most 'ceil(size / factor)'; returns the image itself if it is not shrunk
+    """
+    # Obtain the target size
+    factor = get_reduce_factor(input_image.size, reduce, max_size)
+    if factor <= 1:
+        return input_image
+    target_size = (math.ceil(input_image.size[0] / factor), math.ceil(input_image.size[1] / factor))
+
+    # Decode JPEG images at a reduced scale (no-op for other formats and decoded images)
+    input_image.draft(None, target_size)
+
+    # Shrink the rest of the way by averaging boxes of pixels
+    factor = max(math.ceil(input_image.size[0] / target_size[0]), math.ceil(input_image.size[1] / target_size[1]))
+    if factor > 1:
+        # Convert the color modes reduce() does not support
+        output_image = input_image
+        if output_image.mode in ("P", "PA"):
+            output_image = output_image.convert("RGBA" if output_image.mode == "PA" or "transparency" in output_image.info else "RGB")
+        elif output_image.mode == "1":
+            output_image = output_image.convert("L")
+
+        output_image = output_image.reduce(factor)
+        output_image.format = input_image.format
+        output_image.info = dict(input_image.info)
+        return output_image
+
+    # Output/Return
+    return input_image
+
+@profiled
+def open(img_fname="src.png", cache=None, mmap=False, reduce=1, max_size=None):
     """
     Import an image from the specified source file name
+
+    :: Params
+    - cache : The decoded image cache (see 'cache.ImageCache') to open the image through; the process-wide cache set with
+    'set_image_cache' is used if not provided
+    - mmap : Memory-map uncompressed images instead of reading them (see the notes)
+    - reduce : Decode the image shrunk by this factor (i.e. 2, 4, 8) for previews and approximate analysis
+    - max_size : Decode the image shrunk to fit in this (width, height), or this width and height if an integer
+
+    :: Notes
+    - Without a cache, the image is opened lazily (decoded by 'load_image')
+    - With a cache, the image is decoded once and every open() after that hands out a read-only view of the cached pixels,
+    which is copied on its first write
+    - With 'mmap', uncompressed images whose raw pixels Pillow can use in place (L, P, RGBA, ... stored as a single region,
+    see 'tiles.PILLOW_MAPPED_MODES') are backed by the file mapping right away: opening is near-instant, processes share the
+    page cache, and the image is read-only until it is first written to (when Pillow copies it). Other images (i.e. RGB/BGR)
+    are opened lazily as usual; use 'map_pixels' to view their pixels without copying
+    - With 'reduce'/'max_size', JPEG images decode at 1/2, 1/4 or 1/8 scale (DCT scaling), several times faster than at
+    full resolution; other images are decoded and then shrunk (see 'reduce_image'). See 'pixels' for the accuracy of the
+    pixel queries on shrunk images
     """
     # Initialize Variables
     token = False
     err_msg = ""
     im = None
+    cache = cache or image_cache
 
     try:
         # Try to open the specified file as an image and import into the system buffer
-        im = Image.open(img_fname)
+        im = Image.open(img_fname) if cache == None else cache.open(img_fname)
+
+        # Memory-map the pixels of uncompressed images (Pillow maps the file on load when the raw mode is the color mode)
+        if mmap and cache == None:
+            if tiles.is_pillow_mappable(im):
+                im.load()
+
+        # Shrink the image
+        if reduce > 1 or max_size != None:
+            im = reduce_image(im, reduce, max_size)
 
         # Set success token
         token = True
@@ -27,9 +158,13 @@ def open(img_fname="src.png"):
     # Return/Output
     return [im, token, err_msg]
   
-def load_image(input_image):
+@profiled
+def load_image(input_image, writable=True):
     """
     Extracting pixel map from the image
+
+    - Read-only images (i.e. cached or memory-mapped) are copied so the pixel map can be written to; set 'writable' to
+    False to read the pixels of these images in place instead
     """
     # Initialize Variables
     token = False
@@ -40,6 +175,11 @@ def load_image(input_image):
         # Try to load the image and return the image buffer as a pixel map
         pixel_map = input_image.load() 
 
+        # Copy read-only images (i.e. cached or memory-mapped) so the pixel map can be written to
+        if writable and input_image.readonly:
+            ensure_writable(input_image)
+            pixel_map = input_image.load()
+
         # Set success token
         token = True
     except Exception as ex:
@@ -49,17 +189,84 @@ def load_image(input_image):
     # Return/Output
     return [pixel_map, token, err_msg]
 
-def save(input_image, out_fname="output", format="PNG"):
+@profiled
+def map_pixels(img_fname="src.bmp", writable=False, mode=None, size=None, offset=0):
+    """
+    Memory-map the pixels of an uncompressed image file (BMP, PPM/PGM, TGA, raw TIFF) or headerless raw dump as an (H, W, C)
+    uint8 pixel array view, without copying them (see 'tiles.map_raw_pixels')
+
+    - The array is read-only, or copy-on-write with 'writable' (the file is never modified)
+    - The array can be passed to the pixel functions taking pixel arrays (i.e. 'query_pixels', 'get_black_pixels')
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+    pixel_array = None
+
+    try:
+        # Try to map the pixels of the file
+        pixel_array = tiles.map_raw_pixels(img_fname, writable, mode, size, offset)
+
+        # Set success token
+        token = True
+    except Exception as ex:
+        # Set error message
+        err_msg = ex
+
+    # Return/Output
+    return [pixel_array, token, err_msg]
+
+def get_format_name(format="PNG"):
+    """
+    Get the Pillow name of an image format (i.e. 'png' => 'PNG', 'jpg' => 'JPEG')
+    """
+    return "JPEG" if format.upper() == "JPG" else format.upper()
+
+def get_save_options(format="PNG", profile=None, **options):
+    """
+    Get the encoder options to save an image format with: the options of the save profile, overridden by the options given
+    """
+    # Initialize Variables
+    format = get_format_name(format)
+
+    # Obtain the options of the profile
+    if profile == None:
+        profile_options = {}
+    elif profile in SAVE_PROFILES:
+        profile_options = SAVE_PROFILES[profile].get(format, {})
+    else:
+        raise ValueError("Invalid profile: {}".format(profile))
+
+    # Output/Return
+    return dict(profile_options, **options)
+
+@profiled
+def save(input_image, out_fname="output", format="PNG", profile=None, **options):
     """
     Save the image buffer into the specified output file as the specified image format
+
+    :: Params
+    - out_fname : The output file name (without extension, saved as '<out_fname>.<format>'), or a binary file object to
+    write to (i.e. an open file or io.BytesIO)
+    - profile : The save profile (see 'SAVE_PROFILES'), trading encode time for file size
+        + fast : Lowest encode time (i.e. PNG zlib level 1)
+        + balanced : Pillow's default effort
+        + smallest : Smallest files (i.e. optimized PNG/GIF, progressive JPEG, WebP method 6)
+    - options : Encoder options passed to Pillow (i.e. quality=90, compress_level=3, progressive=True), overriding the profile
     """
     # Initialize Variables
     token = False
     err_msg = ""
 
     try:
-        # Try to save the input image to the output file
-        input_image.save("{}.{}".format(out_fname, format.lower()), format)
+        # Obtain the encoder options
+        save_options = get_save_options(format, profile, **options)
+
+        # Try to save the input image to the output file (or file object)
+        if hasattr(out_fname, "write"):
+            input_image.save(out_fname, get_format_name(format), **save_options)
+        else:
+            input_image.save("{}.{}".format(out_fname, format.lower()), get_format_name(format), **save_options)
 
         # Set success token
         token = True
@@ -70,3 +277,120 @@ def save(input_image, out_fname="output", format="PNG"):
     # Return/Output
     return [token, err_msg]
 
+@profiled
+def open_tiles(img_fname="src.png", tile_height=512, tile_width=0):
+    """
+    Import an image from the specified source file name as a stream of lazily decoded tiles (see 'tiles.open_tiles')
+
+    - 'tile_height' (and 'tile_width') bound the memory used per tile
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+    tile_stream = None
+
+    try:
+        # Try to open the specified file and set up the tiles to decode
+        tile_stream = tiles.open_tiles(img_fname, tile_height, tile_width)
+
+        # Set success token
+        token = True
+    except Exception as ex:
+        # Set error message
+        err_msg = ex
+
+    # Return/Output
+    return [tile_stream, token, err_msg]
+
+@profiled
+def save_tiles(tile_stream, out_fname="output", format="PNG", compress_level=6):
+    """
+    Save a stream of tiles into the specified output file as the specified image format, writing the tiles as they are processed
+
+    - PNG and PPM/PGM are written incrementally; other formats are assembled in memory first (see 'tiles.write_tiles')
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    try:
+        # Try to write the tiles to the output file
+        with builtins.open("{}.{}".format(out_fname, format.lower()), "wb") as fp:
+            tiles.write_tiles(tile_stream, fp, format, compress_level)
+
+        # Set success token
+        token = True
+    except Exception as ex:
+        # Set error message
+        err_msg = ex
+
+    # Return/Output
+    return [token, err_msg]
+
+@profiled
+def open_frames(img_fname="src.gif"):
+    """
+    Import a multi-frame image (animated GIF, APNG or WebP, multi-page TIFF) from the specified source file name as a
+    stream of lazily decoded frames (see 'frames.open_frames')
+
+    - Frames are decoded one at a time as the stream is iterated through; transform them with 'FrameStream.map' or the
+    '*_frames' functions of 'translation'
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+    frame_stream = None
+
+    try:
+        # Try to open the specified file and read its frame count
+        frame_stream = frames.open_frames(img_fname)
+
+        # Set success token
+        token = True
+    except Exception as ex:
+        # Set error message
+        err_msg = ex
+
+    # Return/Output
+    return [frame_stream, token, err_msg]
+
+@profiled
+def save_frames(frame_stream, out_fname="output", format="GIF", profile=None, **options):
+    """
+    Save a stream of frames into the specified output file as a multi-frame image of the specified format, encoding the
+    frames as they are decoded and transformed
+
+    :: Params
+    - out_fname : The output file name (without extension, saved as '<out_fname>.<format>'), or a binary file object to write
+    to (readable too for TIFF, whose pages are appended by reading back the previous page offsets, i.e. io.BytesIO)
+    - format : The multi-frame format (i.e. 'GIF', 'PNG' (APNG), 'WEBP', 'TIFF')
+    - profile : The save profile (see 'SAVE_PROFILES')
+    - options : Encoder options passed to Pillow (i.e. duration, loop, quality), overriding the profile
+
+    :: Notes
+    - TIFF and WebP are written without holding more than the frames in flight; GIF and APNG are buffered by Pillow's
+    encoders (see 'frames.write_frames')
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    try:
+        # Obtain the encoder options
+        save_options = get_save_options(format, profile, **options)
+
+        # Try to write the frames to the output file (or file object)
+        if hasattr(out_fname, "write"):
+            frames.write_frames(frame_stream, out_fname, get_format_name(format), **save_options)
+        else:
+            with builtins.open("{}.{}".format(out_fname, format.lower()), "w+b") as fp:
+                frames.write_frames(frame_stream, fp, get_format_name(format), **save_options)
+
+        # Set success token
+        token = True
+    except Exception as ex:
+        # Set error message
+        err_msg = ex
+
+    # Return/Output
+    return [token, err_msg]
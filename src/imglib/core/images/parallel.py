@@ -0,0 +1,91 @@
+"""
+Intra-image parallelism functions
+- Split an image into row bands and run the pixel kernels of the bands in a thread pool
+- NumPy and Pillow release the GIL inside their C kernels, so the bands of a single image are processed on multiple cores
+"""
+import os
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+def get_workers(workers=1):
+    """
+    Get the number of worker threads to use (0 or None = 1 per CPU core)
+    """
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, workers)
+
+def get_row_bands(height, workers=1, min_rows=64):
+    """
+    Split the rows of an image into [upper, lower) bands, 1 per worker (bands are kept at least 'min_rows' tall)
+    """
+    # Obtain the number of bands
+    band_count = max(1, min(get_workers(workers), height // min_rows))
+
+    # Output/Return
+    return [(height * band // band_count, height * (band + 1) // band_count) for band in range(band_count)]
+
+def run_parallel(function, items, workers=1):
+    """
+    Call the function on every item in a thread pool (or in this thread if there is only 1 worker or item), returning the results in order
+    """
+    # Initialize Variables
+    items = list(items)
+    workers = min(get_workers(workers), len(items))
+
+    # Check if there is anything to run in parallel
+    if workers <= 1:
+        return [function(item) for item in items]
+
+    with ThreadPoolExecutor(workers) as executor:
+        return list(executor.map(function, items))
+
+def imap_ordered(function, items, workers=1, window=0):
+    """
+    Lazily call the function on every item in a thread pool (or in this thread if there is only 1 worker), yielding the results in order
+
+    - At most 'window' items (2 per worker if not provided) are in flight, so long iterables (i.e. the frames of an animation)
+    are processed with bounded memory
+    """
+    # Initialize Variables
+    workers = get_workers(workers)
+
+    # Check if there is anything to run in parallel
+    if workers <= 1:
+        yield from map(function, items)
+        return
+
+    # Initialize Variables
+    window = window or workers * 2
+    pending = deque()
+
+    with ThreadPoolExecutor(workers) as executor:
+        # Keep the window of items in flight, handing out the oldest result once the window is full
+        for item in items:
+            pending.append(executor.submit(function, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+
+        # Hand out the results left
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+def map_row_bands(band_function, height, workers=1, min_rows=64):
+    """
+    Call band_function(upper, lower) on every row band of an image in a thread pool, returning the results in band order
+
+    - Band functions usually write into their own rows of a preallocated output, so no reassembly copy is needed
+    """
+    return run_parallel(lambda band: band_function(*band), get_row_bands(height, workers, min_rows), workers)
+
+def ensure_writable(input_image):
+    """
+    Make sure a Pillow image owns a writable buffer before its bands are written concurrently
+
+    - Read-only images (i.e. from Image.frombuffer/fromarray) are copied by Pillow on the first write; triggering the copy
+    here, before the worker threads start, keeps them from racing to copy it
+    """
+    if input_image.readonly:
+        input_image.putpixel((0, 0), input_image.getpixel((0, 0)))
+    return input_image
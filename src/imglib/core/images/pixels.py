@@ -1,9 +1,38 @@
 """
 Pixel/Cells-related Image Manipulation functions and handling
+
+:: Accuracy on reduced-resolution images
+- Images opened with 'io.open(reduce=...)'/'max_size' are shrunk while decoding (JPEG DCT scaling, or averaging every
+factor x factor box of pixels), so every pixel of the shrunk image stands for a box of the original pixels and the pixel
+queries become estimates:
+    - Black/colored masks, counts and coordinates : A shrunk pixel is black only if its whole box averages to (near) black.
+    Black areas are found, but isolated black pixels and thin black lines inside colored areas are averaged away (and the
+    reverse for colored specks on black); multiply counts by the area of a box (factor ** 2) to estimate the full-resolution
+    count. Raise 'tolerance' by a few levels to absorb the DCT/averaging noise along edges
+    - Bounding boxes ('get_mask_bbox', 'get_populated_bbox', 'query_pixels(output="bbox")') : Exact up to the box size; scale
+    them back with 'scale_bbox' (the result may be up to 1 box too tight or too loose on every side)
+    - Coordinates : In shrunk image coordinates; multiply by the factor for the upper-left pixel of the box in the original
+    - Legacy dictionary mappings and pixel values : Hold the averaged colors of the boxes, not original pixel values
+- Use full-resolution decoding when exact counts or pixel values are needed
 """
 import os
 import sys
-from PIL import Image, ImageDraw, ImageFilter, ImageOps, ImageChops
+import math
+from itertools import product
+import numpy as np
+from PIL import Image, ImageChops
+from imglib.core.images.parallel import get_workers, map_row_bands
+from imglib.core.images.selection import PixelSelection
+from imglib.core.images.profiling import profiled
+
+# Color modes whose Pillow buffer maps directly onto an (H, W, C) uint8 array
+ARRAY_MODES = ("L", "LA", "RGB", "RGBA")
+
+# Channel values of the 256 bins of a histogram
+HISTOGRAM_LEVELS = np.arange(256, dtype=np.float64)
+
+# Number of pixels sampled to estimate the dominant colors of an image
+DOMINANT_SAMPLE_PIXELS = 2**18
 
 def get_pixel_values(input_image, x_Row, y_Col):
     """
@@ -29,34 +58,532 @@ def get_pixel_values(input_image, x_Row, y_Col):
     # Output/Return
     return target_list
 
-def get_image_pixels(input_image, pixel_map, width, height):
-    """
-    Iterate through the image and return a dictionary (key-value) mapping all the points and cell/pixels values making up the image
+def get_array_image(input_image):
     """
-    # Initialize Variables
-    image_map = {
-        # (x,y) : [r,g,b]
-    }
+    Get the image in a color mode with 8-bit channels (see 'ARRAY_MODES'), converting it only if it is not in one already
 
+    - Other color modes are converted to RGBA if they carry transparency, L if they are bilevel/integer/float, and RGB otherwise
+    """
     # Obtain the image mode
     image_mode = input_image.mode
-    
-    # Iterate through the image pixel by pixel across the row and down the columns and map the color density of that pixel (black/white) to the current X value (row number)
-    for i in range(width): 
-        for j in range(height): 
-            # getting the RGB(A) pixel value. 
-            pixel_color_values = get_pixel_values(input_image, i, j)
 
-            # Map the current pixel's RGB value to the current row x column
-            image_map[i,j] = pixel_color_values
+    if image_mode in ARRAY_MODES:
+        return input_image
+    if image_mode in ("1", "I", "F") or image_mode.startswith("I;16"):
+        return input_image.convert("L")
+    if image_mode in ("PA", "La", "RGBa") or "transparency" in input_image.info:
+        return input_image.convert("RGBA")
+    return input_image.convert("RGB")
+
+@profiled
+def get_pixel_array(input_image, workers=1):
+    """
+    Build an (H, W, C) uint8 array holding the pixel values of the image, copied once from the Pillow buffer
+
+    - L, LA, RGB and RGBA images are used as-is (single-band images get a channel axis of size 1)
+    - Other color modes are converted to RGBA if they carry transparency, L if they are bilevel/integer/float, and RGB otherwise
+    - The array is read-only; copy it before editing and use Image.fromarray() to turn it back into an image
+    - 'workers' > 1 copies row bands of the image concurrently (0 = 1 worker per CPU core)
+    """
+    # Normalize the color mode into one with 8-bit channels
+    input_image = get_array_image(input_image)
+
+    # Check if the image is to be copied band by band
+    if get_workers(workers) > 1:
+        # Decode the image once, before the worker threads crop it (a lazily opened image would be decoded by every thread at once)
+        input_image.load()
+
+        # Initialize Variables
+        width, height = input_image.size
+        pixel_array = np.empty((height, width, len(input_image.getbands())), dtype=np.uint8)
+
+        def copy_band(upper, lower):
+            # Copy the band of rows straight into its rows of the array
+            band = np.asarray(input_image.crop((0, upper, width, lower)))
+            pixel_array[upper:lower] = band.reshape(lower - upper, width, -1)
+
+        map_row_bands(copy_band, height, workers)
+        pixel_array.flags.writeable = False
+        return pixel_array
+
+    # Copy the image buffer into the array in a single pass
+    pixel_array = np.asarray(input_image)
+
+    # Give single-band images a channel axis
+    if pixel_array.ndim == 2:
+        pixel_array = pixel_array[:, :, np.newaxis]
+
+    # Output/Return
+    return pixel_array
+
+@profiled
+def pixel_array_to_dict(pixel_array):
+    """
+    Compatibility adapter converting a pixel array into the legacy dictionary mapping of {(x, y) : [r,g,b(,a)]}
+
+    - Every pixel costs a tuple key and a list value, so only use this on small images or regions
+    """
+    # Obtain the resolution of the pixel array
+    height, width = pixel_array.shape[:2]
+
+    # Flatten the array column by column to follow the legacy x-major ordering
+    pixel_values = pixel_array.transpose(1, 0, 2).reshape(width * height, -1).tolist()
+
+    # Map the (x, y) coordinates to their pixel values
+    image_map = dict(zip(product(range(width), range(height)), pixel_values))
 
     # Output/Return
     return image_map
 
-def get_black_pixels(image_map):
+@profiled
+def select_pixels(pixel_array, mask, as_dict=False):
+    """
+    Select the pixels of a pixel array where the boolean (H, W) mask is set
+
+    - Returns [coordinates, pixel_values] : an (N, 2) array of (x, y) coordinates and the (N, C) pixel values at those coordinates
+    - Returns the legacy dictionary mapping of {(x, y) : [r,g,b(,a)]} instead if 'as_dict' is True
+    """
+    # Obtain the row (y) and column (x) indices of the selected pixels
+    rows, cols = np.nonzero(mask)
+
+    # Gather the coordinates as (x, y) pairs, matching the legacy dictionary keys
+    coordinates = np.column_stack((cols, rows))
+    pixel_values = pixel_array[rows, cols]
+
+    if as_dict:
+        return dict(zip(map(tuple, coordinates.tolist()), pixel_values.tolist()))
+
+    # Output/Return
+    return [coordinates, pixel_values]
+
+def get_color_channels(pixel_array):
+    """
+    Get a view of the color channels of a pixel array, leaving out the alpha channel (if any)
+    """
+    # Single-band images (L/LA) only have 1 color channel
+    if pixel_array.shape[2] < 3:
+        return pixel_array[:, :, :1]
+    return pixel_array[:, :, :3]
+
+def is_black_values(pixel_values, tolerance=0):
+    """
+    Check if the pixel values of a legacy dictionary mapping ([r,g,b(,a)] or [l(,a)]) are black (every color channel
+    <= tolerance), ignoring alpha like the pixel array masks
+    """
+    color_values = pixel_values[:3] if len(pixel_values) >= 3 else pixel_values[:1]
+    return max(color_values) <= tolerance
+
+def get_channel_maximum(pixel_array):
+    """
+    Get the (H, W) plane holding the brightest color channel value of every pixel, ignoring alpha
+    """
+    # Initialize Variables
+    color_channels = get_color_channels(pixel_array)
+    channel_maximum = color_channels[:, :, 0]
+
+    # Combine the channel planes element-wise (much faster than reducing over the short channel axis)
+    for channel in range(1, color_channels.shape[2]):
+        channel_maximum = np.maximum(channel_maximum, color_channels[:, :, channel])
+
+    # Output/Return
+    return channel_maximum
+
+def get_black_mask(pixel_array, tolerance=0, workers=1):
+    """
+    Get a boolean (H, W) mask of the pixels whose color channels are all black (<= tolerance), ignoring alpha
+    """
+    return get_pixel_mask(pixel_array, "black", tolerance, workers)
+
+@profiled
+def get_pixel_mask(pixel_array, target="black", tolerance=0, workers=1):
+    """
+    Get a boolean (H, W) mask of the target pixels in a single pass over the pixel array
+
+    :: Params
+    - target : The pixels to select
+        + black : Pixels whose color channels are all <= tolerance
+        + colored : Pixels with any color channel > tolerance
+    - tolerance : The highest channel value still considered black (i.e. 5 for near-black)
+    - workers : The number of threads computing row bands of the mask concurrently (0 = 1 per CPU core)
+    """
+    # Obtain the comparison selecting the target pixels from their brightest color channel
+    match target:
+        case "black":
+            compare = np.less_equal
+        case "colored":
+            compare = np.greater
+        case _:
+            raise ValueError("Invalid target: {}".format(target))
+
+    # Initialize Variables
+    mask = np.empty(pixel_array.shape[:2], dtype=bool)
+
+    def mask_band(upper, lower):
+        # Write the band of the mask straight into its rows of the mask
+        compare(get_channel_maximum(pixel_array[upper:lower]), tolerance, out=mask[upper:lower])
+
+    map_row_bands(mask_band, mask.shape[0], workers)
+
+    # Output/Return
+    return mask
+
+def get_mask_bbox(mask):
+    """
+    Get the bounding box (left, upper, right, lower) of the set pixels in a boolean (H, W) mask, or None if no pixel is set
+
+    - The box follows the Pillow convention (right and lower are exclusive) and can be passed to Image.crop() directly
+    - Only the per-row and per-column occupancy is computed, the coordinates of the set pixels are never materialized
+    """
+    # Obtain the rows containing at least 1 set pixel
+    rows = np.flatnonzero(mask.any(axis=1))
+    if rows.size == 0:
+        return None
+
+    # Obtain the columns containing at least 1 set pixel (within the occupied rows)
+    cols = np.flatnonzero(mask[rows[0]:rows[-1] + 1].any(axis=0))
+
+    # Output/Return
+    return (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+
+def scale_bbox(bbox, reduced_size, full_size):
+    """
+    Scale a bounding box found on a reduced-resolution image (see 'io.open(reduce=...)') back to the full-resolution image
+
+    - The box is widened outwards to whole boxes of original pixels and clipped to the full-resolution image
+    - Returns None if the bounding box is None
+    """
+    if bbox == None:
+        return None
+
+    # Initialize Variables
+    scale_x = full_size[0] / reduced_size[0]
+    scale_y = full_size[1] / reduced_size[1]
+    left, upper, right, lower = bbox
+
+    # Output/Return
+    return (int(left * scale_x), int(upper * scale_y), min(full_size[0], int(np.ceil(right * scale_x))), min(full_size[1], int(np.ceil(lower * scale_y))))
+
+def get_occupancy(pixel_array, tolerance=0, workers=1):
+    """
+    Get the per-row and per-column occupancy of the colored pixels (any color channel > tolerance)
+
+    - Returns [rows, cols] : boolean arrays of length H and W, set where the row/column holds at least 1 colored pixel
+    """
+    # Compute the mask of the colored pixels
+    mask = get_pixel_mask(pixel_array, "colored", tolerance, workers)
+
+    # Output/Return
+    return [mask.any(axis=1), mask.any(axis=0)]
+
+def get_region_array(source, box):
+    """
+    Get the pixel array of the region (left, upper, right, lower) of a pixel array or an image
+
+    - Images only have the region copied out of their buffer
+    """
+    # Initialize Variables
+    left, upper, right, lower = box
+
+    # Check if a pixel array is provided
+    if isinstance(source, np.ndarray):
+        return source[upper:lower, left:right]
+
+    # Output/Return
+    return get_pixel_array(source.crop(box))
+
+@profiled
+def get_populated_bbox(source, tolerance=0, band_size=64):
+    """
+    Get the bounding box (left, upper, right, lower) of the colored pixels (any color channel > tolerance), or None if there are none
+
+    - 'source' may be a pixel array or an image (only the scanned bands of the image are copied out of its buffer)
+    - Each edge is scanned inward 'band_size' rows/columns at a time and stops at the first colored pixel, so only the
+    black borders (plus at most 1 band per edge) are read rather than the whole image
+    - The box follows the Pillow convention (right and lower are exclusive) and can be passed to Image.crop() directly
+    """
+    # Obtain the resolution of the source
+    if isinstance(source, np.ndarray):
+        height, width = source.shape[:2]
+    else:
+        width, height = source.size
+
+    # Scan the rows downwards from the top edge
+    upper = None
+    for start in range(0, height, band_size):
+        stop = min(start + band_size, height)
+        rows = np.flatnonzero(get_channel_maximum(get_region_array(source, (0, start, width, stop))).max(axis=1) > tolerance)
+        if rows.size > 0:
+            upper = start + int(rows[0])
+            break
+
+    # Check if the image has no colored pixels at all
+    if upper is None:
+        return None
+
+    # Scan the rows upwards from the bottom edge (the row found from the top bounds the scan)
+    lower = upper + 1
+    for stop in range(height, upper, -band_size):
+        start = max(stop - band_size, upper)
+        rows = np.flatnonzero(get_channel_maximum(get_region_array(source, (0, start, width, stop))).max(axis=1) > tolerance)
+        if rows.size > 0:
+            lower = start + int(rows[-1]) + 1
+            break
+
+    # Scan the columns (between the upper and lower rows) rightwards from the left edge
+    left = 0
+    for start in range(0, width, band_size):
+        stop = min(start + band_size, width)
+        cols = np.flatnonzero(get_channel_maximum(get_region_array(source, (start, upper, stop, lower))).max(axis=0) > tolerance)
+        if cols.size > 0:
+            left = start + int(cols[0])
+            break
+
+    # Scan the columns leftwards from the right edge (the column found from the left bounds the scan)
+    right = left + 1
+    for stop in range(width, left, -band_size):
+        start = max(stop - band_size, left)
+        cols = np.flatnonzero(get_channel_maximum(get_region_array(source, (start, upper, stop, lower))).max(axis=0) > tolerance)
+        if cols.size > 0:
+            right = start + int(cols[-1]) + 1
+            break
+
+    # Output/Return
+    return (left, upper, right, lower)
+
+@profiled
+def query_pixels(pixel_array, target="black", tolerance=0, output="coordinates", workers=1):
+    """
+    Query the black/colored pixels of a pixel array, computing the mask in one pass and returning only what is asked for
+
+    :: Params
+    - target : The pixels to select (black/colored, see 'get_pixel_mask')
+    - tolerance : The highest channel value still considered black
+    - output : The result to return
+        + mask : The boolean (H, W) mask
+        + count : The number of selected pixels
+        + bbox : The bounding box (left, upper, right, lower) of the selected pixels, or None if there are none
+        + coordinates : An (N, 2) array of the (x, y) coordinates of the selected pixels
+        + selection : A PixelSelection of the selected pixels, keeping their values (see 'selection.PixelSelection')
+    - workers : The number of threads computing the mask concurrently (0 = 1 per CPU core)
+    """
+    # Compute the mask of the target pixels
+    mask = get_pixel_mask(pixel_array, target, tolerance, workers)
+
+    match output:
+        case "mask":
+            return mask
+        case "count":
+            return int(np.count_nonzero(mask))
+        case "bbox":
+            return get_mask_bbox(mask)
+        case "coordinates":
+            rows, cols = np.nonzero(mask)
+            return np.column_stack((cols, rows))
+        case "selection":
+            return PixelSelection.from_mask(mask, pixel_array)
+        case _:
+            raise ValueError("Invalid output: {}".format(output))
+
+@profiled
+def get_image_pixels(input_image, pixel_map, width, height, as_dict=False, workers=1):
+    """
+    Return the pixel values making up the image as an (H, W, C) uint8 pixel array (see 'get_pixel_array')
+
+    - The array is built once from the image buffer instead of reading the image pixel by pixel
+    - 'pixel_map' is unused and only kept for compatibility with existing callers
+    - Set 'as_dict' to True to get the legacy dictionary mapping of {(x, y) : [r,g,b(,a)]} instead (slow and memory hungry on large images)
+    - 'workers' > 1 copies row bands of the image concurrently (0 = 1 worker per CPU core)
+    """
+    # Build the pixel array from the image buffer
+    pixel_array = get_pixel_array(input_image, workers)
+
+    # Limit the array to the requested resolution
+    pixel_array = pixel_array[:height, :width]
+
+    # Check if the legacy dictionary mapping is requested
+    if as_dict:
+        return pixel_array_to_dict(pixel_array)
+
+    # Output/Return
+    return pixel_array
+
+def query_pixel_tiles(tile_stream, target="black", tolerance=0, output="count"):
+    """
+    Query the black/colored pixels of a TileStream tile by tile (see 'query_pixels'), holding only 1 tile in memory
+
+    - 'output' may be count, bbox or coordinates (in full-image coordinates); the full mask is not available in tiled mode
+    """
+    # Initialize Variables
+    count = 0
+    bbox = None
+    coordinates = []
+
+    # Check the output
+    if output not in ("count", "bbox", "coordinates"):
+        raise ValueError("Invalid output for tiles: {}".format(output))
+
+    # Iterate through the tiles
+    for box, tile in tile_stream:
+        tile_result = query_pixels(get_pixel_array(tile), target, tolerance, output)
+
+        # Merge the tile result into the full image result
+        match output:
+            case "count":
+                count += tile_result
+            case "bbox":
+                if tile_result is not None:
+                    tile_bbox = (tile_result[0] + box[0], tile_result[1] + box[1], tile_result[2] + box[0], tile_result[3] + box[1])
+                    bbox = tile_bbox if bbox is None else (min(bbox[0], tile_bbox[0]), min(bbox[1], tile_bbox[1]), max(bbox[2], tile_bbox[2]), max(bbox[3], tile_bbox[3]))
+            case "coordinates":
+                coordinates.append(tile_result + (box[0], box[1]))
+
+    # Output/Return
+    match output:
+        case "count":
+            return count
+        case "bbox":
+            return bbox
+        case _:
+            return np.concatenate(coordinates) if coordinates else np.empty((0, 2), dtype=np.intp)
+
+def get_channel_statistics(histogram):
+    """
+    Get the min, max, mean and standard deviation of a channel from its 256-bin histogram
+    """
+    # Initialize Variables
+    counts = np.asarray(histogram, dtype=np.float64)
+    total = counts.sum()
+
+    # Check if the channel has any pixels
+    if total == 0:
+        return {"min" : 0, "max" : 0, "mean" : 0.0, "stddev" : 0.0}
+
+    # Obtain the statistics from the bins
+    levels = np.flatnonzero(counts)
+    mean = counts @ HISTOGRAM_LEVELS / total
+    variance = counts @ (HISTOGRAM_LEVELS - mean) ** 2 / total
+
+    # Output/Return
+    return {"min" : int(levels[0]), "max" : int(levels[-1]), "mean" : float(mean), "stddev" : float(math.sqrt(variance))}
+
+def get_dominant_colors(input_image, count=5, sample_pixels=DOMINANT_SAMPLE_PIXELS):
+    """
+    Estimate the most common colors of the image, returning a list of [color, ratio] (most common first)
+
+    :: Params
+    - count : The number of colors to return
+    - sample_pixels : The number of pixels sampled (on a regular grid, without averaging) from larger images
+
+    :: Notes
+    - Color channels are bucketed to 32 levels; a color is the mean of the sampled pixels in its bucket (a tuple of channel
+    values, 1 value for grayscale images) and its ratio the share of the sampled pixels in the bucket
+    - Fully transparent pixels are left out
+    """
+    # Sample a grid of pixels from larger images
+    sample_image = get_array_image(input_image)
+    width, height = sample_image.size
+    scale = math.sqrt(width * height / sample_pixels)
+    if scale > 1:
+        sample_image = sample_image.resize((max(1, int(width / scale)), max(1, int(height / scale))), Image.NEAREST)
+    pixel_array = get_pixel_array(sample_image)
+
+    # Obtain the color channels of the visible pixels
+    colors = get_color_channels(pixel_array).reshape(-1, min(3, pixel_array.shape[2]))
+    if pixel_array.shape[2] in (2, 4):
+        colors = colors[pixel_array[:, :, -1].reshape(-1) > 0]
+    if len(colors) == 0:
+        return []
+
+    # Count the pixels of every bucket (5 bits per channel)
+    keys = np.zeros(len(colors), dtype=np.intp)
+    for channel in range(colors.shape[1]):
+        keys = (keys << 5) | (colors[:, channel] >> 3)
+    counts = np.bincount(keys)
+
+    # Obtain the most common buckets and the mean color of their pixels
+    buckets = np.argsort(counts)[::-1][:count]
+    buckets = buckets[counts[buckets] > 0]
+    sums = [np.bincount(keys, weights=colors[:, channel], minlength=len(counts))[buckets] for channel in range(colors.shape[1])]
+    means = np.rint(np.column_stack(sums) / counts[buckets][:, np.newaxis]).astype(int)
+
+    # Output/Return
+    return [[tuple(color), int(bucket_count) / len(colors)] for color, bucket_count in zip(means.tolist(), counts[buckets])]
+
+@profiled
+def get_image_statistics(input_image, tolerance=0, dominant_colors=5):
+    """
+    Get the color statistics of the image from its channel histograms, computed by Pillow's C histogram() in a single pass
+
+    :: Params
+    - tolerance : The highest channel value still considered black
+    - dominant_colors : The number of dominant colors to estimate (see 'get_dominant_colors'; 0 = none)
+
+    :: Notes
+    - Returns a dictionary of plain Python values with the keys
+        - mode, width, height, pixels
+        - channels : {band : {histogram (256 counts), min, max, mean, stddev}} of the 8-bit channels (see 'get_array_image')
+        - black_ratio : The share of pixels whose color channels are all black (<= tolerance), ignoring alpha
+        - alpha_coverage : The share of pixels that are not fully transparent (1.0 without an alpha channel)
+        - opaque_ratio : The share of fully opaque pixels (1.0 without an alpha channel)
+        - dominant_colors : List of [color, ratio], most common first
+    """
+    # Initialize Variables
+    statistics_image = get_array_image(input_image)
+    width, height = statistics_image.size
+    pixels = width * height
+    bands = statistics_image.getbands()
+    color_bands = [band for band in bands if band != "A"]
+
+    # Obtain the histograms of every channel in a single pass over the image
+    histogram = statistics_image.histogram()
+    channels = {}
+    for index, band in enumerate(bands):
+        channel_histogram = histogram[index * 256:(index + 1) * 256]
+        channels[band] = dict(histogram=channel_histogram, **get_channel_statistics(channel_histogram))
+
+    # Obtain the histogram of the brightest color channel, counting the black pixels from it
+    if len(color_bands) == 1:
+        brightest_histogram = channels[color_bands[0]]["histogram"]
+    else:
+        r, g, b = statistics_image.split()[:3]
+        brightest_histogram = ImageChops.lighter(ImageChops.lighter(r, g), b).histogram()
+    black_pixels = sum(brightest_histogram[:max(0, tolerance) + 1])
+
+    # Obtain the alpha coverage from the alpha histogram
+    alpha_histogram = channels["A"]["histogram"] if "A" in channels else None
+
+    # Output/Return
+    return {
+        "mode" : input_image.mode,
+        "width" : width,
+        "height" : height,
+        "pixels" : pixels,
+        "channels" : channels,
+        "black_ratio" : black_pixels / pixels if pixels > 0 else 0.0,
+        "alpha_coverage" : 1 - alpha_histogram[0] / pixels if alpha_histogram != None and pixels > 0 else 1.0,
+        "opaque_ratio" : alpha_histogram[255] / pixels if alpha_histogram != None and pixels > 0 else 1.0,
+        "dominant_colors" : get_dominant_colors(statistics_image, dominant_colors) if dominant_colors > 0 else [],
+    }
+
+@profiled
+def get_black_pixels(image_map, as_dict=False, tolerance=0, workers=1, as_selection=False):
     """ 
-    Iterate through the image mappings and Check for cells with black pixels (r=0,g=0,b=0)
+    Check the image for cells with black pixels (r=0,g=0,b=0)
+
+    - Pixel arrays (from 'get_image_pixels') return [coordinates, pixel_values] (see 'select_pixels'), or the legacy dictionary mapping if 'as_dict' is True
+    - Pixel arrays treat every color channel <= 'tolerance' as black (use 'query_pixels' for counts and bounding boxes)
+    - 'workers' > 1 computes the mask of pixel arrays in row bands concurrently (0 = 1 worker per CPU core)
+    - Set 'as_selection' to True to get a compact PixelSelection of the black pixels of pixel arrays instead (1 bit per image pixel plus the values of the selected pixels, see 'selection.PixelSelection')
+    - Legacy dictionary mappings are iterated through and return a dictionary of the black cells; like pixel arrays, only
+    the color channels are compared (an opaque black RGBA pixel is black)
     """
+    # Check if a pixel array is provided
+    if isinstance(image_map, np.ndarray):
+        mask = get_pixel_mask(image_map, "black", tolerance, workers)
+        if as_selection:
+            return PixelSelection.from_mask(mask, image_map)
+        return select_pixels(image_map, mask, as_dict)
+
     # Initialize Variables
     found_rows = {}
 
@@ -66,18 +593,33 @@ def get_black_pixels(image_map):
         curr_row = coordinates[0]
         curr_col = coordinates[1]
 
-        # Check for cells with black pixels (r=0,g=0,b=0)
-        if image_map[coordinates] == [0,0,0]:
+        # Check for cells with black pixels (r=0,g=0,b=0), ignoring alpha
+        if is_black_values(img_pixels, tolerance):
             # print("{} = {}".format(coord, img_pixels))
             found_rows[curr_row, curr_col] = img_pixels
 
     # Return/Output
     return found_rows
 
-def get_colored_pixels(image_map):
+@profiled
+def get_colored_pixels(image_map, as_dict=False, tolerance=0, workers=1, as_selection=False):
     """ 
-    Iterate through the image mappings and Check for cells with colored pixels (r>0,g>0,b>0)
+    Check the image for cells with colored pixels (r>0,g>0,b>0)
+
+    - Pixel arrays (from 'get_image_pixels') return [coordinates, pixel_values] (see 'select_pixels'), or the legacy dictionary mapping if 'as_dict' is True
+    - Pixel arrays treat any color channel > 'tolerance' as colored (use 'query_pixels' for counts and bounding boxes)
+    - 'workers' > 1 computes the mask of pixel arrays in row bands concurrently (0 = 1 worker per CPU core)
+    - Set 'as_selection' to True to get a compact PixelSelection of the colored pixels of pixel arrays instead (1 bit per image pixel plus the values of the selected pixels, see 'selection.PixelSelection')
+    - Legacy dictionary mappings are iterated through and return a dictionary of the colored cells; like pixel arrays, only
+    the color channels are compared
     """
+    # Check if a pixel array is provided
+    if isinstance(image_map, np.ndarray):
+        mask = get_pixel_mask(image_map, "colored", tolerance, workers)
+        if as_selection:
+            return PixelSelection.from_mask(mask, image_map)
+        return select_pixels(image_map, mask, as_dict)
+
     # Initialize Variables
     found_rows = {}
 
@@ -87,13 +629,8 @@ def get_colored_pixels(image_map):
         curr_row = coordinates[0]
         curr_col = coordinates[1]
 
-        # Get color values
-        R = img_pixels[0]
-        G = img_pixels[1]
-        B = img_pixels[2]
-
-        # Check for cells with colored pixels (r>0,g>0,b>0)
-        if not (img_pixels == [0,0,0]):
+        # Check for cells with colored pixels (r>0,g>0,b>0), ignoring alpha
+        if not is_black_values(img_pixels, tolerance):
             # print("{} = {}".format(coord, img_pixels))
             found_rows[curr_row, curr_col] = img_pixels
 
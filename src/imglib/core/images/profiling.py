@@ -0,0 +1,257 @@
+"""
+Opt-in profiling of the image functions
+- Functions decorated with '@profiled' (the I/O, pixel and translation functions) record the wall time, CPU time, pixels
+and bytes processed and, optionally, the peak allocation of every call while profiling is enabled
+- Records are aggregated per function into a summary report, and handed to the registered hooks as they are made
+- Disabled (the default), a profiled function costs a single flag check per call
+
+:: Usage
+- profiling.enable() ... profiling.format_summary() ... profiling.disable()
+- profiling.add_hook(lambda record: print(record)) to receive every record
+"""
+import os
+import sys
+import time
+import threading
+import tracemalloc
+from functools import wraps
+import numpy as np
+from PIL import Image
+
+# Profiling switch (see 'enable'/'disable')
+enabled = False
+
+# Record the peak allocation of calls through tracemalloc (see 'enable')
+trace_memory = False
+
+# Whether 'enable' started tracemalloc (so 'disable' leaves tracing started by other callers running)
+started_tracing = False
+
+# Callbacks receiving every record, in registration order
+hooks = []
+
+# Aggregated statistics, by function name
+stats = {}
+
+# Summed statistics of a function (besides 'peak_bytes', the maximum)
+SUMMED_KEYS = ("calls", "errors", "wall_s", "self_s", "cpu_s", "pixels", "bytes")
+
+# Lock guarding the aggregated statistics
+stats_lock = threading.Lock()
+
+# Stacks of the calls in progress, per thread
+call_stacks = threading.local()
+
+def enable(memory=False):
+    """
+    Enable profiling of the decorated functions
+
+    - memory : Also record the peak allocation of every call with tracemalloc; this slows the calls down, and only covers
+    Python and NumPy allocations (Pillow allocates its image buffers outside of tracemalloc)
+    """
+    global enabled, trace_memory, started_tracing
+    trace_memory = memory
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+        started_tracing = True
+    enabled = True
+
+def disable():
+    """
+    Disable profiling (the statistics recorded so far are kept)
+
+    - tracemalloc is only stopped if 'enable' started it
+    """
+    global enabled, started_tracing
+    enabled = False
+    if started_tracing and tracemalloc.is_tracing():
+        tracemalloc.stop()
+    started_tracing = False
+
+def reset():
+    """
+    Clear the statistics recorded so far
+    """
+    with stats_lock:
+        stats.clear()
+
+def add_hook(hook):
+    """
+    Register a callback called with the record (dictionary) of every profiled call (see 'profiled' for the keys)
+    """
+    hooks.append(hook)
+
+def remove_hook(hook):
+    """
+    Unregister a callback added with 'add_hook'
+    """
+    if hook in hooks:
+        hooks.remove(hook)
+
+def get_work_size(value):
+    """
+    Get the [pixels, bytes] held by an image, a pixel array or a file (0 if unknown)
+    """
+    if isinstance(value, Image.Image):
+        pixels = value.width * value.height
+        return [pixels, pixels * len(value.getbands())]
+    if isinstance(value, np.ndarray):
+        return [value.shape[0] * value.shape[1] if value.ndim >= 2 else value.size, value.nbytes]
+    if isinstance(value, (str, os.PathLike)) and os.path.isfile(value):
+        return [0, os.path.getsize(value)]
+    return [0, 0]
+
+def get_call_size(args, result):
+    """
+    Get the [pixels, bytes] processed by a call, from its first image/array/file argument or else from its result
+    """
+    # Obtain the size of the first argument holding any work
+    for value in args:
+        pixels, size = get_work_size(value)
+        if pixels > 0 or size > 0:
+            break
+
+    # Obtain the pixels from the result (i.e. the image of '[image, token, err_msg]')
+    if pixels == 0:
+        value = result[0] if isinstance(result, (list, tuple)) and len(result) > 0 else result
+        pixels = get_work_size(value)[0]
+
+    # Output/Return
+    return [pixels, size]
+
+def get_entry(name):
+    """
+    Get the aggregated statistics of the function, adding them if the function has none yet (call with the lock held)
+    """
+    if name not in stats:
+        stats[name] = {"calls" : 0, "errors" : 0, "wall_s" : 0.0, "self_s" : 0.0, "cpu_s" : 0.0, "pixels" : 0, "bytes" : 0, "peak_bytes" : 0}
+    return stats[name]
+
+def record_call(record):
+    """
+    Add the record of a call to the statistics and hand it to the hooks
+    """
+    with stats_lock:
+        entry = get_entry(record["name"])
+        entry["calls"] += 1
+        entry["errors"] += record["error"] != None
+        for key in SUMMED_KEYS[2:]:
+            entry[key] += record[key]
+        entry["peak_bytes"] = max(entry["peak_bytes"], record["peak_bytes"])
+
+    for hook in list(hooks):
+        hook(record)
+
+def profiled(function):
+    """
+    Decorator recording every call of the function while profiling is enabled
+
+    :: Notes
+    - The function is named after its module and qualified name (i.e. 'io.load_image')
+    - Records are dictionaries with the keys
+        - name : The function name
+        - wall_s : The wall time of the call, including the profiled functions it called
+        - self_s : The wall time spent outside of the profiled functions it called
+        - cpu_s : The CPU time of the process during the call (worker threads included)
+        - pixels : The pixels processed (of the first image/pixel array argument, or of the image returned)
+        - bytes : The bytes processed (of the first image/pixel array argument, or the size of the file read)
+        - peak_bytes : The peak allocation during the call (0 unless memory tracing is enabled)
+        - depth : The number of profiled calls the call is nested in
+        - error : The exception raised by the call, or None
+    """
+    # Initialize Variables
+    name = "{}.{}".format(function.__module__.rsplit(".", 1)[-1], function.__qualname__)
+
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        # Call through when profiling is disabled
+        if not enabled:
+            return function(*args, **kwargs)
+
+        # Obtain the calls in progress on this thread
+        stack = getattr(call_stacks, "stack", None)
+        if stack is None:
+            stack = call_stacks.stack = []
+
+        # Hand the peak allocation so far over to the parent call, and measure this call from here
+        memory = trace_memory and tracemalloc.is_tracing()
+        if memory:
+            current_bytes, peak_bytes = tracemalloc.get_traced_memory()
+            if len(stack) > 0:
+                stack[-1]["peak_bytes"] = max(stack[-1]["peak_bytes"], peak_bytes - stack[-1]["start_bytes"])
+            tracemalloc.reset_peak()
+
+        # Initialize Variables
+        frame = {"children_s" : 0.0, "peak_bytes" : 0, "start_bytes" : current_bytes if memory else 0}
+        result = None
+        error = None
+        stack.append(frame)
+        start_cpu = time.process_time()
+        start = time.perf_counter()
+
+        try:
+            result = function(*args, **kwargs)
+            return result
+        except BaseException as ex:
+            error = ex
+            raise
+        finally:
+            # Measure the call
+            wall_s = time.perf_counter() - start
+            cpu_s = time.process_time() - start_cpu
+            stack.pop()
+            if memory:
+                frame["peak_bytes"] = max(frame["peak_bytes"], tracemalloc.get_traced_memory()[1] - frame["start_bytes"])
+                if len(stack) > 0:
+                    stack[-1]["peak_bytes"] = max(stack[-1]["peak_bytes"], frame["peak_bytes"] + frame["start_bytes"] - stack[-1]["start_bytes"])
+            if len(stack) > 0:
+                stack[-1]["children_s"] += wall_s
+
+            # Record the call
+            pixels, size = get_call_size(args, result)
+            record_call({
+                "name" : name,
+                "wall_s" : wall_s,
+                "self_s" : wall_s - frame["children_s"],
+                "cpu_s" : cpu_s,
+                "pixels" : pixels,
+                "bytes" : size,
+                "peak_bytes" : frame["peak_bytes"],
+                "depth" : len(stack),
+                "error" : error,
+            })
+
+    return wrapper
+
+def get_summary():
+    """
+    Get a copy of the statistics recorded so far: {name : {calls, errors, wall_s, self_s, cpu_s, pixels, bytes, peak_bytes}}
+    """
+    with stats_lock:
+        return {name : dict(entry) for name, entry in stats.items()}
+
+def merge_summary(summary):
+    """
+    Add the statistics of another summary (i.e. of a worker process, from 'get_summary') to the statistics of this process
+    """
+    with stats_lock:
+        for name, other in summary.items():
+            entry = get_entry(name)
+            for key in SUMMED_KEYS:
+                entry[key] += other[key]
+            entry["peak_bytes"] = max(entry["peak_bytes"], other["peak_bytes"])
+
+def format_summary(summary=None):
+    """
+    Format the statistics (of this process if not provided) as a report table, slowest functions (by self time) first
+    """
+    # Initialize Variables
+    summary = get_summary() if summary is None else summary
+    lines = ["{:<48} {:>7} {:>10} {:>10} {:>10} {:>10} {:>10} {:>10}".format("Function", "Calls", "Wall (s)", "Self (s)", "CPU (s)", "MP/s", "MB", "Peak MB")]
+
+    for name, entry in sorted(summary.items(), key=lambda item: item[1]["self_s"], reverse=True):
+        mpps = entry["pixels"] / 1e6 / entry["wall_s"] if entry["wall_s"] > 0 else 0
+        lines.append("{:<48} {:>7} {:>10.3f} {:>10.3f} {:>10.3f} {:>10.2f} {:>10.1f} {:>10.1f}".format(name, entry["calls"], entry["wall_s"], entry["self_s"], entry["cpu_s"], mpps, entry["bytes"] / 2**20, entry["peak_bytes"] / 2**20))
+
+    # Output/Return
+    return "\n".join(lines)
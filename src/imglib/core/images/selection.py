@@ -0,0 +1,234 @@
+"""
+Compact pixel selections
+- PixelSelection : A set of selected pixels (i.e. the black or colored pixels of an image) stored as a packed bitmap of
+1 bit per pixel of the image, optionally with the values of the selected pixels packed alongside
+- Replaces the legacy dictionary mapping of {(x, y) : [r,g,b]}, which costs a tuple key and a list value (200+ bytes) per
+selected pixel, with at most 1/8 byte per image pixel plus C bytes per selected pixel
+"""
+import os
+import sys
+import numpy as np
+from PIL import Image
+
+# Number of set bits of every byte value
+BIT_COUNTS = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+class PixelSelection:
+    """
+    A set of selected pixels of a (width, height) image, stored as a packed bitmap
+
+    :: Params
+    - bits : The (H, ceil(W / 8)) uint8 bitmap, 8 pixels per byte with the left-most pixel in the highest bit (the layout
+    of Pillow's bilevel '1' mode)
+    - size : The (width, height) of the image
+    - values : The (N, C) uint8 pixel values of the selected pixels in row-major order (optional)
+
+    :: Notes
+    - Pixels are (x, y) coordinates, as in the legacy dictionary mapping; selections iterate through them row by row
+    - Supports len()/count(), 'in', iteration, items() (like the legacy mapping, if the values are kept), union (|),
+    intersection (&) and difference (-), bounding boxes and conversion back to boolean masks and Pillow mask images
+    - Set operations keep the values of the pixels when both selections have values with the same channels
+    """
+    def __init__(self, bits, size, values=None):
+        # Initialize Variables
+        self.bits = bits
+        self.size = tuple(size)
+        self.values = values
+
+    @classmethod
+    def from_mask(cls, mask, pixel_array=None):
+        """
+        Build a selection from a boolean (H, W) mask, keeping the values of the selected pixels of the pixel array if provided
+        """
+        # Initialize Variables
+        height, width = mask.shape
+        values = None
+
+        # Keep the values of the selected pixels
+        if pixel_array is not None:
+            values = np.ascontiguousarray(pixel_array[:height, :width][mask])
+
+        # Output/Return
+        return cls(np.packbits(mask, axis=1), (width, height), values)
+
+    @classmethod
+    def from_coordinates(cls, coordinates, size):
+        """
+        Build a selection of the (x, y) coordinates (an (N, 2) array or a sequence of pairs) of a (width, height) image
+        """
+        # Initialize Variables
+        width, height = size
+        mask = np.zeros((height, width), dtype=bool)
+
+        # Set the selected pixels
+        coordinates = np.asarray(coordinates, dtype=np.intp).reshape(-1, 2)
+        mask[coordinates[:, 1], coordinates[:, 0]] = True
+
+        # Output/Return
+        return cls.from_mask(mask)
+
+    def __len__(self):
+        return self.count()
+
+    def __repr__(self):
+        return "PixelSelection(size={}, count={}, nbytes={})".format(self.size, self.count(), self.nbytes)
+
+    def __eq__(self, other):
+        if not isinstance(other, PixelSelection):
+            return NotImplemented
+        return self.size == other.size and np.array_equal(self.bits, other.bits)
+
+    def __contains__(self, pixel):
+        x, y = pixel
+        if not (0 <= x < self.size[0] and 0 <= y < self.size[1]):
+            return False
+        return bool(self.bits[y, x >> 3] >> (7 - (x & 7)) & 1)
+
+    def __iter__(self):
+        """
+        Iterate through the (x, y) coordinates of the selected pixels row by row, unpacking 1 row at a time
+        """
+        for y in np.flatnonzero(self.bits.any(axis=1)).tolist():
+            for x in np.flatnonzero(np.unpackbits(self.bits[y], count=self.size[0])).tolist():
+                yield (x, y)
+
+    def __or__(self, other):
+        return self.union(other)
+
+    def __and__(self, other):
+        return self.intersection(other)
+
+    def __sub__(self, other):
+        return self.difference(other)
+
+    @property
+    def nbytes(self):
+        """
+        The number of bytes held by the bitmap and the pixel values
+        """
+        return self.bits.nbytes + (self.values.nbytes if self.values is not None else 0)
+
+    def count(self):
+        """
+        Count the selected pixels (from the bit counts of the bitmap, without unpacking it)
+        """
+        return int(BIT_COUNTS[self.bits].sum(dtype=np.int64))
+
+    def items(self):
+        """
+        Iterate through the ((x, y), [r,g,b(,a)]) pairs of the selected pixels, like the items of the legacy dictionary mapping
+
+        - Raises ValueError if the selection does not keep the pixel values
+        """
+        if self.values is None:
+            raise ValueError("Pixel selection does not keep the pixel values")
+        return zip(self, iter(self.values.tolist()))
+
+    def to_mask(self):
+        """
+        Unpack the selection into a boolean (H, W) mask
+        """
+        return np.unpackbits(self.bits, axis=1, count=self.size[0]).view(bool)
+
+    def to_image(self):
+        """
+        Get the selection as a bilevel ('1' mode) Pillow image, usable as the mask of Image.paste() and Image.composite()
+
+        - The bitmap is Pillow's '1' mode layout already, so it is not unpacked
+        """
+        return Image.frombytes("1", self.size, self.bits.tobytes())
+
+    def get_coordinates(self):
+        """
+        Get the (N, 2) array of the (x, y) coordinates of the selected pixels, in row-major order (see 'pixels.select_pixels')
+        """
+        rows, cols = np.nonzero(self.to_mask())
+        return np.column_stack((cols, rows))
+
+    def get_bbox(self):
+        """
+        Get the bounding box (left, upper, right, lower) of the selected pixels, or None if none are selected
+
+        - Computed from the packed bitmap: the occupied rows, then the OR of the occupied rows unpacked once
+        """
+        # Obtain the rows holding at least 1 selected pixel
+        rows = np.flatnonzero(self.bits.any(axis=1))
+        if rows.size == 0:
+            return None
+
+        # Obtain the columns holding at least 1 selected pixel
+        cols = np.flatnonzero(np.unpackbits(np.bitwise_or.reduce(self.bits[rows[0]:rows[-1] + 1], axis=0), count=self.size[0]))
+
+        # Output/Return
+        return (int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1)
+
+    def to_pixel_array(self, fill=0):
+        """
+        Scatter the values of the selected pixels into an (H, W, C) uint8 pixel array, the other pixels being 'fill'
+
+        - Raises ValueError if the selection does not keep the pixel values
+        """
+        if self.values is None:
+            raise ValueError("Pixel selection does not keep the pixel values")
+
+        # Initialize Variables
+        width, height = self.size
+        pixel_array = np.full((height, width, self.values.shape[1]), fill, dtype=np.uint8)
+
+        # Write the values into their pixels
+        pixel_array[self.to_mask()] = self.values
+
+        # Output/Return
+        return pixel_array
+
+    def check_size(self, other):
+        """
+        Check the other selection is of an image of the same size
+        """
+        if self.size != other.size:
+            raise ValueError("Pixel selections of different sizes: {} and {}".format(self.size, other.size))
+
+    def combine(self, other, bits):
+        """
+        Build the selection of the combined bitmap of this and the other selection, keeping the pixel values where both
+        selections keep values with the same channels (taken from this selection where both hold a pixel)
+        """
+        # Check if the values can be kept
+        if self.values is None or other.values is None or self.values.shape[1] != other.values.shape[1]:
+            return PixelSelection(bits, self.size)
+
+        # Initialize Variables
+        width = self.size[0]
+        mask = np.unpackbits(bits, axis=1, count=width).view(bool)
+        self_mask = self.to_mask()
+        other_mask = other.to_mask()
+        values = np.empty((int(np.count_nonzero(mask)), self.values.shape[1]), dtype=np.uint8)
+
+        # Take the values from this selection, and the rest from the other selection
+        from_self = self_mask[mask]
+        values[from_self] = self.values[mask[self_mask]]
+        values[~from_self] = other.values[(mask & ~self_mask)[other_mask]]
+
+        # Output/Return
+        return PixelSelection(bits, self.size, values)
+
+    def union(self, other):
+        """
+        Get the selection of the pixels selected by either selection
+        """
+        self.check_size(other)
+        return self.combine(other, self.bits | other.bits)
+
+    def intersection(self, other):
+        """
+        Get the selection of the pixels selected by both selections
+        """
+        self.check_size(other)
+        return self.combine(other, self.bits & other.bits)
+
+    def difference(self, other):
+        """
+        Get the selection of the pixels selected by this selection but not the other
+        """
+        self.check_size(other)
+        return self.combine(other, self.bits & ~other.bits)
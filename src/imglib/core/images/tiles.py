@@ -0,0 +1,636 @@
+"""
+Tiled/Streaming image processing functions for images too large to be decoded in memory at once
+"""
+import os
+import sys
+import struct
+import zlib
+import warnings
+from io import BytesIO
+import numpy as np
+from PIL import Image, TiffImagePlugin
+
+# PNG color types and channel counts of the color modes that can be streamed into a PNG
+PNG_MODES = {
+    "L" : (0, 1),
+    "RGB" : (2, 3),
+    "LA" : (4, 2),
+    "RGBA" : (6, 4),
+}
+
+# Channel counts of the PNG color types
+PNG_CHANNELS = {0 : 1, 2 : 3, 3 : 1, 4 : 2, 6 : 4}
+
+# TIFF tags describing how the pixels of a strip are encoded, copied into the single-strip TIFF of every strip decoded
+# (width, bits per sample, compression, photometric interpretation, fill order, samples per pixel, planar configuration,
+# T4/T6 options, predictor, color map, extra samples, sample format, JPEG tables, YCbCr coefficients/subsampling, reference black/white)
+TIFF_STRIP_TAGS = (256, 258, 259, 262, 266, 277, 284, 292, 293, 317, 320, 338, 339, 347, 529, 530, 532)
+
+# Raw modes that can be viewed as (H, W, C) uint8 pixel arrays without copying: (bytes per pixel, channel slice, color mode)
+RAW_LAYOUTS = {
+    "L" : (1, slice(0, 1), "L"),
+    "LA" : (2, slice(0, 2), "LA"),
+    "RGB" : (3, slice(0, 3), "RGB"),
+    "BGR" : (3, slice(2, None, -1), "RGB"),
+    "RGBA" : (4, slice(0, 4), "RGBA"),
+    "RGBX" : (4, slice(0, 3), "RGB"),
+    "BGRX" : (4, slice(2, None, -1), "RGB"),
+}
+
+# Color modes whose raw pixels Pillow can use in place (the image is backed by the file mapping instead of a copy)
+PILLOW_MAPPED_MODES = ("L", "P", "RGBX", "RGBA", "RGBa", "CMYK", "I;16", "I;16L", "I;16B")
+
+class TileStream:
+    """
+    A lazily evaluated, single-pass stream of image tiles
+
+    - Iterating over the stream yields (box, tile_image) pairs in row-major order, 'box' being the (left, upper, right, lower)
+    position of the tile in the full image
+    - Only the tiles being processed are held in memory
+    """
+    def __init__(self, size, mode, tiles):
+        self.size = size
+        self.mode = mode
+        self.tiles = tiles
+
+    def __iter__(self):
+        return iter(self.tiles)
+
+    def map(self, operation, mode=None):
+        """
+        Lazily apply an operation to every tile, returning the stream of transformed tiles
+
+        - 'operation' takes a tile image and returns the transformed tile image (of the same size)
+        - 'mode' is the color mode of the transformed tiles (the mode of this stream if not provided)
+        """
+        return TileStream(self.size, mode or self.mode, ((box, operation(tile)) for box, tile in self))
+
+def get_tile_boxes(width, height, tile_height=512, tile_width=0):
+    """
+    Split an image into boxes (left, upper, right, lower) in row-major order
+
+    - Tiles are full-width strips 'tile_height' rows tall, split further into columns 'tile_width' wide if provided
+    """
+    # Initialize Variables
+    tile_width = tile_width if tile_width > 0 else width
+
+    return [
+        (left, upper, min(left + tile_width, width), min(upper + tile_height, height))
+        for upper in range(0, height, tile_height)
+        for left in range(0, width, tile_width)
+    ]
+
+def get_raw_tiles(input_image):
+    """
+    Get the descriptors [extents, offset, rawmode, stride, orientation] of the uncompressed tiles of an opened (not yet loaded) image
+
+    - Returns None if any part of the image is compressed (or otherwise not decodable row by row)
+    """
+    # Initialize Variables
+    raw_tiles = []
+
+    # Palette images would need their palette copied into every tile
+    if input_image.mode in ("P", "PA"):
+        return None
+
+    # Iterate through the tile descriptors set up by the image plugin
+    for codec, extents, offset, args in input_image.tile:
+        if codec != "raw":
+            return None
+
+        # Unpack the raw decoder arguments (rawmode, stride, orientation)
+        if isinstance(args, str):
+            args = (args,)
+        rawmode, stride, orientation = (tuple(args) + (0, 1))[:3]
+
+        # Compute the size of packed rows
+        if stride <= 0:
+            try:
+                stride = len(Image.new(input_image.mode, (extents[2] - extents[0], 1)).tobytes("raw", rawmode))
+            except ValueError:
+                return None
+
+        raw_tiles.append([extents, offset, rawmode, stride, orientation])
+
+    # Output/Return
+    return raw_tiles
+
+def read_raw_strip(fp, mode, raw_tiles, width, upper, lower):
+    """
+    Decode the rows [upper, lower) of an image from its uncompressed tiles, reading only those rows from the file
+    """
+    # Initialize Variables
+    strip = Image.new(mode, (width, lower - upper))
+
+    # Iterate through the tiles overlapping the strip
+    for (x0, y0, x1, y1), offset, rawmode, stride, orientation in raw_tiles:
+        first = max(upper, y0) - y0
+        last = min(lower, y1) - y0
+        if first >= last:
+            continue
+
+        # Bottom-up tiles store their last row first
+        file_row = first if orientation >= 0 else (y1 - y0) - last
+
+        # Read and decode only the rows of the strip
+        fp.seek(offset + file_row * stride)
+        data = fp.read((last - first) * stride)
+        part = Image.frombytes(mode, (x1 - x0, last - first), data, "raw", rawmode, stride, orientation)
+
+        # Place the rows into the strip
+        strip.paste(part, (x0, y0 + first - upper))
+
+    # Output/Return
+    return strip
+
+def get_png_layout(input_image):
+    """
+    Get the number of bytes of the filtered scanlines (filter type byte included) of an opened (not yet loaded) PNG image
+    that can be decoded row by row: 8 bits per channel, not interlaced, and decoded by Pillow into its own color mode
+
+    - Returns None otherwise
+    """
+    # Check the image is a PNG decoded by Pillow's PNG decoder in a single pass
+    if input_image.format != "PNG" or len(input_image.tile) != 1 or input_image.tile[0][0] != "zip":
+        return None
+    args = input_image.tile[0][3]
+    rawmode = args if isinstance(args, str) else args[0]
+
+    # Read the bit depth, color type and interlace method of the header
+    input_image.fp.seek(8)
+    header = input_image.fp.read(8 + 13)
+    if len(header) < 21 or header[4:8] != b"IHDR":
+        return None
+    width, height, bit_depth, color_type, compression, filter_method, interlace = struct.unpack(">IIBBBBB", header[8:21])
+
+    # Check the scanlines unpack into the color mode as is
+    if bit_depth != 8 or interlace != 0 or color_type not in PNG_CHANNELS or rawmode != input_image.mode:
+        return None
+
+    # Output/Return
+    return width * PNG_CHANNELS[color_type] + 1
+
+def iter_png_data(fp, max_length=2**20):
+    """
+    Iterate through the decompressed (still filtered) scanline data of a PNG file, in blocks of at most 'max_length' bytes
+    """
+    # Initialize Variables
+    decompressor = zlib.decompressobj()
+    fp.seek(8)
+
+    # Iterate through the chunks, decompressing the image data chunks
+    while True:
+        header = fp.read(8)
+        if len(header) < 8:
+            break
+        length, chunk_type = struct.unpack(">I4s", header)
+        if chunk_type == b"IEND":
+            break
+        if chunk_type != b"IDAT":
+            fp.seek(length + 4, os.SEEK_CUR)
+            continue
+
+        # Decompress the chunk in bounded blocks (a small chunk can decompress into many rows)
+        data = fp.read(length)
+        fp.seek(4, os.SEEK_CUR)
+        while data:
+            block = decompressor.decompress(data, max_length)
+            data = decompressor.unconsumed_tail
+            if block:
+                yield block
+
+    # Hand out whatever the decompressor still holds
+    block = decompressor.flush()
+    if block:
+        yield block
+
+def generate_png_strips(input_image, strip_rows, row_bytes):
+    """
+    Decode the strips of rows [upper, lower) of an opened PNG image in order, decompressing and unfiltering only the
+    scanlines of the current strip (see 'get_png_layout')
+
+    - The scanlines are unfiltered by Pillow's PNG decoder: the previous row, already unfiltered (filter type 'None'), is fed
+    in ahead of the rows of the strip, so the 'Up', 'Average' and 'Paeth' filters of the 1st row refer to it
+    """
+    # Initialize Variables
+    width = input_image.size[0]
+    mode = input_image.mode
+    palette = input_image.palette if mode == "P" else None
+    data = iter_png_data(input_image.fp)
+    buffer = bytearray()
+    prior_row = bytes(row_bytes - 1)
+
+    for upper, lower in strip_rows:
+        # Gather the filtered scanlines of the strip
+        size = (lower - upper) * row_bytes
+        while len(buffer) < size:
+            block = next(data, None)
+            if block == None:
+                raise OSError("Truncated PNG image data")
+            buffer += block
+        rows = bytes(buffer[:size])
+        del buffer[:size]
+
+        # Unfilter the scanlines behind the previous row, and drop the previous row
+        strip = Image.frombytes(mode, (width, lower - upper + 1), zlib.compress(b"\x00" + prior_row + rows, 0), "zip", mode)
+        strip = strip.crop((0, 1, width, lower - upper + 1))
+        prior_row = strip.crop((0, lower - upper - 1, width, lower - upper)).tobytes()
+
+        # Carry the palette (read from the header, as 'getpalette()' would load the whole image) and the transparent color over to the strip
+        if palette != None:
+            strip.putpalette(palette.palette, palette.rawmode or palette.mode)
+        if "transparency" in input_image.info:
+            strip.info["transparency"] = input_image.info["transparency"]
+
+        yield strip
+
+def get_tiff_layout(input_image):
+    """
+    Get the layout [header, offsets, byte_counts, rows_per_strip] of the compressed strips of an opened (not yet loaded)
+    TIFF image that can be decoded strip by strip: classic (not Big) TIFF, stored in strips (not tiles) of interleaved channels
+
+    - Returns None otherwise
+    """
+    # Check the image is a TIFF decoded by libtiff (uncompressed TIFFs are read through their raw tiles)
+    if input_image.format != "TIFF" or len(input_image.tile) != 1 or input_image.tile[0][0] != "libtiff":
+        return None
+
+    # Check the strips are the only pixel storage, with interleaved channels
+    tags = input_image.tag_v2
+    if 273 not in tags or 279 not in tags or 322 in tags or tags.get(284, 1) != 1:
+        return None
+
+    # Check the byte order of the file header
+    input_image.fp.seek(0)
+    prefix = input_image.fp.read(4)
+    if prefix not in (b"II*\x00", b"MM\x00*"):
+        return None
+    header = prefix + struct.pack("<I" if prefix[:2] == b"II" else ">I", 8)
+
+    # Check there is a strip for every 'rows_per_strip' rows
+    height = input_image.size[1]
+    rows_per_strip = min(tags.get(278, height), height)
+    offsets = tags[273]
+    byte_counts = tags[279]
+    if len(offsets) != len(byte_counts) or len(offsets) != (height + rows_per_strip - 1) // rows_per_strip:
+        return None
+
+    # Output/Return
+    return [header, offsets, byte_counts, rows_per_strip]
+
+def read_tiff_strip(input_image, tiff_layout, index):
+    """
+    Decode a single compressed strip of an opened TIFF image, wrapping its data into a single-strip TIFF decoded by libtiff
+    """
+    # Initialize Variables
+    header, offsets, byte_counts, rows_per_strip = tiff_layout
+    tags = input_image.tag_v2
+    rows = min(rows_per_strip, input_image.size[1] - index * rows_per_strip)
+
+    # Read the compressed data of the strip
+    input_image.fp.seek(offsets[index])
+    data = input_image.fp.read(byte_counts[index])
+
+    # Describe the strip with the encoding tags of the image (the strip offset is relative to the end of the directory)
+    ifd = TiffImagePlugin.ImageFileDirectory_v2(header)
+    for tag in TIFF_STRIP_TAGS:
+        if tag in tags:
+            ifd[tag] = tags[tag]
+            ifd.tagtype[tag] = tags.tagtype[tag]
+    ifd[257] = rows
+    ifd[278] = rows
+    ifd[273] = (0,)
+    ifd[279] = (len(data),)
+
+    # Decode the single-strip TIFF
+    with Image.open(BytesIO(header + ifd.tobytes(8) + data)) as strip_image:
+        strip_image.load()
+        return strip_image.copy()
+
+def generate_tiff_strips(input_image, strip_rows, tiff_layout):
+    """
+    Decode the strips of rows [upper, lower) of an opened TIFF image in order, decoding only the compressed strips of the
+    file overlapping them (see 'get_tiff_layout')
+
+    - The last strip of the file decoded is kept, as it can overlap the next strip of rows
+    """
+    # Initialize Variables
+    width = input_image.size[0]
+    rows_per_strip = tiff_layout[3]
+    palette = input_image.palette if input_image.mode in ("P", "PA") else None
+    cached_index = None
+    cached_strip = None
+
+    for upper, lower in strip_rows:
+        # Initialize Variables
+        strip = Image.new(input_image.mode, (width, lower - upper))
+        if palette != None:
+            strip.putpalette(palette.palette, palette.rawmode or palette.mode)
+
+        # Paste the rows of the file strips overlapping the strip of rows
+        for index in range(upper // rows_per_strip, (lower - 1) // rows_per_strip + 1):
+            if index != cached_index:
+                cached_index = index
+                cached_strip = read_tiff_strip(input_image, tiff_layout, index)
+            strip.paste(cached_strip, (0, index * rows_per_strip - upper))
+
+        yield strip
+
+def get_strips(input_image, strip_rows):
+    """
+    Get the iterator decoding the strips of rows [upper, lower) of an opened (not yet loaded) image in order, reading only
+    the rows of the current strip from the file when the format allows it
+
+    - Uncompressed images (BMP, PPM/PGM, raw TIFF strips, TGA), 8-bit non-interlaced PNG and compressed TIFF strips are
+    decoded strip by strip
+    - Other images (i.e. JPEG, interlaced or 16-bit PNG, tiled TIFF) are decoded whole, with a warning, on the first strip
+    """
+    # Initialize Variables
+    width = input_image.size[0]
+
+    # Uncompressed images
+    raw_tiles = get_raw_tiles(input_image)
+    if raw_tiles != None:
+        return (read_raw_strip(input_image.fp, input_image.mode, raw_tiles, width, upper, lower) for upper, lower in strip_rows)
+
+    # PNG images
+    row_bytes = get_png_layout(input_image)
+    if row_bytes != None:
+        return generate_png_strips(input_image, strip_rows, row_bytes)
+
+    # Compressed TIFF strips
+    tiff_layout = get_tiff_layout(input_image)
+    if tiff_layout != None:
+        return generate_tiff_strips(input_image, strip_rows, tiff_layout)
+
+    # Decode the whole image once (on the first strip) and hand out the strips from the decoded image
+    warnings.warn("Image '{}' ({}) cannot be decoded strip by strip; it is decoded whole".format(getattr(input_image, "filename", ""), input_image.format), RuntimeWarning, stacklevel=3)
+    return (input_image.crop((0, upper, width, lower)) for upper, lower in strip_rows)
+
+def generate_tiles(input_image, boxes, strips):
+    """
+    Generate the (box, tile_image) pairs of an opened image from the iterator of its decoded strips (1 per row range of
+    the boxes, in order; see 'get_strips'), closing the image once the tiles are generated
+    """
+    # Initialize Variables
+    width = input_image.size[0]
+    strip = None
+    strip_rows = None
+
+    try:
+        for box in boxes:
+            # Decode the strip of rows holding the tile (tiles of the same strip share it)
+            if strip_rows != (box[1], box[3]):
+                strip_rows = (box[1], box[3])
+                strip = next(strips)
+
+            # Cut the tile out of the strip
+            if box[2] - box[0] == width:
+                yield box, strip
+            else:
+                yield box, strip.crop((box[0], 0, box[2], box[3] - box[1]))
+    finally:
+        input_image.close()
+
+def open_tiles(img_fname, tile_height=512, tile_width=0):
+    """
+    Open an image as a TileStream of lazily decoded tiles
+
+    :: Params
+    - tile_height : The number of rows per tile
+    - tile_width : The number of columns per tile; tiles span the full width if not provided
+
+    :: Notes
+    - Only the file header is read here, the tiles are decoded as the stream is iterated through
+    - Uncompressed images (BMP, PPM/PGM, raw TIFF strips, TGA), 8-bit non-interlaced PNG (the usual gigapixel maps) and
+    compressed TIFF strips are read strip by strip, so peak memory is bounded by the tile size (and, for TIFF, the size of
+    the strips of the file)
+    - Other images (JPEG, interlaced or 16-bit PNG, tiled TIFF...) cannot be decoded partially; they are decoded whole when the
+    first tile is requested, with a RuntimeWarning, and the tiles are cut from the decoded image
+    - The image file is closed once the stream is exhausted (or closed)
+    """
+    # Open the image (header only)
+    input_image = Image.open(img_fname)
+    width, height = input_image.size
+
+    # Obtain the tile layout and the strips of rows to decode
+    boxes = get_tile_boxes(width, height, tile_height, tile_width)
+    strips = get_strips(input_image, list(dict.fromkeys((box[1], box[3]) for box in boxes)))
+
+    # Output/Return
+    return TileStream(input_image.size, input_image.mode, generate_tiles(input_image, boxes, strips))
+
+def get_raw_region(input_image):
+    """
+    Get the descriptor [offset, rawmode, stride, orientation] of an opened image stored as a single uncompressed region
+    (i.e. BMP, PPM/PGM, TGA, or TIFF with contiguous raw strips), or None if it is not
+    """
+    # Obtain the uncompressed tiles of the image
+    raw_tiles = get_raw_tiles(input_image)
+    if raw_tiles is None or len(raw_tiles) == 0:
+        return None
+
+    # Initialize Variables
+    width = input_image.size[0]
+    (x0, y0, x1, y1), offset, rawmode, stride, orientation = raw_tiles[0]
+    end = offset + (y1 - y0) * stride
+
+    # Check every tile is a full-width strip following the previous one in the file
+    for (x0, y0, x1, y1), tile_offset, tile_rawmode, tile_stride, tile_orientation in raw_tiles:
+        if (x0, x1) != (0, width) or (tile_rawmode, tile_stride, tile_orientation) != (rawmode, stride, orientation):
+            return None
+        if tile_offset != offset and (orientation < 0 or tile_offset != end):
+            return None
+        end = tile_offset + (y1 - y0) * stride
+
+    # Output/Return
+    return [offset, rawmode, stride, orientation]
+
+def is_pillow_mappable(input_image):
+    """
+    Check if Pillow backs an opened (not yet loaded) image with a memory map of its file when it is loaded: a single
+    uncompressed region whose raw mode is the color mode (see 'PILLOW_MAPPED_MODES')
+    """
+    # Check the image is a single uncompressed region read from a file
+    if len(input_image.tile) != 1 or input_image.tile[0][0] != "raw" or not getattr(input_image, "filename", None):
+        return False
+
+    # Check the raw mode is the color mode
+    args = input_image.tile[0][3]
+    rawmode = args if isinstance(args, str) else args[0]
+    return rawmode == input_image.mode and input_image.mode in PILLOW_MAPPED_MODES
+
+def map_raw_pixels(img_fname, writable=False, mode=None, size=None, offset=0):
+    """
+    Memory-map the pixels of an uncompressed image file as an (H, W, C) uint8 pixel array view, without reading or copying them
+
+    :: Params
+    - writable : Map the file copy-on-write, so the array can be written to (the written pages are copied privately and
+    the file is never modified); the array is read-only otherwise
+    - mode, size, offset : The raw mode (see 'RAW_LAYOUTS'), (width, height) and byte offset of a headerless raw dump; the
+    layout is read from the image header if not provided
+
+    :: Notes
+    - Channels are viewed in RGB(A) order and bottom-up images upright through strides (i.e. BGR bitmaps), so no pixels are copied
+    - Pages are read from the page cache as they are accessed; several processes mapping the same file share 1 copy
+    - Raises ValueError if the image is not stored as a single uncompressed region of a supported raw mode
+    """
+    # Obtain the layout of the pixels
+    if mode != None:
+        # Headerless raw dump
+        if size == None:
+            raise ValueError("Raw dumps need a size")
+        width, height = size
+        rawmode, stride, orientation = mode, 0, 1
+    else:
+        # Image header
+        with Image.open(img_fname) as input_image:
+            width, height = input_image.size
+            region = get_raw_region(input_image)
+        if region == None:
+            raise ValueError("Image '{}' is not stored as a single uncompressed region".format(img_fname))
+        offset, rawmode, stride, orientation = region
+
+    # Check the raw mode can be viewed as a pixel array
+    if rawmode not in RAW_LAYOUTS:
+        raise ValueError("Invalid raw mode for mapping: {}".format(rawmode))
+    pixel_bytes, channels, pixel_mode = RAW_LAYOUTS[rawmode]
+    stride = stride if stride > 0 else width * pixel_bytes
+
+    # Map the rows of the image
+    mapped = np.memmap(img_fname, dtype=np.uint8, mode="c" if writable else "r", offset=offset, shape=(max(0, (height - 1) * stride + width * pixel_bytes),))
+    pixel_array = np.lib.stride_tricks.as_strided(mapped, shape=(height, width, pixel_bytes), strides=(stride, pixel_bytes, 1), writeable=writable)
+
+    # View bottom-up images upright and the channels in RGB(A) order
+    if orientation < 0:
+        pixel_array = pixel_array[::-1]
+
+    # Output/Return
+    return pixel_array[..., channels]
+
+def iter_strips(tile_stream):
+    """
+    Iterate through a TileStream strip by strip, yielding (upper, strip_image) pairs of full-width strips
+
+    - Tiles of the same strip are pasted together, so at most 1 strip is held in memory
+    """
+    # Initialize Variables
+    width = tile_stream.size[0]
+    strip = None
+    strip_rows = None
+
+    for box, tile in tile_stream:
+        # Check if the tile spans the full width
+        if box[0] == 0 and box[2] == width:
+            yield box[1], tile
+            continue
+
+        # Start a new strip
+        if strip_rows != (box[1], box[3]):
+            strip_rows = (box[1], box[3])
+            strip = Image.new(tile.mode, (width, box[3] - box[1]))
+
+        # Paste the tile into the strip, and hand out the strip once its last tile is in
+        strip.paste(tile, (box[0], 0))
+        if box[2] == width:
+            yield box[1], strip
+
+def write_png_chunk(fp, chunk_type, data):
+    """
+    Write a PNG chunk (length, type, data, CRC) to the file
+    """
+    fp.write(struct.pack(">I", len(data)))
+    fp.write(chunk_type)
+    fp.write(data)
+    fp.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+
+def get_stream_mode(mode, stream_modes):
+    """
+    Get the color mode the tiles of the given mode are converted to before being written into a streamed file format
+    """
+    if mode in stream_modes:
+        return mode
+    if mode in ("1", "I", "F") or mode.startswith("I;16"):
+        return "L"
+    if mode in ("PA", "La", "RGBa") or mode.endswith("A"):
+        return "RGBA" if "RGBA" in stream_modes else "RGB"
+    return "RGB"
+
+def write_png_tiles(tile_stream, fp, compress_level=6):
+    """
+    Write a TileStream into a PNG file incrementally, strip by strip
+
+    - Rows are written with the 'Sub' filter and compressed as they arrive, so only 1 strip is held in memory
+    """
+    # Initialize Variables
+    width, height = tile_stream.size
+    mode = get_stream_mode(tile_stream.mode, PNG_MODES)
+    color_type, channels = PNG_MODES[mode]
+    compressor = zlib.compressobj(compress_level)
+
+    # Write the PNG signature and header
+    fp.write(b"\x89PNG\r\n\x1a\n")
+    write_png_chunk(fp, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0))
+
+    for upper, strip in iter_strips(tile_stream):
+        # Obtain the rows of the strip
+        if strip.mode != mode:
+            strip = strip.convert(mode)
+        rows = np.asarray(strip).reshape(strip.size[1], width * channels)
+
+        # Apply the 'Sub' filter (difference to the pixel on the left, wrapping around 256)
+        filtered = np.empty((rows.shape[0], rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 1
+        filtered[:, 1:channels + 1] = rows[:, :channels]
+        np.subtract(rows[:, channels:], rows[:, :-channels], out=filtered[:, channels + 1:])
+
+        # Compress the rows and write out whatever the compressor produced
+        data = compressor.compress(filtered.tobytes())
+        if data:
+            write_png_chunk(fp, b"IDAT", data)
+
+    # Flush the compressor and close the file
+    write_png_chunk(fp, b"IDAT", compressor.flush())
+    write_png_chunk(fp, b"IEND", b"")
+
+def write_ppm_tiles(tile_stream, fp):
+    """
+    Write a TileStream into a binary PPM (RGB) or PGM (L) file incrementally, strip by strip
+
+    - Raises ValueError for tiles with an alpha channel, as PPM/PGM cannot hold it (convert the tiles to RGB/L first)
+    """
+    # Check the tiles have no alpha channel to drop
+    if tile_stream.mode in ("PA", "La", "RGBa") or tile_stream.mode.endswith("A"):
+        raise ValueError("Invalid mode for PPM/PGM (alpha cannot be kept): {}".format(tile_stream.mode))
+
+    # Initialize Variables
+    width, height = tile_stream.size
+    mode = get_stream_mode(tile_stream.mode, ("L", "RGB"))
+
+    # Write the header
+    fp.write("{}\n{} {}\n255\n".format("P5" if mode == "L" else "P6", width, height).encode("ascii"))
+
+    # Write the strips of rows as they arrive
+    for upper, strip in iter_strips(tile_stream):
+        if strip.mode != mode:
+            strip = strip.convert(mode)
+        fp.write(strip.tobytes())
+
+def write_tiles(tile_stream, fp, format="PNG", compress_level=6):
+    """
+    Write a TileStream into a file object in the specified image format
+
+    - PNG and PPM/PGM are written incrementally (1 strip in memory at a time)
+    - Other formats are assembled into a full image first and saved through Pillow
+    """
+    match format.upper():
+        case "PNG":
+            write_png_tiles(tile_stream, fp, compress_level)
+        case "PPM" | "PGM" | "PNM":
+            write_ppm_tiles(tile_stream, fp)
+        case _:
+            # Assemble the full image from the tiles
+            output_image = Image.new(tile_stream.mode, tile_stream.size)
+            for box, tile in tile_stream:
+                output_image.paste(tile, box[:2])
+            output_image.save(fp, format)
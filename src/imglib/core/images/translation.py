@@ -3,175 +3,452 @@ Image Translation/Transformation/Conversion functions
 """
 import os
 import sys
-from imglib.core.images.pixels import get_colored_pixels
-from PIL import Image, ImageDraw, ImageFilter, ImageChops
+from functools import lru_cache
+import numpy as np
+from imglib.core.images.pixels import get_colored_pixels, get_color_channels, get_pixel_mask, get_populated_bbox
+from imglib.core.images.tiles import TileStream
+from imglib.core.images.selection import PixelSelection
+from imglib.core.images.parallel import ensure_writable, map_row_bands, imap_ordered
+from imglib.core.images.keying import key_color
+from imglib.core.images.profiling import profiled
+from PIL import Image
 
-def color_transform(r, g, b, r_Factor=1, g_Factor=1, b_Factor=1, preset=""):
-    """
-    Tranform the colors based on the pro
+def get_color_matrix(preset="", r_Factor=1, g_Factor=1, b_Factor=1):
     """
-    # Initialize Variables
-    presets = {
-        "grayscale" : (0.299*r + 0.587*g + 0.114*b)
-    }
+    Get the 3x4 color matrix of a preset (or of the custom color factors if no preset is provided)
 
+    - Every row maps (r, g, b, 1) onto an output channel (red, green, blue), the 4th column being a constant offset
+    - Custom color factors produce a gray matrix: every output channel is r_Factor*r + g_Factor*g + b_Factor*b
+    - Matrices are compiled once per preset/factors and cached
+    """
     # Check if preset is provided
     if preset != "":
         # Not empty - provided
-        # Transform the colorset according to the presets
-        transformed_color = presets[preset]
-    else:
-        # Transform the colorset by multiplying the color factors and adding them together
-        transformed_color = (r_Factor*r + g_Factor*g + b_Factor*b)
+        if preset not in COLOR_PRESETS:
+            raise ValueError("Invalid preset: {}".format(preset))
+        return COLOR_PRESETS[preset]
+
+    return compile_color_matrix(((r_Factor, g_Factor, b_Factor),) * 3)
+
+@lru_cache(maxsize=64)
+def compile_color_matrix(matrix):
+    """
+    Normalize a 3x3 or 3x4 color matrix (nested sequence of rows) into a 3x4 tuple of floats
+    """
+    # Initialize Variables
+    rows = tuple(tuple(float(value) for value in row) for row in matrix)
+
+    # Check the matrix dimensions
+    if len(rows) != 3 or any(len(row) not in (3, 4) for row in rows):
+        raise ValueError("Color matrix must be 3x3 or 3x4, got {}".format(matrix))
+
+    # Pad the rows without an offset
+    return tuple(row if len(row) == 4 else row + (0.0,) for row in rows)
+
+# Color matrices of the built-in presets
+COLOR_PRESETS = {
+    "grayscale" : compile_color_matrix(((0.299, 0.587, 0.114),) * 3),
+    "sepia" : compile_color_matrix(((0.393, 0.769, 0.189), (0.349, 0.686, 0.168), (0.272, 0.534, 0.131))),
+    "invert" : compile_color_matrix(((-1, 0, 0, 255), (0, -1, 0, 255), (0, 0, -1, 255))),
+    "swap-rb" : compile_color_matrix(((0, 0, 1), (0, 1, 0), (1, 0, 0))),
+    "swap-rg" : compile_color_matrix(((0, 1, 0), (1, 0, 0), (0, 0, 1))),
+    "swap-gb" : compile_color_matrix(((1, 0, 0), (0, 0, 1), (0, 1, 0))),
+}
+
+def is_gray_matrix(matrix):
+    """
+    Check if every output channel of a 3x4 color matrix is the same (the transform produces gray pixels)
+    """
+    return matrix[0] == matrix[1] == matrix[2]
+
+def color_transform(r, g, b, r_Factor=1, g_Factor=1, b_Factor=1, preset=""):
+    """
+    Tranform the colors of a single pixel based on the preset (or the color factors if no preset is provided)
+
+    - Gray transforms (the 'grayscale' preset and custom color factors) return the single transformed value
+    - Other presets return the (r, g, b) tuple of transformed values
+    - Use 'color_transform_batch' or 'color_transform_image' to transform whole images
+    """
+    # Obtain the precompiled color matrix
+    matrix = get_color_matrix(preset, r_Factor, g_Factor, b_Factor)
+
+    # Transform the colorset by multiplying the color factors and adding them together
+    transformed_color = tuple(r_M*r + g_M*g + b_M*b + offset for r_M, g_M, b_M, offset in matrix)
+
+    # Check if the transform produces gray pixels
+    if is_gray_matrix(matrix):
+        return transformed_color[0]
 
     # Return/Output
     return transformed_color
 
-def convert_black_cells_to_transparent(input_image):
+@profiled
+def color_transform_batch(channels, matrix=None, preset="", r_Factor=1, g_Factor=1, b_Factor=1, workers=1):
     """
-    Convert the image to an RGBA value and convert all black areas into a transparent mask layer and return the RGBA object to the caller
+    Batched form of 'color_transform' applying a color matrix to whole channel planes at once
+
+    :: Params
+    - channels : An (..., C) pixel array (only the first 3 channels are used) or a sequence of the (r, g, b) planes
+    - matrix : A 3x3 or 3x4 color matrix; if not provided, the matrix of the preset (or of the color factors) is used
+    - workers : The number of threads transforming row bands (along the first axis) concurrently (0 = 1 per CPU core)
+
+    :: Notes
+    - Returns an (..., 3) uint8 array of the transformed (rounded and clipped) channels
     """
-    # Obtain the image mode
-    image_mode = input_image.mode
+    # Obtain the color matrix
+    if matrix is None:
+        matrix = get_color_matrix(preset, r_Factor, g_Factor, b_Factor)
+    else:
+        matrix = compile_color_matrix(tuple(map(tuple, matrix)))
+    matrix = np.asarray(matrix, dtype=np.float32)
 
-    # Convert image to RGBA
-    rgba = input_image.convert("RGBA")
+    # Stack the channel planes into a pixel array
+    if not isinstance(channels, np.ndarray):
+        channels = np.stack(channels, axis=-1)
 
-    # Create a mask to make the background transparent
-    mask = Image.new('L', input_image.size, 0)
-    draw = ImageDraw.Draw(mask)
-    
-    # Define the bounding box for the circle
-    width, height = input_image.size
-    bbox = [0, 0, width, height]
-    
-    # Draw a filled white circle in the mask
-    draw.ellipse(bbox, fill=255)
+    # Treat a single pixel as a batch of 1 pixel
+    if channels.ndim == 1:
+        return color_transform_batch(channels[np.newaxis], matrix)[0]
 
-    # Smooth the mask to reduce artifacts
-    mask = mask.filter(ImageFilter.GaussianBlur(2))
+    # Initialize Variables
+    output = np.empty(channels.shape[:-1] + (3,), dtype=np.uint8)
 
-    # Create a mask for black pixels
-    r,g,b,a = rgba.split()
+    def transform_band(upper, lower):
+        # Apply the color matrix to every pixel of the band in one pass
+        transformed = channels[upper:lower, ..., :3].astype(np.float32) @ matrix[:, :3].T
+        transformed += matrix[:, 3] + 0.5
 
-    # Composite the new alpha channel with the existing alpha channel
-    new_alpha = ImageChops.multiply(a, mask)
+        # Round, clip and write the band straight into its rows of the output
+        np.clip(transformed, 0, 255, out=transformed)
+        output[upper:lower] = transformed
 
-    # Create a new image with the updated alpha channel
-    input_image.putalpha(new_alpha)
+    # Transform the channels band by band
+    map_row_bands(transform_band, channels.shape[0], workers)
 
-    # Get the image data
-    rgba_data = rgba.getdata()
+    # Output/Return
+    return output
 
-    # Iterate through the image mappings
-    transparency_list = []
-    black_threshold = 5 # Define the threshold for near-black pixels
-    for pixel_values in rgba_data:
-        # Get RGB value of the current pixel
-        R = pixel_values[0]
-        G = pixel_values[1]
-        B = pixel_values[2]
+@profiled
+def color_transform_image(input_image, matrix=None, preset="", r_Factor=1, g_Factor=1, b_Factor=1, box=None, inplace=False, workers=1):
+    """
+    Apply a color matrix (or a preset/color factors) to an RGB(A) image in one pass through Pillow's matrix conversion
+
+    :: Params
+    - matrix : A 3x3 or 3x4 color matrix; if not provided, the matrix of the preset (or of the color factors) is used
+    - box : The region (left, upper, right, lower) to transform; the whole image if not provided
+    - inplace : Transform the input image in place; by default the input image is left untouched and a copy is transformed
+    - workers : The number of threads transforming row bands of the region concurrently (0 = 1 per CPU core)
+
+    :: Notes
+    - Only the region is read and written back, and the alpha channel of RGBA images is kept
+    - Returns the transformed image (the input image itself when working in place)
+    """
+    # Obtain the color matrix
+    if matrix is None:
+        matrix = get_color_matrix(preset, r_Factor, g_Factor, b_Factor)
+    else:
+        matrix = compile_color_matrix(tuple(map(tuple, matrix)))
+
+    # Obtain the target image
+    output_image = input_image if inplace else input_image.copy()
 
-        # Check if the pixel is near black (Adjust threshold as necessary)
-        if R <= black_threshold and G <= black_threshold and B <= black_threshold:
-            # Near-black colour found (RGB values are almost zero)
-            # Make pixel transparent (set alpha to 0)
-            transparency_list.append((R,G,B,0))
+    # Check the color mode can hold the transformed pixels
+    if output_image.mode not in ("RGB", "RGBA"):
+        raise ValueError("Unable to color transform color mode '{}' in place".format(output_image.mode))
+
+    # Obtain the region to transform
+    if box is None:
+        box = (0, 0) + output_image.size
+    left, upper, right, lower = box
+
+    def transform_band(band_upper, band_lower):
+        # Obtain the band of the region
+        band_box = (left, upper + band_upper, right, upper + band_lower)
+        region = output_image if band_box == (0, 0) + output_image.size else output_image.crop(band_box)
+        rgb = region if region.mode == "RGB" else region.convert("RGB")
+
+        # Apply the color matrix to the whole band
+        if is_gray_matrix(matrix):
+            gray = rgb.convert("L", matrix[0])
+            bands = [gray, gray, gray]
         else:
-            # Not black - store the original pixel as per normal
-            transparency_list.append(pixel_values)  # other colours remain unchanged
+            bands = list(rgb.convert("RGB", sum(matrix, ())).split())
+
+        # Keep the alpha channel
+        if output_image.mode == "RGBA":
+            bands.append(region.getchannel("A"))
 
-    # Update image with new pixel data
-    rgba.putdata(transparency_list)
+        # Write the transformed band back into the image
+        output_image.paste(Image.merge(output_image.mode, bands), band_box)
 
-    return rgba
+    # Transform the region band by band (with the image decoded once, before the worker threads crop it)
+    output_image.load()
+    ensure_writable(output_image)
+    map_row_bands(transform_band, lower - upper, workers)
 
-def img_grayscale(input_image, pixel_map, width, height, factor=0, orientation="x"):
+    # Output/Return
+    return output_image
+
+def get_band_boxes(width, height, band_height=512):
     """
-    Convert and Map the image with a gray tint (grayscaling) based on the factor, as well as the target orientation to apply the grayscale to (only applicable if the grayscale fraction is more than 0)
+    Split the image into boxes (left, upper, right, lower) of full-width row bands, each at most 'band_height' rows tall
+    """
+    return [(0, upper, width, min(upper + band_height, height)) for upper in range(0, height, band_height)]
+
+@profiled
+def convert_black_cells_to_transparent(input_image, black_threshold=5, feather=0, band_height=512, workers=1):
+    """
+    Convert the image to an RGBA value and convert all black areas into a transparent mask layer and return the RGBA object to the caller
 
     :: Params
-    
+    - black_threshold : The highest channel value still considered black (pixels with every color channel <= threshold become transparent)
+    - feather : The radius of the Gaussian blur softening the edges of the transparent areas (0 = hard edges)
+    - band_height : The number of rows processed at once; bounds the temporary planes allocated per band
+    - workers : The number of threads processing bands concurrently (0 = 1 per CPU core)
+
+    :: Notes
+    - Keys out black with the 'channel' metric (see 'keying.key_color'): the alpha is derived from a lookup table over the
+    brightest color channel, band by band, without building a per-pixel list
+    - The input image is left untouched
     """
-    # Obtain the image mode
-    image_mode = input_image.mode
+    return key_color(input_image, (0, 0, 0), "channel", black_threshold, 0, feather, band_height, workers)
+
+def get_region_box(width, height, factor=0, orientation="x"):
+    """
+    Get the box (left, upper, right, lower) covering the fraction of the image selected by the factor and orientation
 
-    # Check factor (What fraction of the image to grayscale)
-    # 2 = 1/2
+    :: Params
+    - factor : The fraction of the image to select (i.e. 2 = 1/2); 0 selects the whole image
+    - orientation : The axis the fraction applies to (x = the left-most columns, y = the top-most rows)
+    """
+    # Check factor (What fraction of the image to select)
     if factor > 0:
-        # Check the orientation to apple the grayscale to (Only applicable if the grayscale factor > 0)
         match orientation:
             case "x":
-                for i in range(width//factor): 
-                    for j in range(height): 
-                        # Check if input image contains an alpha
-                        if image_mode != "RGBA":
-                            # getting the RGB pixel value. 
-                            r, g, b = input_image.getpixel((i, j)) 
-                      
-                            # Apply formula of grayscale: 
-                            grayscale = (0.299*r + 0.587*g + 0.114*b) 
-              
-                            # setting the pixel value. 
-                            pixel_map[i, j] = (int(grayscale), int(grayscale), int(grayscale)) 
-                        else:
-                            # getting the RGB pixel value. 
-                            r, g, b, a = input_image.getpixel((i, j)) 
-                      
-                            # Apply formula of grayscale: 
-                            grayscale = (0.299*r + 0.587*g + 0.114*b) 
-              
-                            # setting the pixel value. 
-                            pixel_map[i, j] = (int(grayscale), int(grayscale), int(grayscale), int(a))
+                return (0, 0, width // factor, height)
             case "y":
-                for i in range(width): 
-                    for j in range(height//factor): 
-                        # Check if input image contains an alpha
-                        if image_mode != "RGBA":
-                            # getting the RGB pixel value. 
-                            r, g, b = input_image.getpixel((i, j)) 
-                      
-                            # Apply formula of grayscale: 
-                            grayscale = (0.299*r + 0.587*g + 0.114*b) 
-              
-                            # setting the pixel value. 
-                            pixel_map[i, j] = (int(grayscale), int(grayscale), int(grayscale)) 
-                        else:
-                            # getting the RGB pixel value. 
-                            r, g, b, a = input_image.getpixel((i, j)) 
-                      
-                            # Apply formula of grayscale: 
-                            grayscale = (0.299*r + 0.587*g + 0.114*b) 
-              
-                            # setting the pixel value. 
-                            pixel_map[i, j] = (int(grayscale), int(grayscale), int(grayscale), int(a)) 
+                return (0, 0, width, height // factor)
+            case _:
+                raise ValueError("Invalid orientation: {}".format(orientation))
+
+    return (0, 0, width, height)
+
+@profiled
+def img_grayscale(input_image, pixel_map, width, height, factor=0, orientation="x", inplace=True, workers=1):
+    """
+    Convert and Map the image with a gray tint (grayscaling) based on the factor, as well as the target orientation to apply the grayscale to (only applicable if the grayscale fraction is more than 0)
+
+    :: Params
+    - factor : The fraction of the image to grayscale (i.e. 2 = 1/2); 0 grayscales the whole image
+    - orientation : The axis the fraction applies to (x = the left-most columns, y = the top-most rows)
+    - inplace : Grayscale the input image in place (the default); set to False to leave the input image untouched and work on a copy
+    - workers : The number of threads grayscaling row bands of the region concurrently (0 = 1 per CPU core)
+
+    :: Notes
+    - The region is converted in a single pass using the 0.299/0.587/0.114 weights (rounded), and only the region is read and written back
+    - The alpha channel of RGBA images is kept
+    - 'pixel_map' is unused and only kept for compatibility with existing callers (it stays valid for in-place grayscaling)
+    - Returns the grayscaled image (the input image itself when working in place)
+    """
+    # Grayscale the region selected by the factor and orientation
+    return grayscale_region(input_image, get_region_box(width, height, factor, orientation), inplace, workers)
+
+def get_grayscale_mode(image_mode):
+    """
+    Get the color mode of an image of the given mode once grayscaled
+
+    - Grayscale modes are kept, RGB/RGBA hold the gray pixels and other color modes are converted to RGBA (with transparency) or RGB
+    """
+    if image_mode in ("1", "L", "LA", "I", "F", "RGB", "RGBA") or image_mode.startswith("I;16"):
+        return image_mode
+    if image_mode in ("PA", "La", "RGBa") or image_mode.endswith("A"):
+        return "RGBA"
+    return "RGB"
+
+def grayscale_region(input_image, box, inplace=True, workers=1):
+    """
+    Grayscale the region (left, upper, right, lower) of the image (see 'img_grayscale')
+
+    - Returns the grayscaled image (the input image itself when working in place)
+    """
+    # Obtain the image mode
+    image_mode = input_image.mode
+    output_mode = get_grayscale_mode(image_mode)
+
+    # Check if the image is grayscale already
+    if output_mode not in ("RGB", "RGBA"):
+        return input_image if inplace else input_image.copy()
+
+    # Obtain the target image (other color modes are converted when working on a copy)
+    if inplace or image_mode == output_mode:
+        output_image = input_image if inplace else input_image.copy()
+    else:
+        output_image = input_image.convert("RGBA" if output_mode == "RGBA" or "transparency" in input_image.info else "RGB")
+
+    # Apply the grayscale preset to the region
+    return color_transform_image(output_image, preset="grayscale", box=box, inplace=True, workers=workers)
+
+def img_grayscale_tiles(tile_stream, factor=0, orientation="x"):
+    """
+    Lazily grayscale a TileStream (see 'img_grayscale'), returning the stream of grayscaled tiles
+
+    - The factor/orientation region applies to the full image; tiles outside of it are passed through untouched
+    """
+    # Obtain the region to grayscale
+    width, height = tile_stream.size
+    left, upper, right, lower = get_region_box(width, height, factor, orientation)
+    output_mode = get_grayscale_mode(tile_stream.mode)
+
+    def grayscale_tile(box, tile):
+        # Obtain the part of the region overlapping the tile (relative to the tile)
+        region = (max(left, box[0]) - box[0], max(upper, box[1]) - box[1], min(right, box[2]) - box[0], min(lower, box[3]) - box[1])
+        if region[0] >= region[2] or region[1] >= region[3]:
+            return tile if tile.mode == output_mode else tile.convert(output_mode)
+
+        # Tiles are freshly decoded, so they can be grayscaled in place when their color mode allows
+        return grayscale_region(tile, region, inplace=tile.mode == output_mode)
+
+    return TileStream(tile_stream.size, output_mode, ((box, grayscale_tile(box, tile)) for box, tile in tile_stream))
+
+def convert_black_cells_to_transparent_tiles(tile_stream, black_threshold=5):
+    """
+    Lazily convert the black areas of a TileStream to transparent (see 'convert_black_cells_to_transparent'), returning the stream of RGBA tiles
+
+    - Feathering is not available as the blur would need the neighbouring tiles
+    """
+    return tile_stream.map(lambda tile: convert_black_cells_to_transparent(tile, black_threshold), "RGBA")
+
+def img_grayscale_frames(frame_stream, factor=0, orientation="x", workers=1):
+    """
+    Lazily grayscale every frame of a FrameStream (see 'img_grayscale'), returning the stream of grayscaled frames
+
+    - 'workers' > 1 grayscales the frames concurrently (see 'FrameStream.map')
+    """
+    # Obtain the region to grayscale
+    box = get_region_box(frame_stream.size[0], frame_stream.size[1], factor, orientation)
+
+    def grayscale_frame(frame):
+        # Frames are freshly decoded, so they can be grayscaled in place when their color mode allows
+        return grayscale_region(frame, box, inplace=frame.mode == get_grayscale_mode(frame.mode))
+
+    return frame_stream.map(grayscale_frame, get_grayscale_mode(frame_stream.mode), workers=workers)
+
+def convert_black_cells_to_transparent_frames(frame_stream, black_threshold=5, feather=0, workers=1):
+    """
+    Lazily convert the black areas of every frame of a FrameStream to transparent (see 'convert_black_cells_to_transparent'),
+    returning the stream of RGBA frames
+
+    - 'workers' > 1 converts the frames concurrently (see 'FrameStream.map')
+    """
+    return frame_stream.map(lambda frame: convert_black_cells_to_transparent(frame, black_threshold, feather), "RGBA", workers=workers)
+
+def key_color_frames(frame_stream, key=(0, 0, 0), metric="channel", tolerance=5, softness=0, feather=0, workers=1):
+    """
+    Lazily key out the areas near the key color of every frame of a FrameStream (see 'keying.key_color'), returning the
+    stream of RGBA frames
+
+    - The lookup tables of the key are built once and shared by every frame
+    - 'workers' > 1 keys the frames concurrently (see 'FrameStream.map')
+    """
+    return frame_stream.map(lambda frame: key_color(frame, key, metric, tolerance, softness, feather), "RGBA", workers=workers)
+
+def crop_to_content_frames(frame_stream, tolerance=0, padding=0, workers=1):
+    """
+    Lazily crop every frame of a FrameStream to the content of the whole animation (see 'crop_to_content'), returning the
+    stream of cropped frames, or None if every frame is entirely black
+
+    - The frames are cropped to the union of the content boxes of every frame, so they keep a common size; the frames are
+    decoded once (one at a time) to find the box, and again as the cropped stream is iterated through
+    """
+    # Obtain the union of the content boxes of the frames
+    box = None
+    for frame_box in imap_ordered(lambda frame: get_content_box(frame, tolerance, padding), frame_stream, workers):
+        if frame_box != None:
+            box = frame_box if box == None else (min(box[0], frame_box[0]), min(box[1], frame_box[1]), max(box[2], frame_box[2]), max(box[3], frame_box[3]))
+
+    # Check if any frame has populated areas
+    if box == None:
+        return None
+
+    # Output/Return
+    return frame_stream.map(lambda frame: frame.crop(box), size=(box[2] - box[0], box[3] - box[1]), workers=workers)
+
+def get_content_box(input_image, tolerance=0, padding=0):
+    """
+    Get the box (left, upper, right, lower) enclosing the populated (non-black) areas of the image, or None if the image is entirely black
+
+    :: Params
+    - input_image : The image, or its pixel array
+    - tolerance : The highest channel value still considered black
+    - padding : The number of pixels to extend the box by on every side (clamped to the image)
+    """
+    # Obtain the tight bounding box of the colored pixels, scanning the image buffer inwards from its edges
+    bbox = get_populated_bbox(input_image, tolerance)
+    if bbox is None:
+        return None
+
+    # Pad the box within the image bounds
+    if isinstance(input_image, np.ndarray):
+        height, width = input_image.shape[:2]
     else:
-        for i in range(width): 
-            for j in range(height): 
-                # Check if input image contains an alpha
-                if image_mode != "RGBA":
-                    # getting the RGB pixel value. 
-                    r, g, b = input_image.getpixel((i, j)) 
-                      
-                    # Apply formula of grayscale: 
-                    grayscale = (0.299*r + 0.587*g + 0.114*b) 
-              
-                    # setting the pixel value. 
-                    pixel_map[i, j] = (int(grayscale), int(grayscale), int(grayscale))
-                else:
-                    # getting the RGB pixel value. 
-                    r, g, b, a = input_image.getpixel((i, j)) 
-                      
-                    # Apply formula of grayscale: 
-                    grayscale = (0.299*r + 0.587*g + 0.114*b) 
-              
-                    # setting the pixel value. 
-                    pixel_map[i, j] = (int(grayscale), int(grayscale), int(grayscale), int(a))
-
-def extract_populated_areas(input_image, pixel_map, image_map, out_fname="out", format="png"):
+        width, height = input_image.size
+    left, upper, right, lower = bbox
+
+    # Output/Return
+    return (max(left - padding, 0), max(upper - padding, 0), min(right + padding, width), min(lower + padding, height))
+
+@profiled
+def crop_to_content(input_image, tolerance=0, padding=0):
+    """
+    Crop the black borders (Unpopulated areas) off the image and return the cropped image, or None if the image is entirely black
+
+    - See 'get_content_box' for the parameters
+    """
+    # Obtain the box enclosing the populated areas
+    box = get_content_box(input_image, tolerance, padding)
+    if box is None:
+        return None
+
+    # Output/Return
+    return input_image.crop(box)
+
+@profiled
+def extract_populated_areas(input_image, pixel_map, image_map, out_fname="out", format="png", crop=False, tolerance=0, padding=0, workers=1):
     """
     Remove all black areas (Unpopulated) of the image
+
+    - 'image_map' may be a pixel array (from 'get_image_pixels'), a PixelSelection of the colored pixels keeping their values
+    (from 'get_colored_pixels(..., as_selection=True)') or the legacy dictionary mapping
+    - Set 'crop' to True to crop the black borders off instead and return the cropped image (see 'crop_to_content');
+    'image_map' is not needed (may be None) in that case
+    - 'workers' > 1 computes the mask of pixel arrays in row bands concurrently (0 = 1 worker per CPU core)
     """
+    # Check if the black borders are to be cropped off
+    if crop:
+        return crop_to_content(input_image, tolerance, padding)
+
+    # Check if a pixel selection is provided
+    if isinstance(image_map, PixelSelection):
+        # Write the selected pixels back into the image in one pass, through the selection's bitmap as the mask
+        pixel_array = image_map.to_pixel_array()
+        if pixel_array.shape[2] == 1:
+            pixel_array = pixel_array[:, :, 0]
+        input_image.paste(Image.fromarray(pixel_array), (0, 0), image_map.to_image())
+        return
+
+    # Check if a pixel array is provided
+    if isinstance(image_map, np.ndarray):
+        # Build the colored areas and their mask from the pixel array
+        color_channels = get_color_channels(image_map)
+        if color_channels.shape[2] == 1:
+            color_channels = color_channels[:, :, 0]
+        colored_cells = Image.fromarray(np.ascontiguousarray(color_channels))
+        colored_mask = Image.fromarray(get_pixel_mask(image_map, "colored", workers=workers))
+
+        # Write the colored pixels back into the image in one pass
+        input_image.paste(colored_cells, (0, 0), colored_mask)
+        return
+
     # Obtain colored points
     colored_cells = get_colored_pixels(image_map)
 
@@ -3,9 +3,18 @@ ImgLib core function unit tests
 """
 import os
 import sys
-from imglib.core.images.io import open as import_file, load_image, save as output_file
-from imglib.core.images.pixels import get_image_pixels, get_black_pixels, get_colored_pixels
-from imglib.core.images.translation import img_grayscale, extract_populated_areas, convert_black_cells_to_transparent
+import asyncio
+import tempfile
+from io import BytesIO
+from imglib.core.images.io import open as import_file, load_image, save as output_file, map_pixels, open_frames, save_frames, open_tiles, save_tiles, SAVE_PROFILES
+from imglib.core.images.pixels import get_image_pixels, get_black_pixels, get_colored_pixels, query_pixels, get_pixel_array, get_image_statistics
+from imglib.core.images.translation import img_grayscale, extract_populated_areas, convert_black_cells_to_transparent, color_transform_image, crop_to_content, img_grayscale_frames, convert_black_cells_to_transparent_frames, crop_to_content_frames
+from imglib.core.images.information import get_image_metadata
+from imglib.core.images.cache import ResultCache, ImageCache, get_cached_pixel_query
+from imglib.core.images.pipeline import Pipeline
+from imglib.core.images.keying import key_color
+from imglib.core.images import aio, profiling
+from app.actions import run_action
 
 def test_import_file(img_fname="src.png"):
     """
@@ -47,6 +56,31 @@ def test_get_image_size(input_image):
 
     return [width, height]
 
+def test_image_metadata(img_fname, input_image):
+    """
+    Unit Test to check that the header-only metadata matches the opened image
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    if input_image != None:
+        # Read the metadata from the file headers
+        metadata = get_image_metadata(img_fname)
+
+        # Compare with the opened image
+        if (metadata["width"], metadata["height"]) != input_image.size:
+            err_msg = "Metadata size {}x{} does not match the image size {}".format(metadata["width"], metadata["height"], input_image.size)
+        elif metadata["mode"] != input_image.mode or metadata["format"] != input_image.format:
+            err_msg = "Metadata mode/format {}/{} does not match the image {}/{}".format(metadata["mode"], metadata["format"], input_image.mode, input_image.format)
+        else:
+            token = True
+    else:
+        err_msg = "Input Image is not provided."
+
+    # Output/Return
+    return [token, err_msg]
+
 def test_check_black_cells(input_image, pixel_map, width, height):
     """
     Unit Test to check for black pixels in the entire image
@@ -73,6 +107,550 @@ def test_check_colored_cells(input_image, pixel_map, width, height):
     # Output/Return
     return colored_pixel_cells
 
+def test_pixel_array_compatibility(input_image, pixel_map, width, height):
+    """
+    Unit Test to check that the pixel array and the legacy dictionary mapping hold the same pixels, with and without alpha
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    if input_image != None:
+        token = True
+        for image in (input_image, input_image.convert("RGBA")):
+            # Build the pixel array and convert it back into the legacy dictionary mapping
+            img_array = get_image_pixels(image, pixel_map, width, height)
+            img_map = get_image_pixels(image, pixel_map, width, height, as_dict=True)
+
+            # Compare the black and colored cells found by both representations
+            if get_black_pixels(img_array, as_dict=True) != get_black_pixels(img_map):
+                token = False
+                err_msg = "Black cells of the {} image differ between the pixel array and the dictionary mapping".format(image.mode)
+            elif get_colored_pixels(img_array, as_dict=True) != get_colored_pixels(img_map):
+                token = False
+                err_msg = "Colored cells of the {} image differ between the pixel array and the dictionary mapping".format(image.mode)
+    else:
+        err_msg = "Input Image is not provided."
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_query_pixels(input_image, pixel_map, width, height, tolerance=5):
+    """
+    Unit Test to check that the pixel queries (count/bbox/coordinates) agree with each other
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    if input_image != None:
+        img_array = get_image_pixels(input_image, pixel_map, width, height)
+
+        # Query the near-black pixels in all output forms
+        count = query_pixels(img_array, "black", tolerance, output="count")
+        bbox = query_pixels(img_array, "black", tolerance, output="bbox")
+        coordinates = query_pixels(img_array, "black", tolerance, output="coordinates")
+
+        # Compare the results
+        if count != len(coordinates):
+            err_msg = "Count {} does not match the {} coordinates found".format(count, len(coordinates))
+        elif count > 0 and bbox != (coordinates[:, 0].min(), coordinates[:, 1].min(), coordinates[:, 0].max() + 1, coordinates[:, 1].max() + 1):
+            err_msg = "Bounding box {} does not enclose the coordinates found".format(bbox)
+        else:
+            token = True
+    else:
+        err_msg = "Input Image is not provided."
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_result_cache(img_fname, cache_fname="test-cache.sqlite"):
+    """
+    Unit Test to check that a cached pixel query is computed once, then served from the result cache
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    if os.path.isfile(img_fname):
+        with ResultCache(cache_fname) as cache:
+            cache.invalidate()
+
+            # Query twice: a miss computing the result, then a hit
+            first = get_cached_pixel_query(img_fname, "black", 0, "count", cache)
+            second = get_cached_pixel_query(img_fname, "black", 0, "count", cache)
+
+            if first != second:
+                err_msg = "Cached count {} does not match the computed count {}".format(second, first)
+            elif (cache.hits, cache.misses) != (1, 1):
+                err_msg = "Expected 1 hit and 1 miss, got {} hit(s) and {} miss(es)".format(cache.hits, cache.misses)
+            else:
+                token = True
+        os.remove(cache_fname)
+    else:
+        err_msg = "File '{}' is not found".format(img_fname)
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_image_cache(img_fname):
+    """
+    Unit Test to check that images opened through the decoded image cache are decoded once and cannot corrupt the cached image
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+    cache = ImageCache()
+
+    if os.path.isfile(img_fname):
+        # Open the image twice: a miss decoding the image, then a hit
+        first, token, err_msg = import_file(img_fname, cache)
+        second, token, err_msg = import_file(img_fname, cache)
+
+        # Modify the pixel map of the first image
+        pixel_map, token, err_msg = load_image(first)
+        original = second.getpixel((0, 0))
+        pixel_map[0, 0] = tuple(255 - value for value in original) if isinstance(original, tuple) else 255 - original
+
+        # Check the cached image is untouched
+        third, token, err_msg = import_file(img_fname, cache)
+        stats = cache.get_stats()
+        token = False
+        if third.getpixel((0, 0)) != original:
+            err_msg = "Cached image was modified through a handed out pixel map"
+        elif (stats["hits"], stats["misses"]) != (2, 1):
+            err_msg = "Expected 2 hits and 1 miss, got {} hit(s) and {} miss(es)".format(stats["hits"], stats["misses"])
+        else:
+            token = True
+    else:
+        err_msg = "File '{}' is not found".format(img_fname)
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_map_pixels(input_image, out_fname="output-mapped"):
+    """
+    Unit Test to check that the memory-mapped pixels of an uncompressed (BMP) copy of the image match its decoded pixels
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+    pixel_array = None
+
+    if input_image != None:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Write an uncompressed copy of the image into the temporary directory and map its pixels
+            mapped_fname = os.path.join(tmp_dir, out_fname)
+            token, err_msg = output_file(input_image.convert("RGB"), mapped_fname, format="bmp")
+            if token == True:
+                pixel_array, token, err_msg = map_pixels("{}.bmp".format(mapped_fname))
+
+            # Compare with the decoded pixels
+            if token == True:
+                token = False
+                if pixel_array.shape != (input_image.height, input_image.width, 3):
+                    err_msg = "Mapped pixel array has the shape {}".format(pixel_array.shape)
+                elif (pixel_array != get_pixel_array(input_image.convert("RGB"))).any():
+                    err_msg = "Mapped pixels differ from the decoded pixels"
+                else:
+                    token = True
+
+            # Close the map before its file is removed with the temporary directory
+            pixel_array = None
+    else:
+        err_msg = "Input Image is not provided."
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_async_io(img_fname, out_fname="output-async"):
+    """
+    Unit Test to open the specified file and save it again through the asyncio I/O functions, then read the saved image
+    back and compare it with the opened image
+    """
+    async def open_and_save(tmp_dir):
+        # Open the image, and save it into the temporary directory
+        input_image, token, err_msg = await aio.open(img_fname)
+        if token == True:
+            token, err_msg = await aio.save(input_image, os.path.join(tmp_dir, out_fname), "png")
+
+        # Read the saved image back, and compare its size and pixels
+        if token == True:
+            saved_image, token, err_msg = await aio.open(os.path.join(tmp_dir, "{}.png".format(out_fname)))
+        if token == True and (saved_image.size != input_image.size or saved_image.tobytes() != input_image.tobytes()):
+            token = False
+            err_msg = "Saved image {} {} does not match the opened image {} {}".format(saved_image.mode, saved_image.size, input_image.mode, input_image.size)
+        return [token, err_msg]
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        return asyncio.run(open_and_save(tmp_dir))
+
+def test_save_profiles(input_image, output_format="png"):
+    """
+    Unit Test to save the image into memory buffers with every save profile, and read the saved images back
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    if input_image != None:
+        for profile in SAVE_PROFILES:
+            # Save the image into a memory buffer
+            buffer = BytesIO()
+            token, err_msg = output_file(input_image, buffer, output_format, profile)
+            if token == False:
+                err_msg = "Profile '{}' : {}".format(profile, err_msg)
+                break
+
+            # Read the saved image back
+            buffer.seek(0)
+            saved_image, token, err_msg = import_file(buffer)
+            if token == False or saved_image.size != input_image.size:
+                token = False
+                err_msg = "Profile '{}' : Saved image could not be read back ({})".format(profile, err_msg)
+                break
+    else:
+        err_msg = "Input Image is not provided."
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_reduced_decode(img_fname, reduce=2):
+    """
+    Unit Test to open the specified file at a reduced resolution
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    # Open the file at full and at reduced resolution
+    input_image, token, err_msg = import_file(img_fname)
+    if token == True:
+        reduced_image, token, err_msg = import_file(img_fname, reduce=reduce)
+
+    # Check the reduced size
+    if token == True:
+        pixel_map, token, err_msg = load_image(reduced_image)
+        expected_size = tuple(-(-size // reduce) for size in input_image.size)
+        if token == True and reduced_image.size != expected_size:
+            token = False
+            err_msg = "Reduced image size {} does not match the expected size {}".format(reduced_image.size, expected_size)
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_pipeline(input_image):
+    """
+    Unit Test to check that a fused pipeline produces the same image as running its steps one by one, on the image, on a
+    darkened copy of it (most pixels near the transparency threshold) and on a half-transparent inverted grayscale (LA) copy
+    of it (alpha kept)
+    """
+    # Initialize Variables
+    token = True
+    err_msg = ""
+    la_image = input_image.convert("L").point(lambda value: 255 - value).convert("LA")
+    la_image.putalpha(128)
+
+    try:
+        for source_image in (input_image, input_image.convert("RGB").point(lambda value: value // 4), la_image):
+            # Run the steps fused in a pipeline
+            output_image = Pipeline(source_image).grayscale().color_transform(preset="sepia").threshold_to_transparent(5).crop_to_content().run(band_height=16)
+
+            # Run the steps one by one (keeping the alpha channel of the image)
+            expected_image = color_transform_image(source_image.convert("RGBA" if "A" in source_image.getbands() else "RGB"), preset="grayscale")
+            expected_image = color_transform_image(expected_image, preset="sepia", inplace=True)
+            expected_image = crop_to_content(convert_black_cells_to_transparent(expected_image, 5))
+
+            # Check the images match
+            if output_image == None or expected_image == None:
+                if output_image != expected_image:
+                    token = False
+                    err_msg = "Pipeline output {} does not match {}".format(output_image, expected_image)
+            elif output_image.size != expected_image.size or output_image.mode != expected_image.mode:
+                token = False
+                err_msg = "Pipeline output {} {} does not match {} {}".format(output_image.mode, output_image.size, expected_image.mode, expected_image.size)
+            elif output_image.tobytes() != expected_image.tobytes():
+                token = False
+                err_msg = "Pipeline output pixels do not match the step by step output"
+    except Exception as ex:
+        token = False
+        err_msg = ex
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_pixel_selection(input_image, pixel_map, width, height):
+    """
+    Unit Test to check that the compact pixel selections hold the same pixels as the pixel array queries
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    # Obtain the colored and black pixels as selections and as coordinates
+    img_array = get_image_pixels(input_image, pixel_map, width, height)
+    colored_cells = get_colored_pixels(img_array, as_selection=True)
+    black_cells = get_black_pixels(img_array, as_selection=True)
+    coordinates, pixel_values = get_colored_pixels(img_array)
+
+    # Check the selections against the queries
+    if len(colored_cells) != len(coordinates) or [list(pixel) for pixel in colored_cells] != coordinates.tolist():
+        err_msg = "Selected pixels do not match the colored pixel coordinates"
+    elif colored_cells.get_bbox() != query_pixels(img_array, "colored", output="bbox"):
+        err_msg = "Selection bounding box {} does not match the colored pixels".format(colored_cells.get_bbox())
+    elif len(colored_cells | black_cells) != width * height or len(colored_cells & black_cells) != 0:
+        err_msg = "Union/intersection of the colored and black selections do not cover the image"
+    else:
+        token = True
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_profiling(img_fname):
+    """
+    Unit Test to check that the profiled functions report their calls to the hooks and the summary while profiling is enabled
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+    records = []
+
+    # Open and query the image with profiling enabled
+    profiling.reset()
+    profiling.add_hook(records.append)
+    profiling.enable()
+    try:
+        input_image, token, err_msg = import_file(img_fname)
+        pixel_map, token, err_msg = load_image(input_image)
+        query_pixels(get_pixel_array(input_image), "black", output="count")
+    finally:
+        profiling.disable()
+        profiling.remove_hook(records.append)
+
+    # Check the records and the summary
+    summary = profiling.get_summary()
+    names = [record["name"] for record in records]
+    if names != ["io.open", "io.load_image", "pixels.get_pixel_array", "pixels.get_pixel_mask", "pixels.query_pixels"]:
+        token = False
+        err_msg = "Unexpected profiling records: {}".format(names)
+    elif summary["io.load_image"]["pixels"] != input_image.width * input_image.height:
+        token = False
+        err_msg = "Profiled pixels {} do not match the image".format(summary["io.load_image"]["pixels"])
+
+    # Check that nothing is recorded once profiling is disabled
+    query_pixels(get_pixel_array(input_image), "black", output="count")
+    if token and profiling.get_summary() != summary:
+        token = False
+        err_msg = "Calls recorded while profiling is disabled"
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_image_statistics(input_image, tolerance=5):
+    """
+    Unit Test to check the histogram statistics of the image against the pixel queries of its pixel array
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    try:
+        statistics = get_image_statistics(input_image, tolerance=tolerance)
+        pixel_array = get_pixel_array(input_image)
+        black_count = query_pixels(pixel_array, "black", tolerance=tolerance, output="count")
+
+        # Compare the statistics with the pixel array
+        means = pixel_array.reshape(-1, pixel_array.shape[2]).mean(axis=0)
+        if round(statistics["black_ratio"] * statistics["pixels"]) != black_count:
+            err_msg = "Black ratio {} does not match the {} black pixels".format(statistics["black_ratio"], black_count)
+        elif any(abs(channel["mean"] - mean) > 1e-6 for channel, mean in zip(statistics["channels"].values(), means)):
+            err_msg = "Channel means do not match the pixel array"
+        elif sum(ratio for color, ratio in statistics["dominant_colors"]) > 1.0:
+            err_msg = "Dominant colors cover more than the image"
+        else:
+            token = True
+    except Exception as ex:
+        err_msg = ex
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_frame_stream(input_image, out_fname="frames-source"):
+    """
+    Unit Test to check that the frames of a multi-page image are transformed and saved one by one, matching the frames
+    transformed on their own
+    """
+    # Initialize Variables
+    errors = []
+    source_frames = [input_image.convert("RGB"), input_image.convert("RGB").rotate(180), input_image.convert("RGB").transpose(0)]
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Save the source frames as a multi-page TIFF, and stream them through the frame transforms
+            source_fname = os.path.join(tmp_dir, "{}.tiff".format(out_fname))
+            source_frames[0].save(source_fname, save_all=True, append_images=source_frames[1:])
+            frame_stream, opened, err_msg = open_frames(source_fname)
+            if not opened:
+                raise ValueError(err_msg)
+            grayscaled = img_grayscale_frames(frame_stream, workers=2)
+
+            # Check the pages written against the frames grayscaled on their own
+            output = BytesIO()
+            saved, err_msg = save_frames(grayscaled, output, format="tiff")
+            if not saved:
+                errors.append("Frames not saved as tiff : {}".format(err_msg))
+            else:
+                output.seek(0)
+                output_image = import_file(output)[0]
+                for index, source_frame in enumerate(source_frames):
+                    output_image.seek(index)
+                    if output_image.convert("RGB").tobytes() != color_transform_image(source_frame, preset="grayscale").tobytes():
+                        errors.append("Frame {} does not match the frame grayscaled on its own".format(index))
+
+            # Check the animated formats
+            for format in ("gif", "webp", "png"):
+                output = BytesIO()
+                saved, err_msg = save_frames(grayscaled, output, format=format, lossless=format == "webp")
+                output.seek(0)
+                if not saved or import_file(output)[0].n_frames != len(source_frames):
+                    errors.append("Frames not saved as {} : {}".format(format, err_msg))
+
+            # Check that the frames of a GIF (a palette first frame followed by RGB(A) frames) are saved as APNG, as they are
+            # and cropped
+            gif_fname = os.path.join(tmp_dir, out_fname)
+            saved, err_msg = save_frames(grayscaled, gif_fname, format="gif")
+            if not saved:
+                errors.append("Frames not saved as a gif file : {}".format(err_msg))
+            else:
+                gif_stream, opened, err_msg = open_frames("{}.gif".format(gif_fname))
+                for stream in (gif_stream, crop_to_content_frames(gif_stream)):
+                    output = BytesIO()
+                    saved, err_msg = save_frames(stream, output, format="png")
+                    output.seek(0)
+                    if not saved or import_file(output)[0].n_frames != len(source_frames):
+                        errors.append("GIF frames not saved as png : {}".format(err_msg))
+
+            # Check the transparency of the frames and their common crop
+            if [frame.mode for frame in convert_black_cells_to_transparent_frames(frame_stream)] != ["RGBA"] * len(source_frames):
+                errors.append("Frames not converted to transparent")
+            cropped = crop_to_content_frames(frame_stream)
+            if len(set(frame.size for frame in cropped)) != 1:
+                errors.append("Cropped frames of different sizes")
+    except Exception as ex:
+        errors.append(str(ex))
+
+    # Output/Return
+    return [len(errors) == 0, "; ".join(errors)]
+
+def test_color_keying(input_image, tolerance=5):
+    """
+    Unit Test to check that keying out black matches the black pixel query, and that white and green keys are keyed out
+    with every distance metric
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    try:
+        # Key out black and compare the transparent pixels with the black pixels
+        keyed = key_color(input_image, (0, 0, 0), "channel", tolerance)
+        black_count = query_pixels(get_pixel_array(input_image), "black", tolerance=tolerance, output="count")
+        transparent_count = keyed.getchannel("A").histogram()[0]
+
+        # Key swatches of lime, a slightly darker lime (20 away) and white out of a copy of the image
+        swatch = input_image.convert("RGB").resize((3, 1))
+        for x, color in enumerate([(0, 255, 0), (0, 235, 0), (255, 255, 255)]):
+            swatch.putpixel((x, 0), color)
+        green_alphas = [list(key_color(swatch, "lime", metric, 10, 20).getchannel("A").getdata()) for metric in ("channel", "euclidean", "perceptual")]
+        white_alphas = list(key_color(swatch, "white", "euclidean", 0).getchannel("A").getdata())
+
+        if transparent_count != black_count:
+            err_msg = "{} transparent pixels do not match the {} black pixels".format(transparent_count, black_count)
+        elif green_alphas[0] != [0, 128, 255] or green_alphas[1] != [0, 128, 255]:
+            err_msg = "Green key alphas {} do not ramp over the softness".format(green_alphas[:2])
+        elif green_alphas[2][0] != 0 or green_alphas[2][2] != 255:
+            err_msg = "Perceptual green key alphas {} do not key out green only".format(green_alphas[2])
+        elif white_alphas != [255, 255, 0]:
+            err_msg = "White key alphas {} do not key out white only".format(white_alphas)
+        else:
+            token = True
+    except Exception as ex:
+        err_msg = ex
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_tile_stream(input_image, out_fname="tiles-source", tile_height=7):
+    """
+    Unit Test to check that PNG and compressed TIFF images decoded strip by strip match the images decoded whole, and that
+    tiles with alpha are not written into PPM files
+    """
+    # Initialize Variables
+    token = True
+    err_msg = ""
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            # Initialize Variables
+            source_fname = os.path.join(tmp_dir, out_fname)
+
+            for format, options in (("png", {"optimize" : True}), ("tiff", {"compression" : "tiff_lzw"})):
+                # Save the image, and reassemble it from its tiles
+                input_image.save("{}.{}".format(source_fname, format), **options)
+                tile_stream, opened, err_msg = open_tiles("{}.{}".format(source_fname, format), tile_height, tile_width=16)
+                tiled_image = input_image.convert(tile_stream.mode)
+                for box, tile in tile_stream:
+                    tiled_image.paste(tile, box[:2])
+
+                # Compare the reassembled image with the image decoded whole
+                decoded_image, decoded, err_msg = import_file("{}.{}".format(source_fname, format))
+                if token and tiled_image.tobytes() != decoded_image.tobytes():
+                    token = False
+                    err_msg = "Tiles of the {} image do not match the image decoded whole".format(format)
+
+            # Check that the alpha channel is not dropped silently
+            tile_stream, opened, err_msg = open_tiles("{}.png".format(source_fname))
+            saved, err_msg = save_tiles(tile_stream.map(lambda tile: tile.convert("RGBA"), "RGBA"), source_fname, format="ppm")
+            if token and saved:
+                token = False
+                err_msg = "RGBA tiles saved into a PPM file"
+            elif token:
+                err_msg = ""
+    except Exception as ex:
+        token = False
+        err_msg = ex
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_action_output(img_fname, input_image, pixel_map, width, height):
+    """
+    Unit Test to check that the pixel actions of the CLI/daemon output the legacy mappings, printed in full
+    """
+    # Initialize Variables
+    token = True
+    err_msg = ""
+    img_array = get_image_pixels(input_image, pixel_map, width, height)
+    expected_results = {
+        "image-pixels" : get_image_pixels(input_image, pixel_map, width, height, as_dict=True),
+        "check-black-cells" : get_black_pixels(img_array, as_dict=True),
+        "check-colored-cells" : get_colored_pixels(img_array, as_dict=True),
+    }
+
+    try:
+        for action, expected_result in expected_results.items():
+            # Run the action and compare its printed output with the legacy mapping
+            result, succeeded, err_msg = run_action(img_fname, action)
+            if not succeeded or str(result) != str(expected_result) or "..." in str(result):
+                token = False
+                err_msg = "Output of action '{}' does not match the legacy mapping : {}".format(action, err_msg or str(result)[:80])
+    except Exception as ex:
+        token = False
+        err_msg = ex
+
+    # Output/Return
+    return [token, err_msg]
+
 def test_image_grayscale(input_image, pixel_map, width, height):
     """
     Unit Test for Grayscaling the specified image
@@ -181,20 +759,139 @@ def unittest():
     else:
         print("[X] Error encountered while obtaining image resolution")
 
+    # Unit Test 3.1: Header-only metadata
+    token, err_msg = test_image_metadata(img_fname, im)
+    if token == True:
+        print("[+] Metadata of Image '{}' read from the headers successfully".format(img_fname))
+    else:
+        print("[X] Error encountered while reading the metadata of image '{}' : {}".format(img_fname, err_msg))
+
     # Unit Test 4: Check for black cells
     black_pixel_cells = test_check_black_cells(im, pixel_map, width, height)
-    if len(black_pixel_cells) != 0:
+    if len(black_pixel_cells[0]) != 0:
         print("[+] Black Pixel Cells Found: {}".format(black_pixel_cells))
     else:
         print("[X] Error encountered while checking for the existence of black pixels in image")
 
     # Unit Test 5: Check for non-black cells
     colored_pixel_cells = test_check_colored_cells(im, pixel_map, width, height)
-    if len(colored_pixel_cells) != 0:
+    if len(colored_pixel_cells[0]) != 0:
         print("[+] Colored Pixel Cells Found: {}".format(colored_pixel_cells))
     else:
         print("[X] Error encountered while checking for the existence of non-black pixels in image")
 
+    # Unit Test 5.1: Pixel array and legacy dictionary mapping compatibility
+    token, err_msg = test_pixel_array_compatibility(im, pixel_map, width, height)
+    if token == True:
+        print("[+] Pixel array of Image '{}' matches the legacy dictionary mapping".format(img_fname))
+    else:
+        print("[X] Error encountered while comparing the pixel array of image '{}' : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.2: Pixel queries
+    token, err_msg = test_query_pixels(im, pixel_map, width, height)
+    if token == True:
+        print("[+] Pixel queries of Image '{}' are consistent".format(img_fname))
+    else:
+        print("[X] Error encountered while querying the pixels of image '{}' : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.3: Result cache
+    token, err_msg = test_result_cache(img_fname)
+    if token == True:
+        print("[+] Pixel query of Image '{}' served from the result cache".format(img_fname))
+    else:
+        print("[X] Error encountered while caching the pixel query of image '{}' : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.4: Decoded image cache
+    token, err_msg = test_image_cache(img_fname)
+    if token == True:
+        print("[+] Image '{}' opened through the decoded image cache".format(img_fname))
+    else:
+        print("[X] Error encountered while opening image '{}' through the decoded image cache : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.5: Memory-mapped pixels
+    token, err_msg = test_map_pixels(im)
+    if token == True:
+        print("[+] Memory-mapped pixels of Image '{}' match the decoded pixels".format(img_fname))
+    else:
+        print("[X] Error encountered while memory-mapping the pixels of image '{}' : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.6: Asyncio I/O
+    token, err_msg = test_async_io(img_fname)
+    if token == True:
+        print("[+] Image '{}' opened and saved through the asyncio I/O functions".format(img_fname))
+    else:
+        print("[X] Error encountered while opening/saving image '{}' through the asyncio I/O functions : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.7: Save profiles
+    token, err_msg = test_save_profiles(im)
+    if token == True:
+        print("[+] Image '{}' saved into memory buffers with the save profiles {}".format(img_fname, list(SAVE_PROFILES)))
+    else:
+        print("[X] Error encountered while saving image '{}' with the save profiles : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.8: Reduced-resolution decoding
+    token, err_msg = test_reduced_decode(img_fname)
+    if token == True:
+        print("[+] Image '{}' decoded at reduced resolution successfully".format(img_fname))
+    else:
+        print("[X] Error encountered while decoding image '{}' at reduced resolution : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.9: Fused pipeline
+    token, err_msg = test_pipeline(im)
+    if token == True:
+        print("[+] Pipeline of image '{}' matches its steps run one by one".format(img_fname))
+    else:
+        print("[X] Error encountered while running the pipeline of image '{}' : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.10: Compact pixel selections
+    token, err_msg = test_pixel_selection(im, pixel_map, width, height)
+    if token == True:
+        print("[+] Pixel selections of Image '{}' match the pixel queries".format(img_fname))
+    else:
+        print("[X] Error encountered while selecting the pixels of image '{}' : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.11: Profiling
+    token, err_msg = test_profiling(img_fname)
+    if token == True:
+        print("[+] Profiling of Image '{}' recorded successfully".format(img_fname))
+    else:
+        print("[X] Error encountered while profiling image '{}' : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.12: Image Statistics
+    token, err_msg = test_image_statistics(im)
+    if token == True:
+        print("[+] Statistics of Image '{}' computed successfully".format(img_fname))
+    else:
+        print("[X] Error encountered while computing the statistics of image '{}' : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.13: Frame streams
+    token, err_msg = test_frame_stream(im)
+    if token == True:
+        print("[+] Frames of a multi-page copy of Image '{}' streamed and saved successfully".format(img_fname))
+    else:
+        print("[X] Error encountered while streaming the frames of image '{}' : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.14: Color keying
+    token, err_msg = test_color_keying(im)
+    if token == True:
+        print("[+] Black, white and green keys of Image '{}' keyed out successfully".format(img_fname))
+    else:
+        print("[X] Error encountered while keying out the colors of image '{}' : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.15: Tile streams
+    token, err_msg = test_tile_stream(im)
+    if token == True:
+        print("[+] PNG and TIFF copies of Image '{}' decoded strip by strip successfully".format(img_fname))
+    else:
+        print("[X] Error encountered while decoding the tiles of image '{}' : {}".format(img_fname, err_msg))
+
+    # Unit Test 5.16: Action output
+    token, err_msg = test_action_output(img_fname, im, pixel_map, width, height)
+    if token == True:
+        print("[+] Pixel actions on Image '{}' output the full legacy mappings".format(img_fname))
+    else:
+        print("[X] Error encountered while running the pixel actions on image '{}' : {}".format(img_fname, err_msg))
+
     # Unit Test 6: Image Grayscaling
     token, err_msg = test_image_grayscale(im, pixel_map, width, height)
     if token == True:
@@ -0,0 +1,146 @@
+"""
+ImgLib startup time unit tests
+- Import-time budgets of the package and the CLI, measured in fresh interpreters against the bare interpreter startup
+"""
+import os
+import sys
+import time
+import subprocess
+
+# Budgets (milliseconds over the startup of a bare interpreter) of the import-time tests
+IMPORT_BUDGETS_MS = {
+    "imglib" : 30,
+    # Pillow only, for the header-only 'metadata' action
+    "imglib.core.images.information" : 90,
+}
+CLI_HELP_BUDGET_MS = 100
+
+# Modules the CLI must not import before running an action
+HEAVY_MODULES = ("numpy", "PIL", "imglib.core.images.io", "imglib.core.images.pixels", "imglib.core.images.translation")
+
+# Number of runs of every command (the fastest run is kept)
+RUNS = 7
+
+def get_startup_time(args, runs=RUNS):
+    """
+    Get the fastest wall time (milliseconds) of running the Python interpreter with the arguments in a fresh process
+    """
+    # Initialize Variables
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path != ""))
+    times = []
+
+    for run in range(runs):
+        start = time.perf_counter()
+        subprocess.run([sys.executable] + args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, env=env, check=True)
+        times.append((time.perf_counter() - start) * 1000)
+
+    # Output/Return
+    return min(times)
+
+def test_import_budget(module, budget_ms):
+    """
+    Unit Test to check that importing the module costs less than the budget over a bare interpreter
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    try:
+        baseline_ms = get_startup_time(["-c", "pass"])
+        elapsed_ms = get_startup_time(["-c", "import {}".format(module)])
+        token = elapsed_ms - baseline_ms <= budget_ms
+        err_msg = "{:.1f} ms over the bare interpreter (budget: {} ms)".format(elapsed_ms - baseline_ms, budget_ms)
+    except Exception as ex:
+        err_msg = ex
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_cli_help_budget(budget_ms):
+    """
+    Unit Test to check that 'pyimglib-cli --help' costs less than the budget over a bare interpreter
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    try:
+        baseline_ms = get_startup_time(["-c", "pass"])
+        elapsed_ms = get_startup_time(["-m", "app.main_test", "--help"])
+        token = elapsed_ms - baseline_ms <= budget_ms
+        err_msg = "{:.1f} ms over the bare interpreter (budget: {} ms)".format(elapsed_ms - baseline_ms, budget_ms)
+    except Exception as ex:
+        err_msg = ex
+
+    # Output/Return
+    return [token, err_msg]
+
+def test_cli_lazy_imports():
+    """
+    Unit Test to check that loading the CLI imports none of the heavy modules, and that its option names match the library
+    """
+    # Initialize Variables
+    token = False
+    err_msg = ""
+
+    try:
+        # Check the modules loaded by the CLI in a fresh interpreter
+        env = dict(os.environ, PYTHONPATH=os.pathsep.join(path for path in sys.path if path != ""))
+        output = subprocess.run([sys.executable, "-c", "import sys, app.main_test; print(' '.join(sys.modules))"], capture_output=True, text=True, env=env, check=True).stdout.split()
+        loaded = [module for module in HEAVY_MODULES if module in output]
+
+        # Check the option names kept in step with the library
+        from app.actions import SAVE_PROFILE_NAMES, COLOR_PRESET_NAMES
+        from imglib.core.images.io import SAVE_PROFILES
+        from imglib.core.images.translation import COLOR_PRESETS
+
+        if len(loaded) > 0:
+            err_msg = "Heavy modules imported by the CLI: {}".format(loaded)
+        elif SAVE_PROFILE_NAMES != list(SAVE_PROFILES) or COLOR_PRESET_NAMES != list(COLOR_PRESETS):
+            err_msg = "CLI save profiles/color presets do not match 'io.SAVE_PROFILES'/'translation.COLOR_PRESETS'"
+        else:
+            token = True
+    except Exception as ex:
+        err_msg = ex
+
+    # Output/Return
+    return [token, err_msg]
+
+def unittest():
+    """
+    Run the startup unit tests, returning the number of failed tests
+    """
+    # Initialize Variables
+    failures = 0
+
+    # Unit Test 1: Package import time
+    for module, budget_ms in IMPORT_BUDGETS_MS.items():
+        token, err_msg = test_import_budget(module, budget_ms)
+        if token == True:
+            print("[+] Import of '{}' within budget : {}".format(module, err_msg))
+        else:
+            failures += 1
+            print("[X] Import of '{}' over budget : {}".format(module, err_msg))
+
+    # Unit Test 2: CLI lazy imports
+    token, err_msg = test_cli_lazy_imports()
+    if token == True:
+        print("[+] CLI loads no heavy modules before running an action")
+    else:
+        failures += 1
+        print("[X] Error encountered while checking the CLI imports : {}".format(err_msg))
+
+    # Unit Test 3: CLI help time
+    token, err_msg = test_cli_help_budget(CLI_HELP_BUDGET_MS)
+    if token == True:
+        print("[+] 'pyimglib-cli --help' within budget : {}".format(err_msg))
+    else:
+        failures += 1
+        print("[X] 'pyimglib-cli --help' over budget : {}".format(err_msg))
+
+    # Output/Return
+    return failures
+
+if __name__ == "__main__":
+    # Exit with a failure status if any budget is exceeded, so CI fails
+    sys.exit(1 if unittest() > 0 else 0)